@@ -5,6 +5,8 @@ import os
 import requests
 import unicodedata
 
+from llm_metrics import track_llm_call
+
 load_dotenv()
 
 GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY", "")
@@ -245,12 +247,14 @@ def _llm_json(
         return None
 
     try:
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+        with track_llm_call("activities.llm_json", model) as call:
+            response = openai_client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            call.record_openai_usage(getattr(response, "usage", None))
         content = response.choices[0].message.content or ""
         return json.loads(_extract_json_content(content))
     except Exception:
@@ -0,0 +1,252 @@
+"""Local stand-in for the xAI realtime WebSocket API.
+
+Speaks enough of the protocol for the /realtime/ws relay: it acknowledges
+`session.update` and `conversation.item.create`, turns
+`input_audio_buffer.commit` into a transcribed user item, and answers
+`response.create` with audio deltas, a transcript and `response.done`.
+Every connection's received messages are kept in `connections`, and
+`drop_connections()` closes them abnormally to exercise reconnects.
+
+With `stream_delta_ms` set it behaves like a talking assistant instead: after
+`session.update` each connection gets an audio delta every `stream_delta_ms`
+and, with `tool_call_every`, a function call every that many deltas. Audio is
+stamped (`stamped_pcm`), so the relay latency of each direction can be read
+off the frames: downstream by the client, upstream into `upstream_latency_ms`
+here; `tool_roundtrip_ms` holds call -> function_call_output times.
+
+The server runs on its own event loop in a background thread, so it can be
+used next to FastAPI's TestClient or a load-test client:
+
+    with FakeRealtimeServer() as server:
+        main.XAI_REALTIME_URL = server.url
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import itertools
+import json
+import struct
+import threading
+import time
+from typing import Optional
+
+import websockets
+
+
+STAMP = struct.Struct("<d")
+
+
+def stamped_pcm(size: int) -> bytes:
+    """`size` bytes of PCM silence whose first 8 carry time.perf_counter()."""
+    return STAMP.pack(time.perf_counter()) + bytes(max(0, size - STAMP.size))
+
+
+def pcm_age_ms(pcm: bytes) -> Optional[float]:
+    """Milliseconds since `stamped_pcm` made this chunk (same host only)."""
+    if len(pcm) < STAMP.size:
+        return None
+    return (time.perf_counter() - STAMP.unpack_from(pcm)[0]) * 1000
+
+
+class FakeRealtimeServer:
+    def __init__(
+        self,
+        audio_deltas: int = 5,
+        delta_bytes: int = 4800,
+        transcript: str = "hola",
+        reply: str = "Hola, ¿qué tal está?",
+        host: str = "127.0.0.1",
+        stream_delta_ms: Optional[int] = None,
+        tool_call_every: int = 0,
+    ) -> None:
+        self.audio_deltas = audio_deltas
+        self.delta_bytes = delta_bytes
+        self.delta = base64.b64encode(bytes(delta_bytes)).decode("ascii")
+        self.stream_delta_ms = stream_delta_ms
+        self.tool_call_every = tool_call_every
+        self.upstream_latency_ms: list[float] = []
+        self.tool_roundtrip_ms: list[float] = []
+        self._pending_calls: dict[str, float] = {}
+        self.transcript = transcript
+        self.reply = reply
+        self.host = host
+        self.url = ""
+        self.connections: list[list[str]] = []
+        self._sockets: set = set()
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._run, name="fake-realtime", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self.url
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def __enter__(self) -> "FakeRealtimeServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self) -> None:
+        self._stopped = asyncio.Event()
+        async with websockets.serve(self._handler, self.host, 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            self.url = f"ws://{self.host}:{port}/v1/realtime"
+            self._ready.set()
+            await self._stopped.wait()
+
+    def drop_connections(self, code: int = 1011, reason: str = "simulated drop") -> None:
+        """Close every open connection with an error code (thread-safe)."""
+
+        async def _drop() -> None:
+            await asyncio.gather(*(ws.close(code, reason) for ws in list(self._sockets)))
+
+        asyncio.run_coroutine_threadsafe(_drop(), self._loop).result(5)
+
+    # -- protocol -----------------------------------------------------------
+
+    async def _handler(self, websocket) -> None:
+        if self.stream_delta_ms:
+            await self._handle_streaming(websocket)
+            return
+        received: list[str] = []
+        self.connections.append(received)
+        self._sockets.add(websocket)
+        try:
+            async for message in websocket:
+                received.append(message)
+                await self._answer(websocket, json.loads(message))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._sockets.discard(websocket)
+
+    async def _handle_streaming(self, websocket) -> None:
+        # Messages are not kept: a load test sends far too many.
+        self.connections.append([])
+        self._sockets.add(websocket)
+        stream: Optional[asyncio.Task] = None
+        try:
+            async for message in websocket:
+                event = json.loads(message)
+                event_type = event.get("type")
+                if event_type == "input_audio_buffer.append":
+                    age = pcm_age_ms(base64.b64decode(event.get("audio", "")))
+                    if age is not None:
+                        self.upstream_latency_ms.append(age)
+                elif event_type == "session.update" and stream is None:
+                    await self._send(websocket, {"type": "session.updated", "session": {}})
+                    stream = asyncio.create_task(self._stream(websocket))
+                elif event_type == "conversation.item.create":
+                    sent = self._pending_calls.pop(event.get("item", {}).get("call_id"), None)
+                    if sent is not None:
+                        self.tool_roundtrip_ms.append((time.perf_counter() - sent) * 1000)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if stream is not None:
+                stream.cancel()
+            self._sockets.discard(websocket)
+
+    async def _stream(self, websocket) -> None:
+        period = self.stream_delta_ms / 1000
+        next_at = time.perf_counter()
+        for n in itertools.count(1):
+            delta = base64.b64encode(stamped_pcm(self.delta_bytes)).decode("ascii")
+            try:
+                await self._send(websocket, {"type": "response.output_audio.delta", "delta": delta})
+                if self.tool_call_every and n % self.tool_call_every == 0:
+                    call_id = f"call_{next(self._ids)}"
+                    self._pending_calls[call_id] = time.perf_counter()
+                    await self._send(
+                        websocket,
+                        {
+                            "type": "response.function_call_arguments.done",
+                            "name": "obtener_clima",
+                            "call_id": call_id,
+                            "arguments": "{}",
+                        },
+                    )
+            except websockets.ConnectionClosed:
+                return
+            next_at += period
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    def _item_id(self) -> str:
+        return f"item_{next(self._ids)}"
+
+    async def _send(self, websocket, event: dict) -> None:
+        await websocket.send(json.dumps(event, ensure_ascii=False))
+
+    async def _answer(self, websocket, event: dict) -> None:
+        event_type = event.get("type")
+        if event_type == "session.update":
+            await self._send(websocket, {"type": "session.updated", "session": event.get("session", {})})
+        elif event_type == "conversation.item.create":
+            item = {**event.get("item", {}), "id": self._item_id()}
+            await self._send(websocket, {"type": "conversation.item.created", "item": item})
+        elif event_type == "input_audio_buffer.commit":
+            item_id = self._item_id()
+            await self._send(
+                websocket,
+                {
+                    "type": "conversation.item.created",
+                    "item": {
+                        "id": item_id,
+                        "type": "message",
+                        "role": "user",
+                        "content": [{"type": "input_audio", "transcript": None}],
+                    },
+                },
+            )
+            await self._send(
+                websocket,
+                {
+                    "type": "conversation.item.input_audio_transcription.completed",
+                    "item_id": item_id,
+                    "transcript": self.transcript,
+                },
+            )
+        elif event_type == "response.create":
+            response_id = f"resp_{next(self._ids)}"
+            await self._send(websocket, {"type": "response.created", "response": {"id": response_id}})
+            for _ in range(self.audio_deltas):
+                await self._send(
+                    websocket,
+                    {"type": "response.output_audio.delta", "response_id": response_id, "delta": self.delta},
+                )
+            await self._send(
+                websocket,
+                {
+                    "type": "response.output_item.done",
+                    "item": {
+                        "id": self._item_id(),
+                        "type": "message",
+                        "role": "assistant",
+                        "content": [{"type": "audio", "transcript": self.reply}],
+                    },
+                },
+            )
+            await self._send(websocket, {"type": "response.done", "response": {"id": response_id}})
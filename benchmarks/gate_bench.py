@@ -0,0 +1,103 @@
+"""Precision/recall of the memory extraction gate on a labelled corpus.
+
+Each entry in fixtures/gate_corpus.json is a summarize window labelled
+`personal` when extraction should find something to remember. For every
+threshold the gate is evaluated as a classifier ("extract" = positive) and the
+report includes how many extraction calls it would avoid (windows skipped)
+and how many personal windows it would lose (false negatives).
+
+    python -m benchmarks.gate_bench
+    python -m benchmarks.gate_bench --thresholds 0.5 1 1.5 2 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Optional
+
+import memory_gate
+
+CORPUS_PATH = Path(__file__).parent / "fixtures" / "gate_corpus.json"
+THRESHOLDS = (0.5, 1.0, 1.5, 2.0)
+
+
+def load_corpus(path: Path = CORPUS_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def evaluate_threshold(corpus: list[dict], threshold: float) -> dict:
+    tp = fp = fn = tn = 0
+    missed: list[str] = []
+    false_alarms: list[str] = []
+    for case in corpus:
+        extract = memory_gate.evaluate(case["messages"], threshold=threshold).extract
+        if case["personal"]:
+            if extract:
+                tp += 1
+            else:
+                fn += 1
+                missed.append(case["id"])
+        elif extract:
+            fp += 1
+            false_alarms.append(case["id"])
+        else:
+            tn += 1
+    return {
+        "threshold": threshold,
+        "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+        "true_positives": tp,
+        "false_positives": fp,
+        "false_negatives": fn,
+        "true_negatives": tn,
+        # One extraction (or combined) call per skipped window.
+        "llm_calls_avoided": fn + tn,
+        "llm_calls_avoided_ratio": round((fn + tn) / len(corpus), 3) if corpus else 0.0,
+        "missed": missed,
+        "false_alarms": false_alarms,
+    }
+
+
+def run_benchmark(
+    corpus: Optional[list[dict]] = None, thresholds: tuple[float, ...] = THRESHOLDS
+) -> dict[str, Any]:
+    corpus = corpus if corpus is not None else load_corpus()
+    return {
+        "windows": len(corpus),
+        "personal": sum(1 for case in corpus if case["personal"]),
+        "thresholds": [evaluate_threshold(corpus, t) for t in thresholds],
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(f"{report['windows']} windows, {report['personal']} personal")
+    print(f"{'threshold':>10}{'precision':>11}{'recall':>8}{'avoided':>9}{'missed':>8}")
+    for r in report["thresholds"]:
+        print(
+            f"{r['threshold']:>10}{r['precision']!s:>11}{r['recall']!s:>8}"
+            f"{r['llm_calls_avoided']:>9}{r['false_negatives']:>8}"
+        )
+    for r in report["thresholds"]:
+        if r["missed"] or r["false_alarms"]:
+            print(f"\nthreshold {r['threshold']}: missed {r['missed']}, false alarms {r['false_alarms']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS_PATH)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=list(THRESHOLDS))
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmark(load_corpus(args.corpus), tuple(args.thresholds))
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Offline benchmark of the chat graph plumbing.
+
+Replays the recorded Spanish conversations in fixtures/conversations.json
+through `chatbot.chatbot_async` (graph.ainvoke) and `chatbot.chatbot_stream`
+(graph.astream_events) with:
+
+- `ScriptedChatModel`: a deterministic fake chat model that answers each user
+  message with the tool calls and reply recorded in the corpus;
+- fake tool backends: every ToolSpec handler is swapped for one returning a
+  canned string, so `run_tool`, ToolNode and state injection still run.
+
+No network, no API key. Per turn it reports the time spent outside the LLM and
+the tool backends, split into prompt build (chatbot node minus the model),
+tool dispatch (tools node minus the backend), graph (state merge, routing and,
+in stream mode, event dispatch), plus the tracemalloc peak, as p50/p99.
+
+    python -m benchmarks.graph_bench --repeat 20
+    python -m benchmarks.graph_bench --mode stream --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import chatbot
+import tool_registry
+from llm_metrics import percentile
+
+CORPUS_PATH = Path(__file__).parent / "fixtures" / "conversations.json"
+MODES = ("ainvoke", "stream")
+
+
+def load_corpus(path: Path = CORPUS_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# Fakes
+# ---------------------------------------------------------------------------
+
+class _Clock:
+    """Seconds spent inside the fakes during the current turn."""
+
+    def __init__(self) -> None:
+        self.llm = 0.0
+        self.tools = 0.0
+        self.llm_calls = 0
+        self.tool_calls = 0
+
+    def reset(self) -> None:
+        self.llm = self.tools = 0.0
+        self.llm_calls = self.tool_calls = 0
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Answers from the corpus: tool calls for a new user message, then the reply."""
+
+    script: dict[str, dict]
+    clock: Any
+    latency_s: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages: list[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        user = next(m for m in reversed(messages) if isinstance(m, HumanMessage))
+        turn = self.script[chatbot._extract_text(user.content)]
+        if isinstance(last, HumanMessage) and turn.get("tool_calls"):
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": call["name"], "args": call["args"], "id": f"call_{i}"}
+                    for i, call in enumerate(turn["tool_calls"])
+                ],
+            )
+        return AIMessage(content=turn.get("reply", ""))
+
+    def _timed(self, messages: list[BaseMessage]) -> AIMessage:
+        started = time.perf_counter()
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        response = self._respond(messages)
+        self.clock.llm += time.perf_counter() - started
+        self.clock.llm_calls += 1
+        return response
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._timed(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        started = time.perf_counter()
+        response = self._timed(messages)
+        if response.tool_calls:
+            chunks = [
+                AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                        for i, c in enumerate(response.tool_calls)
+                    ],
+                )
+            ]
+        else:
+            words = response.content.split(" ")
+            chunks = [AIMessageChunk(content=w if i == 0 else " " + w) for i, w in enumerate(words)]
+        # Chunk construction is model work; time spent in the consumer between
+        # yields is graph/streaming overhead and stays outside the clock.
+        self.clock.llm += time.perf_counter() - started - self.latency_s
+        for chunk in chunks:
+            yield ChatGenerationChunk(message=chunk)
+
+
+def _fake_handler(name: str, clock: _Clock, latency_s: float):
+    async def handler(args: dict, ctx: dict) -> str:
+        started = time.perf_counter()
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        result = f"Resultado de {name} para {ctx.get('user_profile', {}).get('name', 'el usuario')}."
+        clock.tools += time.perf_counter() - started
+        clock.tool_calls += 1
+        return result
+
+    return handler
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Wall time of the graph's top-level node runs ("chatbot", "tools")."""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.totals: dict[str, float] = {}
+        self._started: dict[UUID, tuple[str, float]] = {}
+
+    def reset(self) -> None:
+        self.totals.clear()
+        self._started.clear()
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata=None, **kwargs) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs) -> None:
+        started = self._started.pop(run_id, None)
+        if started:
+            node, t0 = started
+            self.totals[node] = self.totals.get(node, 0.0) + time.perf_counter() - t0
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs) -> None:
+        self.on_chain_end(None, run_id=run_id)
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+@dataclasses.dataclass
+class TurnSample:
+    total_ms: float
+    llm_ms: float
+    tool_backend_ms: float
+    prompt_build_ms: float
+    tool_dispatch_ms: float
+    graph_ms: float
+    alloc_peak_kib: Optional[float] = None
+
+    @property
+    def overhead_ms(self) -> float:
+        return self.total_ms - self.llm_ms - self.tool_backend_ms
+
+
+def summarize(samples: list[TurnSample]) -> dict:
+    fields = ["total_ms", "overhead_ms", "prompt_build_ms", "tool_dispatch_ms", "graph_ms", "llm_ms"]
+    if samples and samples[0].alloc_peak_kib is not None:
+        fields.append("alloc_peak_kib")
+    out: dict[str, Any] = {"turns": len(samples)}
+    for name in fields:
+        values = [getattr(s, name) for s in samples]
+        out[name] = {"p50": percentile(values, 0.5, digits=3), "p99": percentile(values, 0.99, digits=3)}
+    return out
+
+
+async def _run_turn(mode: str, conversation: dict, message: str, history: list) -> str:
+    kwargs = {
+        "history": history,
+        "user_profile": conversation.get("user_profile"),
+        "tutor_profile": conversation.get("tutor_profile"),
+        "user_memory": conversation.get("user_memory"),
+        "user_location": conversation.get("user_location"),
+    }
+    if mode == "ainvoke":
+        return await chatbot.chatbot_async(message, **kwargs)
+    return "".join([token async for token in chatbot.chatbot_stream(message, **kwargs)])
+
+
+async def replay(
+    corpus: list[dict],
+    mode: str,
+    clock: _Clock,
+    timer: NodeTimer,
+    allocations: bool = False,
+) -> tuple[list[TurnSample], list[str]]:
+    """Replay every conversation once, client-side history as the app sends it."""
+    samples: list[TurnSample] = []
+    replies: list[str] = []
+    for conversation in corpus:
+        history: list[dict] = []
+        for turn in conversation["turns"]:
+            clock.reset()
+            timer.reset()
+            if allocations:
+                tracemalloc.reset_peak()
+                base, _ = tracemalloc.get_traced_memory()
+            started = time.perf_counter()
+            reply = await _run_turn(mode, conversation, turn["user"], history)
+            total = time.perf_counter() - started
+            peak = None
+            if allocations:
+                _, peak_bytes = tracemalloc.get_traced_memory()
+                peak = (peak_bytes - base) / 1024
+            chatbot_s = timer.totals.get("chatbot", 0.0)
+            tools_s = timer.totals.get("tools", 0.0)
+            samples.append(
+                TurnSample(
+                    total_ms=total * 1000,
+                    llm_ms=clock.llm * 1000,
+                    tool_backend_ms=clock.tools * 1000,
+                    prompt_build_ms=max(0.0, chatbot_s - clock.llm) * 1000,
+                    tool_dispatch_ms=max(0.0, tools_s - clock.tools) * 1000,
+                    graph_ms=max(0.0, total - chatbot_s - tools_s) * 1000,
+                    alloc_peak_kib=peak,
+                )
+            )
+            replies.append(reply)
+            history += [{"role": "user", "content": turn["user"]}, {"role": "assistant", "content": reply}]
+    return samples, replies
+
+
+def run_benchmark(
+    corpus: Optional[list[dict]] = None,
+    modes: tuple[str, ...] = MODES,
+    repeat: int = 10,
+    warmup: int = 1,
+    allocations: bool = False,
+    llm_latency_ms: float = 0.0,
+    tool_latency_ms: float = 0.0,
+) -> dict:
+    """Run the replay per mode and return {mode: summary, "replies": {...}}."""
+    corpus = corpus if corpus is not None else load_corpus()
+    clock = _Clock()
+    timer = NodeTimer()
+    script = {turn["user"]: turn for conversation in corpus for turn in conversation["turns"]}
+    fake_llm = ScriptedChatModel(script=script, clock=clock, latency_s=llm_latency_ms / 1000)
+    fake_specs = {
+        name: dataclasses.replace(spec, handler=_fake_handler(name, clock, tool_latency_ms / 1000))
+        for name, spec in tool_registry.TOOL_SPECS_BY_NAME.items()
+    }
+
+    saved = (chatbot.graph, chatbot.llm_with_tools, tool_registry.TOOL_SPECS_BY_NAME)
+    chatbot.graph = chatbot.graph.with_config(callbacks=[timer])
+    chatbot.llm_with_tools = fake_llm
+    tool_registry.TOOL_SPECS_BY_NAME = fake_specs
+    report: dict[str, Any] = {"replies": {}}
+    try:
+        for mode in modes:
+            for _ in range(warmup):
+                asyncio.run(replay(corpus, mode, clock, timer))
+            samples: list[TurnSample] = []
+            replies: list[str] = []
+            if allocations:
+                tracemalloc.start()
+            try:
+                for _ in range(repeat):
+                    run_samples, replies = asyncio.run(replay(corpus, mode, clock, timer, allocations))
+                    samples += run_samples
+            finally:
+                if allocations:
+                    tracemalloc.stop()
+            report[mode] = summarize(samples)
+            report["replies"][mode] = replies
+    finally:
+        chatbot.graph, chatbot.llm_with_tools, tool_registry.TOOL_SPECS_BY_NAME = saved
+    return report
+
+
+def _print_report(report: dict) -> None:
+    for mode in MODES:
+        if mode not in report:
+            continue
+        summary = report[mode]
+        print(f"\n{mode} ({summary['turns']} turns)")
+        print(f"  {'metric':<18}{'p50':>10}{'p99':>10}")
+        for name, values in summary.items():
+            if name == "turns":
+                continue
+            print(f"  {name:<18}{values['p50']:>10}{values['p99']:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS_PATH)
+    parser.add_argument("--mode", choices=[*MODES, "both"], default="both")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--allocations", action="store_true", help="track per-turn tracemalloc peak (slower)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--tool-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        load_corpus(args.corpus),
+        modes=MODES if args.mode == "both" else (args.mode,),
+        repeat=args.repeat,
+        warmup=args.warmup,
+        allocations=args.allocations,
+        llm_latency_ms=args.llm_latency_ms,
+        tool_latency_ms=args.tool_latency_ms,
+    )
+    report.pop("replies")
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
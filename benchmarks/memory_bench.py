@@ -0,0 +1,203 @@
+"""Benchmark of the memory pipeline modes: staged vs single call.
+
+Runs every case in fixtures/memory_cases.json through `run_memory_pipeline`
+once per mode (MEMORY_PIPELINE_MODE "staged" and "single") with a fake LLM
+that answers each stage ("memory.extract", "memory.merge",
+"memory.narrative", "memory.combined") with the recorded output of the case,
+and fake Supabase load/upsert.
+
+The fake LLM simulates latency as `base + per_token * completion_tokens`, so
+mode differences come from the number of calls and their output sizes. Tokens
+are estimated at 4 characters per token (offline, no tokenizer download).
+Windows rejected by memory_gate make no call in either mode.
+
+    python -m benchmarks.memory_bench
+    python -m benchmarks.memory_bench --base-ms 400 --per-token-ms 8 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.messages import AIMessage
+
+import memory_service
+from llm_metrics import percentile
+
+CASES_PATH = Path(__file__).parent / "fixtures" / "memory_cases.json"
+MODES = ("staged", "single")
+
+
+def load_cases(path: Path = CASES_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeMemoryLLM:
+    """Answers memory-pipeline calls from a case's recorded outputs."""
+
+    def __init__(self, outputs: dict, base_s: float, per_token_s: float) -> None:
+        self.outputs = outputs
+        self.base_s = base_s
+        self.per_token_s = per_token_s
+        self.calls: list[dict] = []
+
+    def with_structured_output(self, schema):
+        return _StructuredFake(self, schema)
+
+    async def _answer(self, node: str, prompt: str) -> Any:
+        output = self.outputs[node]
+        completion = output if isinstance(output, str) else json.dumps(output, ensure_ascii=False)
+        call = {
+            "node": node,
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": estimate_tokens(completion),
+        }
+        self.calls.append(call)
+        await asyncio.sleep(self.base_s + self.per_token_s * call["completion_tokens"])
+        return output
+
+    async def ainvoke(self, prompt: str, config: Optional[dict] = None) -> AIMessage:
+        return AIMessage(content=await self._answer(_node(config), prompt))
+
+
+class _StructuredFake:
+    def __init__(self, llm: FakeMemoryLLM, schema) -> None:
+        self.llm = llm
+        self.schema = schema
+
+    async def ainvoke(self, prompt: str, config: Optional[dict] = None):
+        return self.schema.model_validate(await self.llm._answer(_node(config), prompt))
+
+
+def _node(config: Optional[dict]) -> str:
+    return ((config or {}).get("metadata") or {}).get("llm_node", "")
+
+
+async def run_case(case: dict, mode: str, base_s: float, per_token_s: float) -> dict:
+    """Run one case in one mode; returns calls, tokens, latency and the upserted row."""
+    llm = FakeMemoryLLM(case["llm"], base_s, per_token_s)
+    upserts: list[dict] = []
+
+    async def load(user_id: str) -> dict:
+        return json.loads(json.dumps(case["memory"]))
+
+    async def upsert(row: dict, expected_updated_at=None, row_exists=None) -> None:
+        upserts.append(row)
+
+    saved = (
+        memory_service._get_llm,
+        memory_service._load_memory,
+        memory_service._upsert_memory,
+        memory_service.MEMORY_PIPELINE_MODE,
+    )
+    memory_service._get_llm = lambda: llm
+    memory_service._load_memory = load
+    memory_service._upsert_memory = upsert
+    memory_service.MEMORY_PIPELINE_MODE = mode
+    try:
+        started = time.perf_counter()
+        await memory_service.run_memory_pipeline(f"bench-{case['id']}", case["messages"])
+        elapsed = time.perf_counter() - started
+    finally:
+        (
+            memory_service._get_llm,
+            memory_service._load_memory,
+            memory_service._upsert_memory,
+            memory_service.MEMORY_PIPELINE_MODE,
+        ) = saved
+    return {
+        "llm_calls": len(llm.calls),
+        "nodes": [c["node"] for c in llm.calls],
+        "prompt_tokens": sum(c["prompt_tokens"] for c in llm.calls),
+        "completion_tokens": sum(c["completion_tokens"] for c in llm.calls),
+        "latency_ms": elapsed * 1000,
+        "upsert": upserts[0] if upserts else None,
+    }
+
+
+def run_benchmark(
+    cases: Optional[list[dict]] = None,
+    modes: tuple[str, ...] = MODES,
+    base_ms: float = 300.0,
+    per_token_ms: float = 5.0,
+    repeat: int = 1,
+) -> dict:
+    """{mode: {"cases": {id: result}, "totals": {...}}}."""
+    cases = cases if cases is not None else load_cases()
+    report: dict[str, Any] = {}
+    for mode in modes:
+        per_case: dict[str, dict] = {}
+        latencies: list[float] = []
+        for _ in range(repeat):
+            for case in cases:
+                result = asyncio.run(run_case(case, mode, base_ms / 1000, per_token_ms / 1000))
+                per_case[case["id"]] = result
+                latencies.append(result["latency_ms"])
+        report[mode] = {
+            "cases": per_case,
+            "totals": {
+                "llm_calls": sum(r["llm_calls"] for r in per_case.values()),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in per_case.values()),
+                "completion_tokens": sum(r["completion_tokens"] for r in per_case.values()),
+                "latency_ms_p50": percentile(latencies, 0.5),
+                "latency_ms_p99": percentile(latencies, 0.99),
+            },
+        }
+    return report
+
+
+def _print_report(report: dict) -> None:
+    header = f"{'case':<16}{'mode':<8}{'calls':>6}{'prompt':>8}{'compl':>7}{'ms':>8}"
+    print(header)
+    for mode, data in report.items():
+        for case_id, r in data["cases"].items():
+            print(
+                f"{case_id:<16}{mode:<8}{r['llm_calls']:>6}{r['prompt_tokens']:>8}"
+                f"{r['completion_tokens']:>7}{r['latency_ms']:>8.0f}"
+            )
+    print()
+    for mode, data in report.items():
+        t = data["totals"]
+        print(
+            f"{mode}: {t['llm_calls']} calls, {t['prompt_tokens']} prompt / "
+            f"{t['completion_tokens']} completion tokens, p50 {t['latency_ms_p50']} ms, "
+            f"p99 {t['latency_ms_p99']} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=Path, default=CASES_PATH)
+    parser.add_argument("--base-ms", type=float, default=300.0, help="simulated latency per LLM call")
+    parser.add_argument("--per-token-ms", type=float, default=5.0, help="simulated latency per output token")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        load_cases(args.cases), base_ms=args.base_ms, per_token_ms=args.per_token_ms, repeat=args.repeat
+    )
+    if args.json:
+        for data in report.values():
+            for result in data["cases"].values():
+                result.pop("upsert")
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""CPU cost of the /realtime/ws upstream frame handling, per session-minute.
+
+Builds the upstream traffic of one synthetic session-minute (the assistant
+speaking `--speaking` of the time, audio deltas every `--delta-ms`, transcript
+deltas, response lifecycle events and one function call) and runs it through
+the per-frame work of `xai_to_client` in two ways:
+
+- "json": the previous behaviour, `json.loads` on every frame;
+- "fast": `realtime_relay.parse_tool_event`, which sniffs the event type and
+  only decodes (orjson) the events that can carry a function call.
+
+Both must find the same function calls. Reports CPU ms per session-minute
+(process time), frames per CPU second and how many frames were decoded.
+
+    python -m benchmarks.relay_bench
+    python -m benchmarks.relay_bench --minutes 20 --delta-ms 40 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import time
+from typing import Any, Callable, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from main import _extract_realtime_function_call
+from realtime_relay import parse_tool_event
+
+SAMPLE_RATE = 24000  # PCM16 mono, as configured for xAI sessions
+MODES = ("json", "fast")
+
+
+def session_minute(speaking: float = 0.5, delta_ms: int = 100) -> list[str]:
+    """Upstream messages of one session-minute, in arrival order."""
+    audio = base64.b64encode(os.urandom(SAMPLE_RATE * 2 * delta_ms // 1000)).decode("ascii")
+    deltas = int(60_000 * speaking / delta_ms)
+    frames: list[dict] = [{"type": "session.updated", "session": {"voice": "c630b236"}}]
+    responses = max(1, deltas // 50)
+    for r in range(responses):
+        response_id = f"resp_{r}"
+        frames.append({"type": "input_audio_buffer.speech_started", "event_id": f"ev_{r}_s"})
+        frames.append({"type": "input_audio_buffer.speech_stopped", "event_id": f"ev_{r}_e"})
+        frames.append({"type": "response.created", "response": {"id": response_id}})
+        for i in range(deltas // responses):
+            frames.append(
+                {"type": "response.output_audio.delta", "response_id": response_id, "delta": audio}
+            )
+            if i % 3 == 0:
+                frames.append(
+                    {
+                        "type": "response.output_audio_transcript.delta",
+                        "response_id": response_id,
+                        "delta": "claro, ",
+                    }
+                )
+        frames.append({"type": "response.done", "response": {"id": response_id, "status": "completed"}})
+    call = {"type": "function_call", "name": "obtener_clima", "call_id": "call_1", "arguments": "{}"}
+    frames.append({"type": "conversation.item.created", "item": call})
+    frames.append(
+        {"type": "response.function_call_arguments.done", "name": "obtener_clima", "call_id": "call_1", "arguments": "{}"}
+    )
+    frames.append({"type": "response.output_item.done", "item": call})
+    return [json.dumps(frame) for frame in frames]
+
+
+def _json_path(message: str) -> Optional[dict]:
+    try:
+        payload = json.loads(message)
+    except json.JSONDecodeError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+_PARSERS: dict[str, Callable[[str], Optional[dict]]] = {"json": _json_path, "fast": parse_tool_event}
+
+
+def run_mode(frames: list[str], mode: str, minutes: int) -> dict:
+    parse = _PARSERS[mode]
+    decoded = 0
+    calls: list[str] = []
+    started = time.process_time()
+    for _ in range(minutes):
+        for message in frames:
+            payload = parse(message)
+            if payload is not None:
+                decoded += 1
+                tool_call = _extract_realtime_function_call(payload)
+                if tool_call:
+                    calls.append(tool_call["call_id"])
+    cpu = time.process_time() - started
+    return {
+        "cpu_ms_per_session_minute": round(1000 * cpu / minutes, 3),
+        "frames_per_cpu_second": round(len(frames) * minutes / cpu) if cpu else None,
+        "decoded_per_minute": decoded // minutes,
+        "tool_calls_per_minute": len(calls) // minutes,
+    }
+
+
+def run_benchmark(
+    minutes: int = 10, speaking: float = 0.5, delta_ms: int = 100, modes: tuple[str, ...] = MODES
+) -> dict[str, Any]:
+    frames = session_minute(speaking, delta_ms)
+    report: dict[str, Any] = {
+        "frames_per_minute": len(frames),
+        "bytes_per_minute": sum(len(f) for f in frames),
+    }
+    for mode in modes:
+        report[mode] = run_mode(frames, mode, minutes)
+    if "json" in report and "fast" in report and report["fast"]["cpu_ms_per_session_minute"]:
+        report["speedup"] = round(
+            report["json"]["cpu_ms_per_session_minute"] / report["fast"]["cpu_ms_per_session_minute"], 1
+        )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=10, help="session-minutes replayed per mode")
+    parser.add_argument("--speaking", type=float, default=0.5, help="fraction of the minute with audio")
+    parser.add_argument("--delta-ms", type=int, default=100, help="audio per upstream delta")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.minutes, args.speaking, args.delta_ms)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['frames_per_minute']} frames / {report['bytes_per_minute'] / 1e6:.1f} MB per session-minute")
+    for mode in MODES:
+        r = report[mode]
+        print(
+            f"{mode:<5} {r['cpu_ms_per_session_minute']:>8.2f} CPU ms/session-min  "
+            f"{r['frames_per_cpu_second']:>9} frames/CPU s  {r['decoded_per_minute']:>4} decoded/min"
+        )
+    if "speedup" in report:
+        print(f"speedup: {report['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
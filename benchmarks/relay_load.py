@@ -0,0 +1,439 @@
+"""Load test of the /realtime/ws relay: N browser sessions on one worker.
+
+Starts a local fake xAI realtime server (benchmarks.fake_realtime) that
+streams an audio delta every `--delta-ms` to each session plus a function
+call every `--tool-every` deltas, and one uvicorn worker running main.app in
+a subprocess, pointed at it (auth, context fetches and tool execution are
+stubbed in the worker; the relay itself is the real code). Then, for each
+`--sessions` level, opens that many WebSocket clients that stream microphone
+audio at the same pace for `--duration` seconds and reports:
+
+- relay latency, read from timestamps stamped into the PCM: downstream
+  (fake xAI -> relay -> client), upstream (client -> relay -> fake xAI) and
+  the tool round trip (function call -> function_call_output);
+- session setup time (connect to relay.ready), messages/sec each way;
+- worker CPU (percent of one core, ms per session-second) and RSS (peak, and
+  per session over the idle worker), from /proc;
+- relay counters from the worker's /metrics (queue drops, reconnects).
+
+`sessions_per_worker` extrapolates the CPU cost of the largest level to
+`--cpu-budget` of one core (a uvicorn worker is one event loop);
+`max_sessions_within_slo` is the largest level where every session got ready
+and downstream p95 stayed under `--slo-ms`. Clients and the fake server share
+this process; if `harness_cpu_percent` nears 100 the harness, not the relay,
+is the bottleneck.
+
+    python -m benchmarks.relay_load
+    python -m benchmarks.relay_load --sessions 10 50 100 200 --duration 30 --framing binary --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import httpx
+import websockets
+
+from benchmarks.fake_realtime import FakeRealtimeServer, pcm_age_ms, stamped_pcm
+from llm_metrics import percentile
+
+SESSION_LEVELS = (10, 25, 50)
+SAMPLE_RATE = 24000  # PCM16 mono, as configured for xAI sessions
+METRICS_SECRET = "relay-load"
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 1) if values else None,
+    }
+
+
+def process_usage(pid: int) -> Optional[tuple[float, float]]:
+    """(CPU seconds, RSS MB) of `pid` from /proc, or None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu, rss_pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+# -- worker -------------------------------------------------------------------
+
+
+def serve_worker(port: int, tool_ms: int) -> None:
+    """Run main.app with the relay's external dependencies stubbed out."""
+    import uvicorn
+
+    import main
+
+    async def resolve(token):
+        return f"user-{token}" if token else None
+
+    async def fetch_profile(user_id):
+        return {"name": "Carmen", "city": "Madrid"}
+
+    async def fetch_none(user_id):
+        return None
+
+    async def execute(name, arguments, context):
+        await asyncio.sleep(tool_ms / 1000)
+        return "Soleado, 22 grados"
+
+    main.resolve_user_id_from_jwt = resolve
+    main.fetch_user_profile = fetch_profile
+    main.fetch_tutor_profile = fetch_none
+    main.fetch_user_memory = fetch_none
+    main.execute_tool = execute
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_worker(upstream_url: str, tool_ms: int, workdir: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark"),
+        "XAI_API_KEY": "relay-load",
+        "XAI_REALTIME_URL": upstream_url,
+        "METRICS_SECRET": METRICS_SECRET,
+        "CHAT_CHECKPOINT_URL": f"sqlite:///{workdir}/conversations.sqlite",
+        "MEMORY_JOB_DB": f"{workdir}/memory_jobs.sqlite",
+    }
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.relay_load", "--serve", str(port), "--tool-ms", str(tool_ms)],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if worker.poll() is not None:
+            raise RuntimeError(f"relay worker exited with {worker.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return worker, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    worker.kill()
+    raise RuntimeError("relay worker did not start")
+
+
+# -- clients ------------------------------------------------------------------
+
+
+@dataclass
+class ClientStats:
+    ready_ms: Optional[float] = None
+    received: int = 0
+    sent: int = 0
+    latency_ms: list[float] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+
+async def _send_microphone(ws, binary: bool, delta_ms: int, chunk_bytes: int, stats: ClientStats) -> None:
+    period = delta_ms / 1000
+    next_at = time.perf_counter()
+    while True:
+        pcm = stamped_pcm(chunk_bytes)
+        if binary:
+            await ws.send(pcm)
+        else:
+            audio = base64.b64encode(pcm).decode("ascii")
+            await ws.send(json.dumps({"type": "input_audio_buffer.append", "audio": audio}))
+        stats.sent += 1
+        next_at += period
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+def _downstream_latency(message: Any) -> Optional[float]:
+    if isinstance(message, bytes):
+        return pcm_age_ms(message)
+    if '"response.output_audio.delta"' not in message[:64]:
+        return None
+    return pcm_age_ms(base64.b64decode(json.loads(message)["delta"]))
+
+
+async def run_client(
+    ws_url: str, index: int, duration: float, delta_ms: int, framing: str, stats: ClientStats
+) -> None:
+    chunk_bytes = SAMPLE_RATE * 2 * delta_ms // 1000
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            await ws.send(json.dumps({"token": f"load-{index}", "audio_framing": framing}))
+            ready = json.loads(await ws.recv())
+            if ready.get("type") != "relay.ready":
+                stats.errors.append(str(ready.get("error") or ready.get("type")))
+                return
+            stats.ready_ms = (time.perf_counter() - started) * 1000
+            microphone = asyncio.create_task(
+                _send_microphone(ws, framing == "binary", delta_ms, chunk_bytes, stats)
+            )
+            deadline = time.perf_counter() + duration
+            try:
+                while (remaining := deadline - time.perf_counter()) > 0:
+                    try:
+                        message = await asyncio.wait_for(ws.recv(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    stats.received += 1
+                    latency = _downstream_latency(message)
+                    if latency is not None:
+                        stats.latency_ms.append(latency)
+                    elif isinstance(message, str) and '"relay.' in message[:40]:
+                        stats.errors.append(json.loads(message)["type"])
+            finally:
+                microphone.cancel()
+                await asyncio.gather(microphone, return_exceptions=True)
+    except Exception as e:
+        stats.errors.append(f"{type(e).__name__}: {e}")
+
+
+# -- levels -------------------------------------------------------------------
+
+
+async def _relay_metrics(base_url: str) -> dict:
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(f"{base_url}/metrics", headers={"Authorization": f"Bearer {METRICS_SECRET}"})
+        return resp.json()["realtime"]
+
+
+async def run_level(
+    base_url: str,
+    worker_pid: int,
+    server: FakeRealtimeServer,
+    sessions: int,
+    duration: float,
+    delta_ms: int,
+    framing: str,
+    ramp: float,
+    idle_rss_mb: Optional[float],
+) -> dict:
+    ws_url = base_url.replace("http", "ws", 1) + "/realtime/ws"
+    server.upstream_latency_ms = []
+    server.tool_roundtrip_ms = []
+    relay_before = await _relay_metrics(base_url)
+    usage_before = process_usage(worker_pid)
+    harness_before = time.process_time()
+    started = time.perf_counter()
+    peak_rss = [0.0]
+
+    async def monitor() -> None:
+        while True:
+            usage = process_usage(worker_pid)
+            if usage:
+                peak_rss[0] = max(peak_rss[0], usage[1])
+            await asyncio.sleep(0.25)
+
+    async def client(index: int, stats: ClientStats) -> None:
+        await asyncio.sleep(ramp * index / sessions)
+        await run_client(ws_url, index, duration, delta_ms, framing, stats)
+
+    watcher = asyncio.create_task(monitor())
+    clients = [ClientStats() for _ in range(sessions)]
+    await asyncio.gather(*(client(i, stats) for i, stats in enumerate(clients)))
+    watcher.cancel()
+    wall = time.perf_counter() - started
+    usage_after = process_usage(worker_pid)
+    harness_cpu = time.process_time() - harness_before
+    relay_after = await _relay_metrics(base_url)
+
+    ready = [c for c in clients if c.ready_ms is not None]
+    downstream = [ms for c in clients for ms in c.latency_ms]
+    session_seconds = len(ready) * duration
+    report: dict[str, Any] = {
+        "sessions": sessions,
+        "ready": len(ready),
+        "errors": sorted({e for c in clients for e in c.errors}),
+        "setup_ms": _summary([c.ready_ms for c in ready]),
+        "latency_ms": {
+            "downstream": _summary(downstream),
+            "upstream": _summary(list(server.upstream_latency_ms)),
+            "tool_roundtrip": _summary(list(server.tool_roundtrip_ms)),
+        },
+        "messages_per_second": {
+            "downstream": round(sum(c.received for c in clients) / duration),
+            "upstream": round(sum(c.sent for c in clients) / duration),
+        },
+        "harness_cpu_percent": round(100 * harness_cpu / wall, 1),
+        "relay": {
+            key: relay_after["queues"][direction][stat] - relay_before["queues"][direction][stat]
+            for key, direction, stat in (
+                ("downstream_dropped", "downstream", "dropped"),
+                ("upstream_dropped", "upstream", "dropped"),
+                ("downstream_waits", "downstream", "waits"),
+            )
+        }
+        | {
+            "tool_calls": relay_after["tool_calls"] - relay_before["tool_calls"],
+            "reconnects": relay_after["reconnects"] - relay_before["reconnects"],
+        },
+    }
+    if usage_before and usage_after:
+        cpu = usage_after[0] - usage_before[0]
+        report["worker"] = {
+            "cpu_percent": round(100 * cpu / wall, 1),
+            "cpu_ms_per_session_second": round(1000 * cpu / session_seconds, 2) if session_seconds else None,
+            "rss_mb": round(peak_rss[0], 1),
+            "rss_mb_per_session": round((peak_rss[0] - idle_rss_mb) / sessions, 2) if idle_rss_mb else None,
+        }
+    return report
+
+
+def _capacity(levels: list[dict], cpu_budget: float, slo_ms: float) -> dict:
+    within = [
+        r["sessions"]
+        for r in levels
+        if r["ready"] == r["sessions"]
+        and r["latency_ms"]["downstream"]["p95"] is not None
+        and r["latency_ms"]["downstream"]["p95"] <= slo_ms
+    ]
+    capacity: dict[str, Any] = {"max_sessions_within_slo": max(within) if within else 0}
+    largest = levels[-1].get("worker")
+    if largest and largest["cpu_ms_per_session_second"]:
+        capacity["sessions_per_worker"] = int(cpu_budget * 1000 / largest["cpu_ms_per_session_second"])
+    return capacity
+
+
+async def _run_levels(base_url: str, worker_pid: int, server: FakeRealtimeServer, levels, **options) -> list[dict]:
+    usage = process_usage(worker_pid)
+    idle_rss = usage[1] if usage else None
+    return [
+        await run_level(base_url, worker_pid, server, n, idle_rss_mb=idle_rss, **options) for n in levels
+    ]
+
+
+def run_benchmark(
+    levels: tuple[int, ...] = SESSION_LEVELS,
+    duration: float = 10.0,
+    delta_ms: int = 100,
+    tool_every: int = 50,
+    tool_ms: int = 50,
+    framing: str = "json",
+    ramp: float = 2.0,
+    cpu_budget: float = 0.8,
+    slo_ms: float = 150.0,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as workdir, FakeRealtimeServer(
+        delta_bytes=SAMPLE_RATE * 2 * delta_ms // 1000,
+        stream_delta_ms=delta_ms,
+        tool_call_every=tool_every,
+    ) as server:
+        worker, base_url = start_worker(server.url, tool_ms, workdir)
+        try:
+            results = asyncio.run(
+                _run_levels(
+                    base_url,
+                    worker.pid,
+                    server,
+                    levels,
+                    duration=duration,
+                    delta_ms=delta_ms,
+                    framing=framing,
+                    ramp=ramp,
+                )
+            )
+        finally:
+            worker.terminate()
+            worker.wait(10)
+    return {
+        "config": {
+            "duration_s": duration,
+            "delta_ms": delta_ms,
+            "tool_every": tool_every,
+            "tool_ms": tool_ms,
+            "framing": framing,
+        },
+        "levels": results,
+        **_capacity(results, cpu_budget, slo_ms),
+    }
+
+
+def _print_report(report: dict) -> None:
+    config = report["config"]
+    print(
+        f"{config['duration_s']:.0f}s per level, audio every {config['delta_ms']} ms each way, "
+        f"{config['framing']} framing"
+    )
+    print(
+        f"{'sessions':>8}{'ready':>7}{'down p50':>10}{'down p95':>10}{'up p95':>8}{'tool p95':>10}"
+        f"{'msg/s':>8}{'cpu %':>7}{'ms/sess-s':>10}{'rss MB':>8}{'MB/sess':>8}{'harness %':>10}"
+    )
+    for r in report["levels"]:
+        worker = r.get("worker", {})
+        latency = r["latency_ms"]
+        print(
+            f"{r['sessions']:>8}{r['ready']:>7}{latency['downstream']['p50']!s:>10}"
+            f"{latency['downstream']['p95']!s:>10}{latency['upstream']['p95']!s:>8}"
+            f"{latency['tool_roundtrip']['p95']!s:>10}"
+            f"{sum(r['messages_per_second'].values()):>8}{worker.get('cpu_percent')!s:>7}"
+            f"{worker.get('cpu_ms_per_session_second')!s:>10}{worker.get('rss_mb')!s:>8}"
+            f"{worker.get('rss_mb_per_session')!s:>8}{r['harness_cpu_percent']:>10}"
+        )
+        if r["errors"]:
+            print(f"  errors: {r['errors']}")
+    print(f"\nmax sessions within SLO: {report['max_sessions_within_slo']}")
+    if "sessions_per_worker" in report:
+        print(f"estimated sessions per worker (CPU budget): {report['sessions_per_worker']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(SESSION_LEVELS))
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each level streams")
+    parser.add_argument("--delta-ms", type=int, default=100, help="audio per delta, both directions")
+    parser.add_argument("--tool-every", type=int, default=50, help="deltas between function calls (0: none)")
+    parser.add_argument("--tool-ms", type=int, default=50, help="stubbed tool execution time")
+    parser.add_argument("--framing", choices=("json", "binary"), default="json")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds to open all sessions of a level")
+    parser.add_argument("--cpu-budget", type=float, default=0.8, help="fraction of a core a worker may use")
+    parser.add_argument("--slo-ms", type=float, default=150.0, help="downstream p95 latency target")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_worker(args.serve, args.tool_ms)
+        return
+    report = run_benchmark(
+        tuple(args.sessions),
+        args.duration,
+        args.delta_ms,
+        args.tool_every,
+        args.tool_ms,
+        args.framing,
+        args.ramp,
+        args.cpu_budget,
+        args.slo_ms,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
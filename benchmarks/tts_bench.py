@@ -0,0 +1,215 @@
+"""Time-to-first-audio and bytes of /voice/tts (JSON) vs /voice/tts/stream.
+
+The OpenAI TTS API is replaced by `FakeSpeechClient`, which produces opus
+sized like the real thing (`--kbps`) after `--first-chunk-ms` and then one
+`--chunk-bytes` chunk every `--chunk-ms`, either all at once
+(`speech.create`) or chunk by chunk (`with_streaming_response`). Both
+endpoints are driven through main.app's ASGI interface and timed on the
+response body messages:
+
+- json: audio can only start once the whole JSON body is in and decoded, so
+  time-to-first-audio is the time to the last body byte;
+- stream: time-to-first-audio is the time to the first body chunk.
+
+Bytes are the response body on the wire (base64 + JSON vs raw opus). The
+TTS cache is disabled while it runs, so every request pays for synthesis.
+
+    python -m benchmarks.tts_bench
+    python -m benchmarks.tts_bench --first-chunk-ms 300 --chunk-ms 50 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import voice
+from tts_cache import TTSCache
+
+TEXTS = {
+    "corta": "Recordatorio creado.",
+    "media": "Buenos días, Carmen. Hoy hace sol en Madrid y la temperatura máxima será de veintidós grados.",
+    "larga": (
+        "Claro que sí. Le cuento las noticias más importantes de hoy. El Gobierno ha aprobado una subida "
+        "de las pensiones para el próximo año. En Madrid, el Ayuntamiento abre tres nuevos centros de "
+        "mayores con talleres de memoria, baile y pintura. Y en deportes, el Real Madrid ganó anoche por "
+        "dos goles a uno. ¿Quiere que le lea alguna de estas noticias con más detalle?"
+    ),
+}
+ENDPOINTS = {"json": "/voice/tts", "stream": "/voice/tts/stream"}
+CHARS_PER_SECOND = 14  # speech rate at speed 0.9
+
+
+class _SpeechAudio:
+    def __init__(self, client: "FakeSpeechClient", size: int) -> None:
+        self._client = client
+        self._size = size
+
+    async def iter_bytes(self, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+        async for chunk in self._client.chunks(self._size):
+            yield chunk
+
+
+class _StreamingSpeech:
+    def __init__(self, client: "FakeSpeechClient") -> None:
+        self._client = client
+
+    @asynccontextmanager
+    async def create(self, *, input: str, **kwargs: Any):
+        self._client.calls += 1
+        yield _SpeechAudio(self._client, self._client.audio_size(input))
+
+
+class _Speech:
+    def __init__(self, client: "FakeSpeechClient") -> None:
+        self._client = client
+        self.with_streaming_response = _StreamingSpeech(client)
+
+    async def create(self, *, input: str, **kwargs: Any):
+        self._client.calls += 1
+        content = b"".join([chunk async for chunk in self._client.chunks(self._client.audio_size(input))])
+        return type("SpeechResponse", (), {"content": content})()
+
+
+class FakeSpeechClient:
+    """Stands in for AsyncOpenAI: `client.audio.speech...` with opus-sized output."""
+
+    def __init__(
+        self, first_chunk_ms: float = 250, chunk_ms: float = 40, chunk_bytes: int = 4096, kbps: int = 32
+    ) -> None:
+        self.first_chunk_ms = first_chunk_ms
+        self.chunk_ms = chunk_ms
+        self.chunk_bytes = chunk_bytes
+        self.kbps = kbps
+        self.calls = 0
+        self.audio = type("Audio", (), {})()
+        self.audio.speech = _Speech(self)
+
+    def audio_size(self, text: str) -> int:
+        return max(1, int(len(text) / CHARS_PER_SECOND * self.kbps * 1000 / 8))
+
+    async def chunks(self, size: int) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.first_chunk_ms / 1000)
+        for offset in range(0, size, self.chunk_bytes):
+            if offset:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            yield os.urandom(min(self.chunk_bytes, size - offset))
+
+
+async def post_asgi(app: Any, path: str, payload: dict) -> dict:
+    """POST `payload` to an ASGI app; timings (ms) of the response body."""
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+    requests = [{"type": "http.request", "body": body, "more_body": False}]
+    disconnected = asyncio.Event()
+    result: dict[str, Any] = {"status": None, "first_byte_ms": None, "bytes": 0, "chunks": 0}
+    started = time.perf_counter()
+
+    async def receive() -> dict:
+        if requests:
+            return requests.pop(0)
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if result["first_byte_ms"] is None:
+                result["first_byte_ms"] = (time.perf_counter() - started) * 1000
+            result["bytes"] += len(message["body"])
+            result["chunks"] += 1
+
+    await app(scope, receive, send)
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    disconnected.set()
+    return result
+
+
+async def _measure(app: Any, mode: str, text: str, runs: int) -> dict:
+    samples = [await post_asgi(app, ENDPOINTS[mode], {"text": text}) for _ in range(runs)]
+    if any(s["status"] != 200 for s in samples):
+        raise RuntimeError(f"{ENDPOINTS[mode]} answered {[s['status'] for s in samples]}")
+    ttfa = [s["total_ms"] if mode == "json" else s["first_byte_ms"] for s in samples]
+    return {
+        "ttfa_ms": round(statistics.median(ttfa), 1),
+        "total_ms": round(statistics.median(s["total_ms"] for s in samples), 1),
+        "bytes": samples[0]["bytes"],
+        "chunks": samples[0]["chunks"],
+    }
+
+
+async def _run(app: Any, texts: dict[str, str], runs: int) -> dict:
+    report: dict[str, Any] = {}
+    for name, text in texts.items():
+        modes = {mode: await _measure(app, mode, text, runs) for mode in ENDPOINTS}
+        modes["ttfa_speedup"] = round(modes["json"]["ttfa_ms"] / modes["stream"]["ttfa_ms"], 1)
+        modes["bytes_saved"] = round(1 - modes["stream"]["bytes"] / modes["json"]["bytes"], 3)
+        report[name] = modes
+    return report
+
+
+def run_benchmark(
+    texts: Optional[dict[str, str]] = None, runs: int = 3, client: Optional[FakeSpeechClient] = None
+) -> dict[str, Any]:
+    import main
+
+    users = itertools.count()
+    main.app.dependency_overrides[main.get_current_user_id] = lambda: f"tts-bench-{next(users)}"
+    real_client, voice.client = voice.client, client or FakeSpeechClient()
+    real_cache, voice.tts_cache = voice.tts_cache, TTSCache(memory_bytes=0, directory="")
+    try:
+        return asyncio.run(_run(main.app, texts or TEXTS, runs))
+    finally:
+        voice.client = real_client
+        voice.tts_cache = real_cache
+        main.app.dependency_overrides.pop(main.get_current_user_id, None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-chunk-ms", type=float, default=250)
+    parser.add_argument("--chunk-ms", type=float, default=40)
+    parser.add_argument("--chunk-bytes", type=int, default=4096)
+    parser.add_argument("--kbps", type=int, default=32)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    client = FakeSpeechClient(args.first_chunk_ms, args.chunk_ms, args.chunk_bytes, args.kbps)
+    report = run_benchmark(runs=args.runs, client=client)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'text':<7}{'mode':<8}{'ttfa ms':>9}{'total ms':>10}{'bytes':>9}{'chunks':>8}")
+    for name, modes in report.items():
+        for mode in ENDPOINTS:
+            r = modes[mode]
+            print(f"{name:<7}{mode:<8}{r['ttfa_ms']:>9}{r['total_ms']:>10}{r['bytes']:>9}{r['chunks']:>8}")
+        print(f"{'':<7}ttfa {modes['ttfa_speedup']}x faster, {modes['bytes_saved']:.0%} fewer bytes")
+
+
+if __name__ == "__main__":
+    main()
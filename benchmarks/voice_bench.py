@@ -0,0 +1,172 @@
+"""Time-to-first-audio of the sequential vs sentence-pipelined voice pipeline.
+
+`voice.process_voice_message` transcribes, waits for the whole chatbot
+answer, then synthesizes all of it; `voice.process_voice_message_stream`
+starts TTS for each sentence while the answer is still streaming. Both run
+here against simulated services with realistic latencies:
+
+- STT: `--stt-ms`;
+- chatbot: first token after `--first-token-ms`, then `--tokens-per-second`
+  tokens of ~4 characters (the same text feeds chatbot_async and
+  chatbot_stream);
+- TTS: `--tts-ms` plus `--tts-ms-per-char` per character.
+
+For each answer and TTS concurrency it reports time to first audio, time to
+the last audio and the number of TTS calls.
+
+    python -m benchmarks.voice_bench
+    python -m benchmarks.voice_bench --concurrency 1 2 4 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import voice
+from benchmarks.tts_bench import TEXTS
+
+CONCURRENCY = (1, 3)
+
+
+class SimulatedServices:
+    def __init__(
+        self,
+        answer: str,
+        stt_ms: float = 300,
+        first_token_ms: float = 400,
+        tokens_per_second: float = 40,
+        tts_ms: float = 300,
+        tts_ms_per_char: float = 4,
+    ) -> None:
+        self.answer = answer
+        self.stt_ms = stt_ms
+        self.first_token_ms = first_token_ms
+        self.tokens_per_second = tokens_per_second
+        self.tts_ms = tts_ms
+        self.tts_ms_per_char = tts_ms_per_char
+        self.tts_calls = 0
+
+    async def transcribe_audio(self, audio_file: bytes) -> str:
+        await asyncio.sleep(self.stt_ms / 1000)
+        return "¿Qué noticias hay hoy?"
+
+    async def chatbot_stream(self, message: str, **kwargs: Any) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for start in range(0, len(self.answer), 4):
+            if start:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield self.answer[start:start + 4]
+
+    async def chatbot_async(self, message: str, **kwargs: Any) -> str:
+        return "".join([token async for token in self.chatbot_stream(message)])
+
+    async def text_to_speech(self, text: str, voice: str = "nova") -> bytes:
+        self.tts_calls += 1
+        await asyncio.sleep((self.tts_ms + self.tts_ms_per_char * len(text)) / 1000)
+        return text.encode("utf-8")
+
+    def install(self) -> dict:
+        """Patch the voice module; returns the originals for `restore`."""
+        names = ("transcribe_audio", "chatbot_stream", "chatbot_async", "text_to_speech")
+        originals = {name: getattr(voice, name) for name in names}
+        for name in names:
+            setattr(voice, name, getattr(self, name))
+        return originals
+
+    @staticmethod
+    def restore(originals: dict) -> None:
+        for name, value in originals.items():
+            setattr(voice, name, value)
+
+
+async def run_sequential(services: SimulatedServices) -> dict:
+    started = time.perf_counter()
+    audio, _, _ = await voice.process_voice_message(b"audio")
+    elapsed = (time.perf_counter() - started) * 1000
+    return {"ttfa_ms": round(elapsed), "last_audio_ms": round(elapsed), "audio_bytes": len(audio)}
+
+
+async def run_pipelined(services: SimulatedServices, concurrency: int) -> dict:
+    started = time.perf_counter()
+    first = last = None
+    audio_bytes = sentences = 0
+    voice.VOICE_TTS_CONCURRENCY, previous = concurrency, voice.VOICE_TTS_CONCURRENCY
+    try:
+        async for event in voice.process_voice_message_stream(b"audio"):
+            if event["type"] == "audio":
+                last = (time.perf_counter() - started) * 1000
+                first = first if first is not None else last
+                audio_bytes += len(event["audio"])
+                sentences += 1
+    finally:
+        voice.VOICE_TTS_CONCURRENCY = previous
+    return {
+        "ttfa_ms": round(first),
+        "last_audio_ms": round(last),
+        "audio_bytes": audio_bytes,
+        "sentences": sentences,
+    }
+
+
+def run_benchmark(
+    answers: Optional[dict[str, str]] = None, concurrency: tuple[int, ...] = CONCURRENCY, **latencies: float
+) -> dict[str, Any]:
+    answers = answers or {name: TEXTS[name] for name in ("media", "larga")}
+    report: dict[str, Any] = {}
+    for name, answer in answers.items():
+        services = SimulatedServices(answer, **latencies)
+        originals = services.install()
+        try:
+            result: dict[str, Any] = {"chars": len(answer), "sequential": asyncio.run(run_sequential(services))}
+            for n in concurrency:
+                services.tts_calls = 0
+                result[f"pipelined_{n}"] = asyncio.run(run_pipelined(services, n))
+                result[f"pipelined_{n}"]["tts_calls"] = services.tts_calls
+        finally:
+            SimulatedServices.restore(originals)
+        best = min(result[f"pipelined_{n}"]["ttfa_ms"] for n in concurrency)
+        result["ttfa_speedup"] = round(result["sequential"]["ttfa_ms"] / best, 1)
+        report[name] = result
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(CONCURRENCY))
+    parser.add_argument("--stt-ms", type=float, default=300)
+    parser.add_argument("--first-token-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--tts-ms", type=float, default=300)
+    parser.add_argument("--tts-ms-per-char", type=float, default=4)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        concurrency=tuple(args.concurrency),
+        stt_ms=args.stt_ms,
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        tts_ms=args.tts_ms,
+        tts_ms_per_char=args.tts_ms_per_char,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'answer':<8}{'mode':<13}{'ttfa ms':>9}{'last ms':>9}{'tts calls':>11}")
+    for name, result in report.items():
+        modes = [key for key in result if key == "sequential" or key.startswith("pipelined_")]
+        for mode in modes:
+            r = result[mode]
+            print(f"{name:<8}{mode:<13}{r['ttfa_ms']:>9}{r['last_audio_ms']:>9}{r.get('tts_calls', 1)!s:>11}")
+        print(f"{'':<8}first audio {result['ttfa_speedup']}x sooner ({result['chars']} chars)")
+
+
+if __name__ == "__main__":
+    main()
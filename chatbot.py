@@ -1,25 +1,25 @@
 import asyncio
-import concurrent.futures
-from contextvars import ContextVar
 from typing import Annotated
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
-from langchain_core.messages import AIMessage, ToolMessage
-from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timezone
+from datetime import datetime
 from zoneinfo import ZoneInfo
-from news import get_spain_news, format_news_for_chat
-from weather import get_weather, format_weather_for_chat
-from spanish_newspapers import get_combined_news, format_newspapers_for_chat, get_newspapers_by_source
-from alert import send_sms_alert
-from spotify import get_user_data_sync as spotify_get_user_data_sync, format_spotify_for_chat
-from reminders import create_reminder, list_active_reminders
-from activities import search_activities
+from llm_hedging import build_chat_model
+from conversation_store import compaction_removals, prune_checkpoints, thread_id_for
+from memory_index import select_facts
+from tool_registry import TOOL_SPECS, build_langchain_tools, context_from_state, run_tool_sync
+from tool_prefetch import (
+    PREFETCH_ENABLED,
+    PREFETCH_WAIT_SECONDS,
+    args_key,
+    predict_tool_calls,
+    tool_prefetcher,
+)
 
 load_dotenv()
 
@@ -33,284 +33,14 @@ MONTHS_ES = {
     9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
 }
 
-# Define tools for the chatbot to use
-@tool
-def obtener_noticias(limite: int = 5) -> str:
-    """
-    Obtiene las noticias más recientes de España. Usa esta herramienta cuando el usuario
-    pregunte sobre noticias, actualidad, lo que está pasando hoy, o información reciente.
-
-    Args:
-        limite: Número de noticias a obtener (por defecto 5, máximo recomendado 10)
-
-    Returns:
-        Noticias formateadas listas para presentar al usuario
-    """
-    limite = min(limite, 10)  # Limitar para no abrumar al usuario
-    news_data = get_spain_news(limit=limite)
-    return format_news_for_chat(news_data)
-
-@tool
-def obtener_clima(ciudad: str = "") -> str:
-    """
-    Obtiene el clima actual de una ciudad en España. Usa esta herramienta cuando el usuario
-    pregunte sobre el tiempo, el clima, la temperatura o las condiciones meteorológicas.
-
-    Args:
-        ciudad: Nombre de la ciudad. El usuario puede especificar cualquier ciudad de España
-                como Madrid, Barcelona, Valencia, Sevilla, etc. Si no se especifica, se usa
-                la ubicación GPS del usuario y, si no está disponible, la ciudad del perfil.
-
-    Returns:
-        Información del clima formateada lista para presentar al usuario
-    """
-    location = _user_location_var.get() or {}
-    latitude = location.get("latitude")
-    longitude = location.get("longitude")
-    if ciudad:
-        weather_data = get_weather(city=ciudad, country_code="ES")
-    elif latitude is not None and longitude is not None:
-        weather_data = get_weather(
-            city="",
-            country_code="ES",
-            latitude=latitude,
-            longitude=longitude,
-        )
-    else:
-        weather_data = get_weather(
-            city=_user_profile_var.get().get("city") or "Madrid",
-            country_code="ES",
-        )
-    return format_weather_for_chat(weather_data)
-
-@tool
-def obtener_noticias_periodicos(limite_por_fuente: int = 3, periodico: str = "todos") -> str:
-    """
-    Obtiene las noticias más recientes directamente de periódicos españoles.
-    Fuentes disponibles: El País, El Mundo, La Razón, El Periódico, La Vanguardia,
-    ABC, El Español, El Confidencial, eldiario.es, Mundo Deportivo.
-    Usa esta herramienta cuando el usuario pida noticias de periódicos españoles.
-
-    Args:
-        limite_por_fuente: Número de noticias a obtener de cada periódico (por defecto 3)
-        periodico: Qué periódico consultar: "todos" (defecto), "elpais", "elmundo",
-                   "larazon", "elperiodico", "lavanguardia", "abc", "elespanol",
-                   "elconfidencial", "eldiario", "mundodeportivo"
-
-    Returns:
-        Noticias actualizadas formateadas con la fecha de hoy, listas para presentar al usuario
-    """
-    if periodico.lower() == "todos":
-        news_data = get_combined_news(limit_per_source=limite_por_fuente)
-    else:
-        news_data = get_newspapers_by_source(source=periodico, limit=limite_por_fuente * 2)
-
-    return format_newspapers_for_chat(news_data)
-
-@tool
-def enviar_alerta_sms(descripcion: str = "") -> str:
-    """
-    Envía una alerta de emergencia por SMS al cuidador o familiar del usuario.
-    Usa esta herramienta cuando el usuario pida enviar una alerta o aviso,
-    o cuando detectes una situación que requiera notificar a alguien
-    (emergencia, caída, dolor, síntoma preocupante, etc.).
-
-    El nombre del usuario y su ubicación GPS se incluyen automáticamente.
-    El destinatario es el tutor/cuidador registrado en el perfil.
-
-    Args:
-        descripcion: Resumen breve (1-2 frases) de lo que ha ocurrido o por qué
-                     se envía la alerta. Por ejemplo: "Me he caído en el baño"
-                     o "Siento dolor en el pecho". Omitir si el usuario no ha
-                     dado contexto.
-
-    Returns:
-        Confirmación del envío o mensaje de error
-    """
-    tutor_number = (_tutor_profile_var.get() or {}).get("number") or None
-    if not tutor_number:
-        return (
-            "No se pudo enviar la alerta: no hay número de tutor configurado "
-            "en el perfil. Pide al usuario que añada el contacto del cuidador."
-        )
-
-    user_name = (_user_profile_var.get() or {}).get("name") or None
-    location = _user_location_var.get() or {}
-    latitude = location.get("latitude")
-    longitude = location.get("longitude")
-    description = (descripcion or "").strip()[:280] or None
-
-    result = send_sms_alert(
-        to=tutor_number,
-        user_name=user_name,
-        latitude=latitude,
-        longitude=longitude,
-        description=description,
-    )
-    if result.get("error"):
-        return f"No se pudo enviar la alerta: {result['error']}"
-    alert_info = result["alert"]
-    return f"Alerta enviada correctamente por SMS al número {alert_info['destino']}."
-
-@tool
-def obtener_musica_spotify(tipo: str = "all") -> str:
-    """
-    Obtiene la música de Spotify que escucha el usuario para conocer sus gustos.
-    Usa esta herramienta cuando el usuario pregunte por su música, sus canciones,
-    sus artistas favoritos, lo que ha escuchado últimamente, o cuando necesites
-    contexto sobre sus gustos musicales para personalizar sugerencias (actividades,
-    regalos, conversación, etc.).
-
-    Requiere que el usuario haya vinculado su cuenta de Spotify desde
-    "Cuentas conectadas". Si no la ha vinculado, la herramienta lo indicará.
-
-    Args:
-        tipo: Qué datos obtener. Opciones:
-              - "all" (defecto): artistas top + canciones recientes + playlists
-              - "top": solo artistas y canciones más escuchados
-              - "recent": solo lo que ha escuchado recientemente
-              - "playlists": solo las playlists del usuario
-
-    Returns:
-        Resumen en texto de la actividad musical del usuario.
-    """
-    user_id = _user_id_var.get()
-    if not user_id:
-        return "No se pudo identificar al usuario para consultar Spotify."
-    kind = tipo if tipo in ("all", "top", "recent", "playlists") else "all"
-    data = spotify_get_user_data_sync(user_id, kind=kind)
-    return format_spotify_for_chat(data)
-
-@tool
-def crear_recordatorio(mensaje: str, fecha_hora: str, recurrencia: str = "") -> str:
-    """
-    Crea un recordatorio para el usuario. IMPORTANTE: SIEMPRE pide confirmación
-    al usuario antes de llamar a esta herramienta.
-
-    Args:
-        mensaje: Texto del recordatorio (ej: "Tomar la pastilla")
-        fecha_hora: Fecha y hora en formato ISO 8601 (ej: "2026-03-29T15:00:00")
-        recurrencia: Expresión cron para recordatorios recurrentes (opcional).
-                     Ejemplos: "0 */2 * * *" (cada 2 horas), "0 9 * * *" (cada día a las 9),
-                     "0 9,14,21 * * *" (a las 9, 14 y 21h). Dejar vacío para un solo recordatorio.
-
-    Returns:
-        Confirmación del recordatorio creado
-    """
-    recurrence = recurrencia if recurrencia else None
-    user_id = _user_id_var.get()
-
-    if not user_id:
-        return "Error: no se pudo identificar al usuario. Inténtalo de nuevo."
-
-    # Normalize naive datetimes: if no timezone offset, assume Europe/Madrid
-    try:
-        dt = datetime.fromisoformat(fecha_hora)
-        if dt.tzinfo is None:
-            madrid_tz = ZoneInfo("Europe/Madrid")
-            fecha_hora = dt.replace(tzinfo=madrid_tz).astimezone(timezone.utc).isoformat()
-    except ValueError:
-        pass
-
-    try:
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            result = pool.submit(
-                asyncio.run,
-                create_reminder(
-                    user_id=user_id,
-                    message=mensaje,
-                    remind_at=fecha_hora,
-                    recurrence=recurrence,
-                )
-            ).result()
-        if recurrence:
-            return f"Recordatorio recurrente creado: '{mensaje}'. Próximo aviso: {fecha_hora}."
-        else:
-            return f"Recordatorio creado: '{mensaje}' para el {fecha_hora}."
-    except Exception as e:
-        return f"Error al crear el recordatorio: {str(e)}"
-
-
-@tool
-def listar_recordatorios() -> str:
-    """
-    Lista los recordatorios activos del usuario. Usa esta herramienta cuando
-    el usuario pregunte qué recordatorios tiene, o quiera ver sus recordatorios.
-
-    Returns:
-        Lista formateada de recordatorios activos
-    """
-    user_id = _user_id_var.get()
-
-    if not user_id:
-        return "Error: no se pudo identificar al usuario."
-
-    try:
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            reminders_list = pool.submit(
-                asyncio.run, list_active_reminders(user_id=user_id)
-            ).result()
-
-        if not reminders_list:
-            return "No tienes recordatorios activos en este momento."
-
-        lines = ["Tus recordatorios activos:\n"]
-        for r in reminders_list:
-            status_emoji = "🔁" if r.get("recurrence") else "⏰"
-            lines.append(
-                f"{status_emoji} {r['message']} — {r['remind_at']}"
-                + (f" (recurrente)" if r.get("recurrence") else "")
-            )
-        return "\n".join(lines)
-    except Exception as e:
-        return f"Error al obtener los recordatorios: {str(e)}"
-
-
-@tool
-def buscar_actividades(radio_km: int = 10) -> str:
-    """
-    Busca actividades y lugares de interes para personas mayores cerca
-    de la ubicacion del usuario. Usa esta herramienta cuando el usuario
-    pregunte por actividades, cosas que hacer, planes, talleres, centros
-    de mayores o lugares para visitar en su zona.
-
-    Args:
-        radio_km: Radio de busqueda en kilometros (por defecto 10)
-
-    Returns:
-        Lista de actividades personalizadas cerca del usuario
-    """
-    location = _user_location_var.get()
-    return search_activities(
-        user_profile=_user_profile_var.get(),
-        tutor_factors=_tutor_factors_var.get(),
-        latitude=location.get("latitude"),
-        longitude=location.get("longitude"),
-        radius_km=radio_km,
-    )
-
-
-# Define the list of tools
-tools = [
-    obtener_noticias,
-    obtener_clima,
-    obtener_noticias_periodicos,
-    enviar_alerta_sms,
-    obtener_musica_spotify,
-    crear_recordatorio,
-    listar_recordatorios,
-    buscar_actividades,
-]
-
-# Per-task context (isolated across concurrent requests). Plain module globals
-# would leak data between users hitting the chatbot at the same time, so we use
-# contextvars — each FastAPI request runs in its own asyncio task, and each task
-# has its own copy of these values.
-_user_id_var: ContextVar[str] = ContextVar("menteviva_user_id", default="")
-_user_location_var: ContextVar[dict] = ContextVar("menteviva_user_location", default={})
-_user_profile_var: ContextVar[dict] = ContextVar("menteviva_user_profile", default={})
-_tutor_profile_var: ContextVar[dict] = ContextVar("menteviva_tutor_profile", default={})
-_tutor_factors_var: ContextVar[str] = ContextVar("menteviva_tutor_factors", default="")
+# Tools are defined once in tool_registry and shared with the Realtime voice
+# path. Each tool reads the user context from the graph state injected by
+# ToolNode, so concurrent requests never see each other's data.
+tools = build_langchain_tools()
+_tool_arg_defaults = {
+    spec.name: {k: v["default"] for k, v in spec.parameters["properties"].items() if "default" in v}
+    for spec in TOOL_SPECS
+}
 
 class State(TypedDict):
     messages: Annotated[list, add_messages]
@@ -319,8 +49,11 @@ class State(TypedDict):
     user_memory: dict
     user_location: dict
 
-def build_system_message(user_profile: dict = None, tutor_profile: dict = None, user_memory: dict = None):
-    """Build the system message, optionally personalized with user and tutor profiles."""
+def build_system_message(user_profile: dict = None, tutor_profile: dict = None, user_memory: dict = None, query: str = ""):
+    """Build the system message, optionally personalized with user and tutor profiles.
+
+    `query` (the current user message) selects which memory facts are included.
+    """
     madrid_tz = ZoneInfo("Europe/Madrid")
     today = datetime.now(madrid_tz)
     today_str = f"{DAYS_ES[today.weekday()]}, {today.day} de {MONTHS_ES[today.month]} de {today.year}"
@@ -457,7 +190,7 @@ def build_system_message(user_profile: dict = None, tutor_profile: dict = None,
 
     memory_section = ""
     if user_memory:
-        facts = user_memory.get("facts", [])
+        facts = select_facts(user_memory.get("facts", []), query)
         narrative = user_memory.get("narrative", "")
         if facts or narrative:
             facts_text = "\n".join(f"- {f['text']}" for f in facts) if facts else ""
@@ -475,26 +208,117 @@ def build_system_message(user_profile: dict = None, tutor_profile: dict = None,
     return {"role": "system", "content": content}
 
 # Module-level LLM instance (avoid recreating on every request)
-llm = ChatOpenAI(model="gpt-5.4-mini", api_key=os.getenv("OPENAI_API_KEY"))
+llm = build_chat_model("gpt-5.4-mini", "chatbot", api_key=os.getenv("OPENAI_API_KEY"))
 llm_with_tools = llm.bind_tools(tools)
 
-def chatbot_node(state: State):
+def _tool_args_key(name: str, args: dict) -> str:
+    return args_key(args, _tool_arg_defaults.get(name))
+
+
+def _turn_key(messages: list) -> str:
+    """Id of the user message that started the current turn."""
+    for message in reversed(messages or []):
+        if isinstance(message, HumanMessage):
+            return message.id or ""
+    return ""
+
+
+def _last_user_text(messages) -> str:
+    for message in reversed(messages or []):
+        if isinstance(message, HumanMessage):
+            return _extract_text(message.content)
+    return ""
+
+
+def _start_tool_prefetch(state: State, last_message) -> str:
+    """Kick off likely tool calls for a new user message. Returns the turn key, or ""."""
+    if not PREFETCH_ENABLED or not isinstance(last_message, HumanMessage) or not last_message.id:
+        return ""
     profile = state.get("user_profile") or {}
-    tutor = state.get("tutor_profile") or {}
-    _user_id_var.set(profile.get("id", "") or "")
-    _user_location_var.set(state.get("user_location") or {})
-    _user_profile_var.set(profile)
-    _tutor_profile_var.set(tutor)
-    _tutor_factors_var.set(tutor.get("factors", "") or "")
+    location = state.get("user_location") or {}
+    predicted = predict_tool_calls(_extract_text(last_message.content), location, profile)
+    if not predicted:
+        return ""
+    tool_context = context_from_state(state)
+    tool_prefetcher.start(
+        last_message.id,
+        [(name, args, _tool_args_key(name, args)) for name, args in predicted],
+        lambda name, args: run_tool_sync(name, args, tool_context),
+    )
+    return last_message.id
+
+
+def _take_prefetch(request):
+    call = request.tool_call
+    turn_key = _turn_key((request.state or {}).get("messages"))
+    if not turn_key:
+        return None
+    return tool_prefetcher.take(turn_key, call["name"], _tool_args_key(call["name"], call["args"]))
 
+
+def _prefetched_message(request, content) -> ToolMessage:
+    return ToolMessage(
+        content=content,
+        name=request.tool_call["name"],
+        tool_call_id=request.tool_call["id"],
+    )
+
+
+def _use_prefetched_result(request, execute):
+    """ToolNode wrapper: answer from a speculative prefetch when one matches."""
+    future = _take_prefetch(request)
+    if future is not None:
+        try:
+            content = future.result(timeout=PREFETCH_WAIT_SECONDS)
+        except Exception:
+            content = None
+        if content is not None and not tool_prefetcher.is_error(content):
+            tool_prefetcher.record_hit()
+            return _prefetched_message(request, content)
+        tool_prefetcher.record_failure()
+    return execute(request)
+
+
+async def _ause_prefetched_result(request, execute):
+    future = _take_prefetch(request)
+    if future is not None:
+        try:
+            content = await asyncio.wait_for(asyncio.wrap_future(future), PREFETCH_WAIT_SECONDS)
+        except Exception:
+            content = None
+        if content is not None and not tool_prefetcher.is_error(content):
+            tool_prefetcher.record_hit()
+            return _prefetched_message(request, content)
+        tool_prefetcher.record_failure()
+    return await execute(request)
+
+
+def chatbot_node(state: State):
     last_message = state["messages"][-1] if state.get("messages") else None
     if isinstance(last_message, ToolMessage) and last_message.name == "buscar_actividades":
         return {"messages": [AIMessage(content=last_message.content)]}
 
-    system_message = build_system_message(state.get("user_profile"), state.get("tutor_profile"), state.get("user_memory"))
+    system_message = build_system_message(
+        state.get("user_profile"),
+        state.get("tutor_profile"),
+        state.get("user_memory"),
+        query=_last_user_text(state.get("messages")),
+    )
     messages = [system_message] + state["messages"]
 
-    return {"messages": [llm_with_tools.invoke(messages)]}
+    turn_key = _start_tool_prefetch(state, last_message)
+    try:
+        response = llm_with_tools.invoke(messages)
+    except Exception:
+        if turn_key:
+            tool_prefetcher.settle(turn_key, [])
+        raise
+    if turn_key:
+        tool_prefetcher.settle(
+            turn_key,
+            [(c["name"], _tool_args_key(c["name"], c["args"])) for c in response.tool_calls],
+        )
+    return {"messages": [response]}
 
 def should_continue(state: State):
     """Decide if we should continue to tools or end"""
@@ -508,7 +332,11 @@ def should_continue(state: State):
     return "continue"
 
 # Create the tool node that will execute the tools
-tool_node = ToolNode(tools)
+tool_node = ToolNode(
+    tools,
+    wrap_tool_call=_use_prefetched_result,
+    awrap_tool_call=_ause_prefetched_result,
+)
 
 # Create the graph
 workflow = StateGraph(State)
@@ -536,6 +364,15 @@ workflow.add_edge("tools", "chatbot")
 # Compile the graph
 graph = workflow.compile()
 
+# Same graph with a checkpointer, for server-side conversations keyed by
+# conversation id. Compiled at startup once the checkpointer is open.
+conversation_graph = None
+
+
+def enable_conversations(checkpointer) -> None:
+    global conversation_graph
+    conversation_graph = workflow.compile(checkpointer=checkpointer) if checkpointer else None
+
 def _extract_text(content) -> str:
     """Extract plain text from LLM response content (handles list-of-parts format)."""
     if isinstance(content, str):
@@ -568,21 +405,73 @@ def chatbot(message: str, history: list = None, user_profile: dict = None, tutor
     return _extract_text(result["messages"][-1].content)
 
 
-async def chatbot_async(message: str, history: list = None, user_profile: dict = None, tutor_profile: dict = None, user_memory: dict = None, user_location: dict = None):
+def _conversation_config(user_profile: dict, conversation_id: str) -> dict:
+    user_id = (user_profile or {}).get("id", "")
+    return {"configurable": {"thread_id": thread_id_for(user_id, conversation_id)}}
+
+
+async def _prepare_run(message: str, history: list, user_profile: dict, tutor_profile: dict, user_memory: dict, user_location: dict, conversation_id: str):
+    """Pick the graph and input state for a turn.
+
+    Without a conversation id the client-sent history is replayed as before.
+    With one, only the new message is sent: the stored history is loaded by the
+    checkpointer (thread scoped to the user's id) and compacted if too long.
+    """
+    input_state = {"user_profile": user_profile, "tutor_profile": tutor_profile, "user_memory": user_memory, "user_location": user_location or {}}
+    if not conversation_id:
+        input_state["messages"] = _build_messages(message, history)
+        return graph, input_state
+    if conversation_graph is None:
+        raise RuntimeError("Las conversaciones en servidor no están habilitadas.")
+    config = _conversation_config(user_profile, conversation_id)
+    snapshot = await conversation_graph.aget_state(config)
+    stored = (snapshot.values or {}).get("messages", [])
+    input_state["messages"] = compaction_removals(stored) + [("user", message)]
+    return conversation_graph.with_config(config), input_state
+
+
+async def get_conversation(user_id: str, conversation_id: str) -> list:
+    """User/assistant text turns stored for a conversation."""
+    if conversation_graph is None:
+        raise RuntimeError("Las conversaciones en servidor no están habilitadas.")
+    snapshot = await conversation_graph.aget_state(_conversation_config({"id": user_id}, conversation_id))
+    turns = []
+    for msg in (snapshot.values or {}).get("messages", []):
+        text = _extract_text(msg.content)
+        if msg.type == "human":
+            turns.append({"role": "user", "content": text})
+        elif msg.type == "ai" and text:
+            turns.append({"role": "assistant", "content": text})
+    return turns
+
+
+async def delete_conversation(user_id: str, conversation_id: str) -> None:
+    if conversation_graph is None:
+        raise RuntimeError("Las conversaciones en servidor no están habilitadas.")
+    await conversation_graph.checkpointer.adelete_thread(thread_id_for(user_id, conversation_id))
+
+
+async def _prune_after_turn(user_profile: dict, conversation_id: str) -> None:
+    """Keep only the latest checkpoints of the thread a turn was just stored in."""
+    if conversation_id and conversation_graph is not None:
+        thread_id = _conversation_config(user_profile, conversation_id)["configurable"]["thread_id"]
+        await prune_checkpoints(conversation_graph.checkpointer, thread_id)
+
+
+async def chatbot_async(message: str, history: list = None, user_profile: dict = None, tutor_profile: dict = None, user_memory: dict = None, user_location: dict = None, conversation_id: str = None):
     """Async version of chatbot using ainvoke (non-blocking)."""
-    messages = _build_messages(message, history)
-    input_state = {"messages": messages, "user_profile": user_profile, "tutor_profile": tutor_profile, "user_memory": user_memory, "user_location": user_location or {}}
-    result = await graph.ainvoke(input_state)
+    runner, input_state = await _prepare_run(message, history, user_profile, tutor_profile, user_memory, user_location, conversation_id)
+    result = await runner.ainvoke(input_state)
+    await _prune_after_turn(user_profile, conversation_id)
     return _extract_text(result["messages"][-1].content)
 
 
-async def chatbot_stream(message: str, history: list = None, user_profile: dict = None, tutor_profile: dict = None, user_memory: dict = None, user_location: dict = None):
+async def chatbot_stream(message: str, history: list = None, user_profile: dict = None, tutor_profile: dict = None, user_memory: dict = None, user_location: dict = None, conversation_id: str = None):
     """Async generator that yields tokens as they are produced by the LLM."""
-    messages = _build_messages(message, history)
-    input_state = {"messages": messages, "user_profile": user_profile, "tutor_profile": tutor_profile, "user_memory": user_memory, "user_location": user_location or {}}
+    runner, input_state = await _prepare_run(message, history, user_profile, tutor_profile, user_memory, user_location, conversation_id)
     streamed_text = False
 
-    async for event in graph.astream_events(input_state, version="v2"):
+    async for event in runner.astream_events(input_state, version="v2"):
         kind = event.get("event")
         # Stream tokens from the chatbot node's LLM calls
         if kind == "on_chat_model_stream":
@@ -601,3 +490,4 @@ async def chatbot_stream(message: str, history: list = None, user_profile: dict
                 if text:
                     streamed_text = True
                     yield text
+    await _prune_after_turn(user_profile, conversation_id)
@@ -0,0 +1,175 @@
+"""Server-side conversation state for the chat graph (LangGraph checkpointer).
+
+With a conversation id the client only sends the new message; the history
+lives in a checkpointer keyed by thread id. Thread ids are always namespaced by
+the authenticated user id, so a client cannot read or extend someone else's
+conversation by guessing its id.
+
+Backend chosen by CHAT_CHECKPOINT_URL:
+- `sqlite:///path/to/file.sqlite` (default `sqlite:///conversations.sqlite`)
+- `postgresql://...` (needs langgraph-checkpoint-postgres)
+- `memory` (in-process, for tests/dev)
+- empty string disables server-side conversations.
+
+LangGraph keeps a checkpoint for every step of every turn, so after each
+turn the thread is pruned to its latest CONVERSATION_KEEP_CHECKPOINTS
+checkpoints (and their pending writes), and threads idle for longer than
+CONVERSATION_TTL_SECONDS are deleted every CONVERSATION_SWEEP_SECONDS. Both
+are done in SQL for the SQLite backend; Postgres prunes with the saver's own
+`aprune` when it has one, and the in-memory saver is left alone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+logger = logging.getLogger(__name__)
+
+CHAT_CHECKPOINT_URL = os.getenv("CHAT_CHECKPOINT_URL", "sqlite:///conversations.sqlite")
+# Stored messages kept per conversation; older turns are compacted away.
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "40"))
+# Checkpoints kept per thread after each turn (a plain turn writes three).
+CONVERSATION_KEEP_CHECKPOINTS = int(os.getenv("CONVERSATION_KEEP_CHECKPOINTS", "3"))
+# Conversations with no turn for this long are deleted.
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", str(30 * 24 * 3600)))
+CONVERSATION_SWEEP_SECONDS = float(os.getenv("CONVERSATION_SWEEP_SECONDS", "3600"))
+
+
+def thread_id_for(user_id: str, conversation_id: str) -> str:
+    if not user_id:
+        raise ValueError("conversation state requires an authenticated user id")
+    return f"{user_id}:{conversation_id}"
+
+
+@asynccontextmanager
+async def open_checkpointer(url: Optional[str] = None) -> AsyncIterator[Optional[BaseCheckpointSaver]]:
+    """Yield the configured async checkpointer, or None when disabled/unavailable."""
+    url = CHAT_CHECKPOINT_URL if url is None else url
+    if not url:
+        yield None
+        return
+
+    if url == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        yield InMemorySaver()
+        return
+
+    if url.startswith(("postgres://", "postgresql://")):
+        try:
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        except ImportError:
+            logger.warning("langgraph-checkpoint-postgres not installed; conversations disabled")
+            yield None
+            return
+        async with AsyncPostgresSaver.from_conn_string(url) as saver:
+            await saver.setup()
+            yield saver
+        return
+
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        logger.warning("langgraph-checkpoint-sqlite not installed; conversations disabled")
+        yield None
+        return
+    path = url.removeprefix("sqlite:///") or "conversations.sqlite"
+    async with AsyncSqliteSaver.from_conn_string(path) as saver:
+        sweeper = asyncio.create_task(_expire_periodically(saver))
+        try:
+            yield saver
+        finally:
+            sweeper.cancel()
+            # Let a sweep in progress stop before the connection closes.
+            await asyncio.gather(sweeper, return_exceptions=True)
+
+
+def _is_sqlite(checkpointer: BaseCheckpointSaver) -> bool:
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        return False
+    return isinstance(checkpointer, AsyncSqliteSaver)
+
+
+def _checkpoint_id_at(timestamp: float) -> str:
+    """Smallest checkpoint id (LangGraph's time-ordered uuid6) minted at `timestamp`."""
+    from langgraph.checkpoint.base.id import UUID
+
+    ticks = int(timestamp * 10_000_000) + 0x01B21DD213814000
+    return str(UUID(int=((ticks >> 12) & 0xFFFFFFFFFFFF) << 80 | (ticks & 0x0FFF) << 64, version=6))
+
+
+async def prune_checkpoints(
+    checkpointer: BaseCheckpointSaver, thread_id: str, keep: int = CONVERSATION_KEEP_CHECKPOINTS
+) -> None:
+    """Drop all but the latest `keep` checkpoints of a thread, with their writes."""
+    if _is_sqlite(checkpointer):
+        async with checkpointer.lock, checkpointer.conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT ?)",
+                (thread_id, thread_id, max(keep, 1)),
+            )
+            await cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)",
+                (thread_id, thread_id),
+            )
+            await checkpointer.conn.commit()
+        return
+    if type(checkpointer).__module__.startswith("langgraph.checkpoint.postgres"):
+        try:
+            await checkpointer.aprune([thread_id], strategy="keep_latest")
+        except NotImplementedError:
+            pass
+
+
+async def expire_conversations(
+    checkpointer: BaseCheckpointSaver, ttl_seconds: float = CONVERSATION_TTL_SECONDS
+) -> int:
+    """Delete the SQLite threads whose latest checkpoint is older than the TTL."""
+    if not _is_sqlite(checkpointer):
+        return 0
+    await checkpointer.setup()
+    async with checkpointer.lock, checkpointer.conn.execute(
+        "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(checkpoint_id) < ?",
+        (_checkpoint_id_at(time.time() - ttl_seconds),),
+    ) as cur:
+        idle = [row[0] for row in await cur.fetchall()]
+    for thread_id in idle:
+        await checkpointer.adelete_thread(thread_id)
+    return len(idle)
+
+
+async def _expire_periodically(checkpointer: BaseCheckpointSaver) -> None:
+    while True:
+        try:
+            expired = await expire_conversations(checkpointer)
+            if expired:
+                logger.info("Deleted %d idle conversations", expired)
+        except Exception:
+            logger.exception("Conversation TTL sweep failed")
+        await asyncio.sleep(CONVERSATION_SWEEP_SECONDS)
+
+
+def compaction_removals(stored: list[BaseMessage], max_messages: int = CONVERSATION_MAX_MESSAGES) -> list[RemoveMessage]:
+    """RemoveMessage markers trimming `stored` to at most `max_messages`.
+
+    The cut always lands on a user message so an assistant tool call is never
+    separated from its tool results.
+    """
+    if len(stored) <= max_messages:
+        return []
+    cut = len(stored) - max_messages
+    while cut < len(stored) and not isinstance(stored[cut], HumanMessage):
+        cut += 1
+    return [RemoveMessage(id=m.id) for m in stored[:cut] if m.id]
@@ -0,0 +1,293 @@
+"""Optional hedged requests for chat models, to cut the slow tail of LLM latency.
+
+`HedgedChatModel` wraps a primary and a backup chat model (the backup can be
+the same model). Every call streams from the primary; if no first chunk has
+arrived after a threshold derived from the p95 of recent time-to-first-token
+samples, a second request goes to the backup, whichever produces a first chunk
+first wins and the other is cancelled. A primary that fails before its first
+chunk falls back to the backup straight away.
+
+Hedges cost an extra request, so they are capped by a budget: at most
+`budget_ratio` hedges per primary call (plus a small burst). Enabled with
+LLM_HEDGING=1; `build_chat_model` returns a plain ChatOpenAI otherwise.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+from pydantic import ConfigDict
+
+from llm_metrics import LLMMetricsCallback
+
+logger = logging.getLogger(__name__)
+
+HEDGING_ENABLED = os.getenv("LLM_HEDGING") == "1"
+HEDGE_FALLBACK_MODEL = os.getenv("LLM_HEDGE_FALLBACK_MODEL", "")
+HEDGE_BUDGET_RATIO = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+
+
+@dataclass
+class HedgePolicy:
+    """When to fire a hedge and how many we can afford."""
+
+    quantile: float = 0.95
+    min_samples: int = 20
+    default_threshold_s: float = 3.0
+    min_threshold_s: float = 0.5
+    max_threshold_s: float = 10.0
+    budget_ratio: float = HEDGE_BUDGET_RATIO
+    burst: int = 2
+    calls: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    fallbacks: int = 0
+    _ttft_s: deque = field(default_factory=lambda: deque(maxlen=256), init=False, repr=False)
+    _lock: Any = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def threshold(self) -> float:
+        with self._lock:
+            samples = sorted(self._ttft_s)
+        if len(samples) < self.min_samples:
+            return self.default_threshold_s
+        value = samples[min(len(samples) - 1, int(self.quantile * len(samples)))]
+        return min(self.max_threshold_s, max(self.min_threshold_s, value))
+
+    def start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def observe_ttft(self, seconds: float) -> None:
+        with self._lock:
+            self._ttft_s.append(seconds)
+
+    def try_acquire_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges >= self.budget_ratio * self.calls + self.burst:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "fallbacks": self.fallbacks,
+            }
+
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model that races a backup request when the primary is slow to start."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    primary: BaseChatModel
+    backup: BaseChatModel
+    policy: HedgePolicy
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model": getattr(self.primary, "model_name", "")}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # Let the primary format tools/tool_choice; both models receive the same kwargs.
+        return self.bind(**self.primary.bind_tools(tools, **kwargs).kwargs)
+
+    async def _hedged_chunks(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]],
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """Raw chunks of the winning request (inner models run without callbacks)."""
+        self.policy.start_call()
+        attempts: dict[asyncio.Future, tuple[AsyncIterator, str]] = {}
+
+        def launch(model: BaseChatModel, label: str) -> None:
+            iterator = model._astream(messages, stop=stop, **kwargs).__aiter__()
+            attempts[asyncio.ensure_future(iterator.__anext__())] = (iterator, label)
+
+        started = time.perf_counter()
+        launch(self.primary, "primary")
+        threshold = self.policy.threshold()
+        hedge_checked = fell_back = False
+        winner: Optional[tuple[AsyncIterator, str, Optional[ChatGenerationChunk]]] = None
+        last_error: Optional[BaseException] = None
+
+        try:
+            while winner is None and attempts:
+                done, _ = await asyncio.wait(
+                    attempts.keys(),
+                    timeout=None if hedge_checked else threshold,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedge_checked = True
+                    if self.policy.try_acquire_hedge():
+                        logger.info("LLM hedge fired after %.2fs", threshold)
+                        launch(self.backup, "backup")
+                    continue
+                # If both finished in the same tick, prefer the primary.
+                for task in sorted(done, key=lambda t: attempts[t][1] != "primary"):
+                    iterator, label = attempts.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = (iterator, label, None if error else task.result())
+                        break
+                    last_error = error
+                    logger.warning("LLM %s request failed before first token: %s", label, error)
+                    if label == "primary" and not attempts and not fell_back:
+                        fell_back = True
+                        self.policy.record_fallback()
+                        launch(self.backup, "backup")
+        finally:
+            for task, (iterator, _) in attempts.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                try:
+                    await iterator.aclose()
+                except Exception:
+                    pass
+
+        if winner is None:
+            raise last_error or RuntimeError("LLM hedged request produced no response")
+
+        iterator, label, first = winner
+        if label == "primary":
+            # The primary's real TTFT, hedged or not, so slow samples can raise the threshold.
+            self.policy.observe_ttft(time.perf_counter() - started)
+        elif label == "backup" and not fell_back:
+            self.policy.record_hedge_win()
+        if first is None:
+            return
+        try:
+            yield first
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            await iterator.aclose()
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self._hedged_chunks(messages, stop, **kwargs):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # Sync callers (chatbot_node) get the async race on a helper thread with its
+        # own loop. If the consumer stops early the pump task is cancelled, which
+        # closes the underlying HTTP streams instead of reading them to the end.
+        items: queue.Queue = queue.Queue()
+        done = object()
+
+        async def pump() -> None:
+            try:
+                async for chunk in self._hedged_chunks(messages, stop, **kwargs):
+                    items.put(chunk)
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                items.put(e)
+            finally:
+                items.put(done)
+
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(pump())
+
+        def run() -> None:
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        threading.Thread(target=run, daemon=True).start()
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                if run_manager:
+                    run_manager.on_llm_new_token(item.text, chunk=item)
+                yield item
+        finally:
+            if not task.done():
+                try:
+                    loop.call_soon_threadsafe(task.cancel)
+                except RuntimeError:  # the loop finished and closed meanwhile
+                    pass
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+
+def build_chat_model(model: str, node: str, **kwargs: Any) -> BaseChatModel:
+    """ChatOpenAI with metrics, wrapped in a HedgedChatModel when LLM_HEDGING=1."""
+    callbacks = [LLMMetricsCallback(node)]
+    if not HEDGING_ENABLED:
+        return ChatOpenAI(model=model, callbacks=callbacks, **kwargs)
+    return HedgedChatModel(
+        primary=ChatOpenAI(model=model, stream_usage=True, **kwargs),
+        backup=ChatOpenAI(model=HEDGE_FALLBACK_MODEL or model, stream_usage=True, **kwargs),
+        policy=HedgePolicy(),
+        callbacks=callbacks,
+    )
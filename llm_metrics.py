@@ -0,0 +1,280 @@
+"""In-process LLM call metrics: latency, time-to-first-token and token usage.
+
+Every model call is recorded under a (route, node) pair — the route is the HTTP
+path that triggered it (set per request by the middleware in main.py), the node
+is the logical call site ("chatbot", "memory.extract", "voice.tts"...). Two
+ways to record:
+
+- `LLMMetricsCallback`: a LangChain callback handler attached to ChatOpenAI
+  instances. The node name comes from the `llm_node` run metadata, falling back
+  to the LangGraph node or the handler's default.
+- `track_llm_call`: a context manager for raw OpenAI SDK calls (activities,
+  Whisper, TTS).
+
+`snapshot()` backs GET /metrics.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Latency samples kept per (route, node) for percentiles.
+MAX_SAMPLES = 512
+
+llm_route: ContextVar[str] = ContextVar("menteviva_llm_route", default="")
+
+
+@dataclass
+class _Aggregate:
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    models: Counter = field(default_factory=Counter)
+    wall_ms: deque = field(default_factory=lambda: deque(maxlen=MAX_SAMPLES))
+    ttft_ms: deque = field(default_factory=lambda: deque(maxlen=MAX_SAMPLES))
+
+
+def percentile(samples, q: float, digits: int = 1) -> Optional[float]:
+    """Nearest-rank `q` quantile of `samples`, rounded; None when empty."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return round(ordered[index], digits)
+
+
+class LLMMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._aggregates: dict[tuple[str, str], _Aggregate] = {}
+
+    def record(
+        self,
+        node: str,
+        model: str = "",
+        wall_ms: float = 0.0,
+        ttft_ms: Optional[float] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        error: bool = False,
+        route: Optional[str] = None,
+    ) -> None:
+        key = (route if route is not None else llm_route.get(), node)
+        with self._lock:
+            agg = self._aggregates.get(key)
+            if agg is None:
+                agg = self._aggregates[key] = _Aggregate()
+            agg.calls += 1
+            if error:
+                agg.errors += 1
+            agg.prompt_tokens += prompt_tokens
+            agg.completion_tokens += completion_tokens
+            agg.cached_tokens += cached_tokens
+            if model:
+                agg.models[model] += 1
+            agg.wall_ms.append(wall_ms)
+            if ttft_ms is not None:
+                agg.ttft_ms.append(ttft_ms)
+
+    def ttft_percentile(self, node: str, q: float) -> Optional[float]:
+        """TTFT percentile for `node` across all routes, or None without samples."""
+        with self._lock:
+            samples = [
+                s for (_, n), agg in self._aggregates.items() if n == node for s in agg.ttft_ms
+            ]
+        return percentile(samples, q)
+
+    def snapshot(self) -> dict:
+        """{route: {node: stats}} with token totals and p50/p95 latencies in ms."""
+        out: dict[str, dict[str, dict]] = {}
+        with self._lock:
+            for (route, node), agg in self._aggregates.items():
+                out.setdefault(route or "-", {})[node] = {
+                    "calls": agg.calls,
+                    "errors": agg.errors,
+                    "prompt_tokens": agg.prompt_tokens,
+                    "completion_tokens": agg.completion_tokens,
+                    "cached_tokens": agg.cached_tokens,
+                    "models": dict(agg.models),
+                    "wall_ms_p50": percentile(agg.wall_ms, 0.5),
+                    "wall_ms_p95": percentile(agg.wall_ms, 0.95),
+                    "ttft_ms_p50": percentile(agg.ttft_ms, 0.5),
+                    "ttft_ms_p95": percentile(agg.ttft_ms, 0.95),
+                }
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._aggregates.clear()
+
+
+llm_metrics = LLMMetrics()
+
+
+# ---------------------------------------------------------------------------
+# Raw SDK calls
+# ---------------------------------------------------------------------------
+
+class LLMCall:
+    """One in-flight call recorded by `track_llm_call`."""
+
+    def __init__(self, node: str, model: str = "") -> None:
+        self.node = node
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def mark_first_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def record_openai_usage(self, usage: Any) -> None:
+        """Copy token counts from an OpenAI SDK `usage` object (missing fields are 0)."""
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+        self.completion_tokens = (
+            getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+        )
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+
+@contextmanager
+def track_llm_call(node: str, model: str = "") -> Iterator[LLMCall]:
+    """Time a raw SDK call. Without `mark_first_token()`, TTFT equals wall time."""
+    call = LLMCall(node, model)
+    error = False
+    try:
+        yield call
+    except BaseException:
+        error = True
+        raise
+    finally:
+        ended = time.perf_counter()
+        first = call.first_token_at or ended
+        llm_metrics.record(
+            node,
+            model=call.model,
+            wall_ms=(ended - call.started) * 1000,
+            ttft_ms=(first - call.started) * 1000,
+            prompt_tokens=call.prompt_tokens,
+            completion_tokens=call.completion_tokens,
+            cached_tokens=call.cached_tokens,
+            error=error,
+        )
+
+
+# ---------------------------------------------------------------------------
+# LangChain models
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _Run:
+    node: str
+    model: str
+    route: str
+    started: float
+    first_token_at: Optional[float] = None
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Records every chat-model run it sees into `llm_metrics`."""
+
+    # Run in the caller's thread/context so timings and the route contextvar are exact.
+    run_inline = True
+
+    def __init__(self, node: str = "llm") -> None:
+        self.node = node
+        self._runs: dict[UUID, _Run] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list,
+        *,
+        run_id: UUID,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        run = _Run(
+            node=metadata.get("llm_node") or self.node,
+            model=params.get("model") or params.get("model_name") or metadata.get("ls_model_name", ""),
+            route=llm_route.get(),
+            started=time.perf_counter(),
+        )
+        with self._lock:
+            self._runs[run_id] = run
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run.first_token_at is None:
+                run.first_token_at = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._pop(run_id)
+        if run is None:
+            return
+        prompt_tokens = completion_tokens = cached_tokens = 0
+        model = run.model
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0) or 0
+                completion_tokens += usage.get("output_tokens", 0) or 0
+                cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+                model = (getattr(message, "response_metadata", None) or {}).get("model_name") or model
+        self._finish(run, model, prompt_tokens, completion_tokens, cached_tokens, error=False)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._pop(run_id)
+        if run is not None:
+            self._finish(run, run.model, 0, 0, 0, error=True)
+
+    def _pop(self, run_id: UUID) -> Optional[_Run]:
+        with self._lock:
+            return self._runs.pop(run_id, None)
+
+    @staticmethod
+    def _finish(
+        run: _Run,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        error: bool,
+    ) -> None:
+        ended = time.perf_counter()
+        first = run.first_token_at or ended
+        llm_metrics.record(
+            run.node,
+            model=model,
+            wall_ms=(ended - run.started) * 1000,
+            ttft_ms=(first - run.started) * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            error=error,
+            route=run.route,
+        )
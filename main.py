@@ -1,14 +1,17 @@
 import asyncio
 import os
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Any, Optional, List
 from zoneinfo import ZoneInfo
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 import websockets as websockets_client
 from pydantic import BaseModel
-from chatbot import chatbot_async, chatbot_stream
+import chatbot as chatbot_module
+from chatbot import chatbot_async, chatbot_stream, delete_conversation, get_conversation
+from conversation_store import open_checkpointer
 from news import get_spain_news, format_news_for_chat
 from weather import get_weather, format_weather_for_chat
 from spanish_newspapers import (
@@ -18,10 +21,35 @@ from spanish_newspapers import (
     get_news_by_source,
     RSS_SOURCES,
 )
-from voice import process_voice_message, transcribe_audio, text_to_speech
-from tool_registry import REALTIME_TOOLS, execute_tool
+from voice import (
+    process_voice_message,
+    process_voice_message_stream,
+    transcribe_audio,
+    text_to_speech,
+    text_to_speech_stream,
+)
+from tool_registry import REALTIME_TOOLS, execute_tool, tool_metrics
+from tool_prefetch import tool_prefetcher
+from llm_metrics import llm_metrics, llm_route
 from alert import send_sms_alert_for_user
-from memory_service import run_memory_pipeline
+from memory_service import pipeline_metrics
+from memory_index import select_facts
+from memory_queue import memory_jobs
+from realtime_relay import (
+    REPLAY_EVENT_TYPES,
+    BinaryAudioFramer,
+    RealtimeToolCalls,
+    RelayQueue,
+    SessionReplay,
+    audio_append_event,
+    discard_connection,
+    parse_tool_event,
+    reconnect_upstream,
+    relay_metrics,
+    timed_phase,
+)
+from realtime_sessions import realtime_sessions
+from tts_cache import tts_cache
 from social_google import get_status as google_get_status, get_user_data as google_get_user_data
 from spotify import get_status as spotify_get_status, get_user_data as spotify_get_user_data
 from reminders import (
@@ -66,13 +94,27 @@ async def lifespan(app):
     task = None
     if os.getenv("RUN_INPROCESS_SCHEDULER") == "1":
         task = asyncio.create_task(scheduler_loop())
-    yield
+    memory_jobs.start()
+    async with open_checkpointer() as checkpointer:
+        chatbot_module.enable_conversations(checkpointer)
+        yield
+        chatbot_module.enable_conversations(None)
+    await memory_jobs.stop()
     if task is not None:
         task.cancel()
 
 app = FastAPI(lifespan=lifespan)
 
 SCHEDULER_SECRET = os.getenv("SCHEDULER_SECRET", "")
+METRICS_SECRET = os.getenv("METRICS_SECRET", "")
+
+
+@app.middleware("http")
+async def tag_llm_route(request: Request, call_next):
+    # LLM calls made while serving this request (including its background
+    # tasks) are aggregated under the request path in llm_metrics.
+    llm_route.set(request.url.path)
+    return await call_next(request)
 
 class AlertRequest(BaseModel):
     # `to` is intentionally absent — the recipient is always derived from the
@@ -84,7 +126,9 @@ class AlertRequest(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    # Ignored when conversation_id is set: the history is then kept server-side.
     history: List[dict] = []
+    conversation_id: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
 
@@ -123,9 +167,22 @@ async def _build_chat_context(user_id: str, latitude, longitude):
     return profile, tutor, memory, user_location
 
 
+def _check_conversation_id(conversation_id: Optional[str]) -> None:
+    if not conversation_id:
+        return
+    if chatbot_module.conversation_graph is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Las conversaciones en servidor no están habilitadas",
+        )
+    if len(conversation_id) > 128:
+        raise HTTPException(status_code=400, detail="conversation_id inválido")
+
+
 @app.post("/chat")
 async def chat(request: ChatRequest, user_id: str = Depends(get_current_user_id)):
     _enforce_rate_limit("chat", user_id, 60, 3600)
+    _check_conversation_id(request.conversation_id)
     profile, tutor, memory, user_location = await _build_chat_context(
         user_id, request.latitude, request.longitude,
     )
@@ -136,6 +193,7 @@ async def chat(request: ChatRequest, user_id: str = Depends(get_current_user_id)
         tutor_profile=tutor,
         user_memory=memory,
         user_location=user_location,
+        conversation_id=request.conversation_id,
     )
     return {"response": response}
 
@@ -143,6 +201,7 @@ async def chat(request: ChatRequest, user_id: str = Depends(get_current_user_id)
 @app.post("/chat/stream")
 async def chat_stream(request: ChatRequest, user_id: str = Depends(get_current_user_id)):
     _enforce_rate_limit("chat", user_id, 60, 3600)
+    _check_conversation_id(request.conversation_id)
     profile, tutor, memory, user_location = await _build_chat_context(
         user_id, request.latitude, request.longitude,
     )
@@ -156,6 +215,7 @@ async def chat_stream(request: ChatRequest, user_id: str = Depends(get_current_u
                 tutor_profile=tutor,
                 user_memory=memory,
                 user_location=user_location,
+                conversation_id=request.conversation_id,
             ):
                 yield f"data: {json.dumps({'token': token})}\n\n"
             yield "data: [DONE]\n\n"
@@ -173,13 +233,32 @@ async def chat_stream(request: ChatRequest, user_id: str = Depends(get_current_u
     )
 
 
+@app.get("/conversations/{conversation_id}")
+async def read_conversation(
+    conversation_id: str,
+    user_id: str = Depends(get_current_user_id),
+):
+    _check_conversation_id(conversation_id)
+    return {"messages": await get_conversation(user_id, conversation_id)}
+
+
+@app.delete("/conversations/{conversation_id}")
+async def remove_conversation(
+    conversation_id: str,
+    user_id: str = Depends(get_current_user_id),
+):
+    _check_conversation_id(conversation_id)
+    await delete_conversation(user_id, conversation_id)
+    return {"status": "deleted"}
+
+
 @app.post("/memory/summarize", status_code=202)
 async def summarize_memory(
     request: MemorySummarizeRequest,
-    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user_id),
 ):
-    background_tasks.add_task(run_memory_pipeline, user_id, request.messages)
+    # Debounced per user; see memory_queue for coalescing and worker limits.
+    memory_jobs.submit(user_id, request.messages)
     return {"status": "accepted"}
 
 
@@ -260,6 +339,31 @@ async def scheduler_tick(authorization: Optional[str] = Header(None)):
     return {"processed": processed}
 
 
+@app.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Per-process LLM, tool, prefetch, memory-pipeline, memory-queue, realtime and TTS cache metrics.
+
+    LLM calls are grouped by route and node with p50/p95 wall time and
+    time-to-first-token plus token totals; the memory pipeline reports
+    per-stage latencies, the realtime relay its setup phases and the TTS
+    cache its hit ratio. Requires METRICS_SECRET env var
+    and an `Authorization: Bearer <secret>` header.
+    """
+    if not METRICS_SECRET:
+        raise HTTPException(status_code=503, detail="Metrics not configured")
+    if authorization != f"Bearer {METRICS_SECRET}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {
+        "llm": llm_metrics.snapshot(),
+        "tools": tool_metrics(),
+        "tool_prefetch": tool_prefetcher.stats(),
+        "memory_pipeline": pipeline_metrics(),
+        "memory_queue": memory_jobs.stats(),
+        "realtime": relay_metrics.stats() | {"tool_sessions": realtime_sessions.stats()},
+        "tts_cache": tts_cache.stats(),
+    }
+
+
 @app.get("/news")
 async def news(limit: int = 10):
     """
@@ -430,6 +534,40 @@ def _check_audio_size(content_length: Optional[str]) -> None:
             )
 
 
+async def _read_audio_upload(audio: UploadFile) -> bytes:
+    if not audio.content_type or (
+        not audio.content_type.startswith('audio') and
+        not audio.content_type.startswith('video')
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="El archivo debe ser de tipo audio o video/webm",
+        )
+
+    # Stream-read with a hard cap; abort if the stream exceeds MAX_AUDIO_BYTES.
+    audio_bytes = bytearray()
+    while True:
+        chunk = await audio.read(64 * 1024)
+        if not chunk:
+            break
+        audio_bytes.extend(chunk)
+        if len(audio_bytes) > MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail="Audio demasiado grande")
+
+    if len(audio_bytes) == 0:
+        raise HTTPException(status_code=400, detail="El archivo de audio está vacío")
+    return bytes(audio_bytes)
+
+
+def _parse_voice_history(history: Optional[str], conversation_id: Optional[str]) -> Optional[list]:
+    if not history or conversation_id:
+        return None
+    try:
+        return json.loads(history)
+    except json.JSONDecodeError:
+        return None
+
+
 @app.post("/voice/transcribe")
 async def voice_transcribe(
     request: Request,
@@ -439,29 +577,8 @@ async def voice_transcribe(
     _enforce_rate_limit("voice", user_id, 60, 3600)
     _check_audio_size(request.headers.get("content-length"))
     try:
-        if not audio.content_type or (
-            not audio.content_type.startswith('audio') and
-            not audio.content_type.startswith('video')
-        ):
-            raise HTTPException(
-                status_code=400,
-                detail="El archivo debe ser de tipo audio o video/webm",
-            )
-
-        # Stream-read with a hard cap; abort if the stream exceeds MAX_AUDIO_BYTES.
-        audio_bytes = bytearray()
-        while True:
-            chunk = await audio.read(64 * 1024)
-            if not chunk:
-                break
-            audio_bytes.extend(chunk)
-            if len(audio_bytes) > MAX_AUDIO_BYTES:
-                raise HTTPException(status_code=413, detail="Audio demasiado grande")
-
-        if len(audio_bytes) == 0:
-            raise HTTPException(status_code=400, detail="El archivo de audio está vacío")
-
-        transcribed_text = await transcribe_audio(bytes(audio_bytes))
+        audio_bytes = await _read_audio_upload(audio)
+        transcribed_text = await transcribe_audio(audio_bytes)
         return {"text": transcribed_text}
 
     except HTTPException:
@@ -475,6 +592,15 @@ class TTSRequest(BaseModel):
     voice: str = "nova"
 
 
+def _tts_text(request: TTSRequest) -> str:
+    text = request.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="El texto no puede estar vacío")
+    if len(text) > 2000:
+        raise HTTPException(status_code=413, detail="Texto demasiado largo")
+    return text
+
+
 @app.post("/voice/tts")
 async def voice_tts(
     request: TTSRequest,
@@ -482,11 +608,7 @@ async def voice_tts(
 ):
     _enforce_rate_limit("tts", user_id, 60, 3600)
     try:
-        text = request.text.strip()
-        if not text:
-            raise HTTPException(status_code=400, detail="El texto no puede estar vacío")
-        if len(text) > 2000:
-            raise HTTPException(status_code=413, detail="Texto demasiado largo")
+        text = _tts_text(request)
 
         audio_bytes = await text_to_speech(text, voice=request.voice)
         audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
@@ -502,9 +624,42 @@ async def voice_tts(
         raise HTTPException(status_code=500, detail=f"Error generando audio: {str(e)}")
 
 
+@app.post("/voice/tts/stream")
+async def voice_tts_stream(
+    request: TTSRequest,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Streaming variant of /voice/tts: raw opus (audio/ogg) in a chunked response.
+
+    Chunks are forwarded as the TTS API produces them, so playback can start
+    with the first one and there is no base64 overhead. The first chunk is
+    awaited before responding, so a TTS failure is still a 500.
+    """
+    _enforce_rate_limit("tts", user_id, 60, 3600)
+    text = _tts_text(request)
+    chunks = text_to_speech_stream(text, voice=request.voice)
+    try:
+        first = await anext(chunks, b"")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generando audio: {str(e)}")
+
+    async def audio_stream():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/ogg",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
 class RealtimeSessionRequest(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    # "frontend" when the browser will run tools through /realtime/tool.
+    tool_call_handler: Optional[str] = None
 
 
 class RealtimeToolRequest(BaseModel):
@@ -512,6 +667,7 @@ class RealtimeToolRequest(BaseModel):
     arguments: Optional[Any] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    session_token: Optional[str] = None
 
 
 def _clip_for_prompt(value: Any, max_chars: int) -> str:
@@ -572,11 +728,9 @@ def _build_realtime_instructions(
 
     if user_memory:
         narrative = _clip_for_prompt(user_memory.get("narrative"), 320)
-        facts = user_memory.get("facts") or []
-        fact_texts = []
-        for fact in facts[:5]:
-            if isinstance(fact, dict) and fact.get("text"):
-                fact_texts.append(_clip_for_prompt(fact.get("text"), 90))
+        # No message yet at session start: the most recent hard facts, then soft ones, within the cap.
+        facts = select_facts(user_memory.get("facts") or [], max_facts=5, token_budget=120)
+        fact_texts = [_clip_for_prompt(fact.get("text"), 90) for fact in facts]
         if narrative:
             lines.append("Memoria resumida: " + narrative)
         if fact_texts:
@@ -611,6 +765,15 @@ def _get_xai_api_key() -> Optional[str]:
     return os.getenv("XAI_API_KEY") or os.getenv("X_API_KEY")
 
 
+def _connect_realtime_upstream(api_key: str) -> Any:
+    return websockets_client.connect(
+        f"{XAI_REALTIME_URL}?model={XAI_REALTIME_MODEL}",
+        additional_headers={"Authorization": f"Bearer {api_key}"},
+        max_size=16 * 1024 * 1024,
+        ping_interval=20,
+    )
+
+
 def _build_realtime_session(
     profile: Optional[dict],
     tutor: Optional[dict],
@@ -672,13 +835,8 @@ def _extract_realtime_function_call(payload: dict) -> Optional[dict]:
 async def _send_realtime_tool_result(
     xai_ws: Any,
     tool_call: dict,
-    context: dict,
+    output: str,
 ) -> None:
-    result = await execute_tool(
-        str(tool_call["name"]),
-        tool_call.get("arguments"),
-        context,
-    )
     await xai_ws.send(
         json.dumps(
             {
@@ -686,7 +844,7 @@ async def _send_realtime_tool_result(
                 "item": {
                     "type": "function_call_output",
                     "call_id": str(tool_call["call_id"]),
-                    "output": result,
+                    "output": output,
                 },
             }
         )
@@ -701,12 +859,28 @@ async def realtime_ws(ws: WebSocket):
 
     Flow:
       1. Browser connects, sends one JSON init message with user context.
-      2. Backend dials wss://api.x.ai/v1/realtime?model=...
-      3. Backend sends session.update (instructions + tools) to xAI.
-      4. By default, backend executes function calls and sends
-         function_call_output automatically.
+      2. Once the JWT is valid, backend dials wss://api.x.ai/v1/realtime?model=...
+         while it fetches profile, tutor and memory.
+      3. Backend sends session.update (instructions + tools) to xAI as soon
+         as both are done, then relay.ready to the browser.
+      4. By default, backend executes function calls in the background and
+         sends function_call_output when each one finishes.
       5. If init message includes {"tool_call_handler":"frontend"}, backend
-         only relays and frontend can handle tools via POST /realtime/tool.
+         only relays and frontend can handle tools via POST /realtime/tool;
+         relay.ready then carries a session_token for those calls. A
+         session_token from POST /realtime/session in the init message is
+         reused (its profile and tutor are not fetched again). The token is
+         revoked when the socket closes.
+      6. If the xAI socket drops, backend reconnects with backoff, re-sends
+         session.update and recent conversation items, and tells the
+         browser with relay.upstream_reconnected; relay.upstream_closed
+         only comes when reconnecting fails.
+      7. If init message includes {"audio_framing":"binary"} (acknowledged in
+         relay.ready), microphone audio is sent as binary PCM16 frames and
+         assistant audio deltas come back as binary PCM16 frames; all other
+         events stay JSON text frames. Before the first binary frame of each
+         audio item a relay.audio_item text frame gives its response_id and
+         item_id (for conversation.item.truncate).
     """
     await ws.accept()
     api_key = _get_xai_api_key()
@@ -733,8 +907,10 @@ async def realtime_ws(ws: WebSocket):
 
     # The first message MUST carry a Supabase JWT — never trust user_id /
     # profile / tutor / memory shipped from the client.
+    setup_started = time.perf_counter()
+    phases: dict = {}
     token = init_msg.get("token")
-    user_id = await resolve_user_id_from_jwt(token)
+    user_id = await timed_phase(phases, "auth", resolve_user_id_from_jwt(token))
     if not user_id:
         await ws.send_json(
             {"type": "error", "error": {"message": "Token de autenticacion invalido"}}
@@ -742,10 +918,37 @@ async def realtime_ws(ws: WebSocket):
         await ws.close()
         return
 
-    profile = await fetch_user_profile(user_id) or {}
+    # Dial xAI while the user context is fetched: neither needs the other
+    # and each takes a few hundred ms.
+    connect_task = asyncio.create_task(
+        timed_phase(phases, "connect", _connect_realtime_upstream(api_key))
+    )
+    # Profile and tutor already resolved by POST /realtime/session.
+    session_token = init_msg.get("session_token")
+    known_context = realtime_sessions.resolve(session_token, user_id)
+    if known_context is None:
+        session_token = None
+    try:
+        if known_context is not None:
+            memory = await timed_phase(phases, "context", fetch_user_memory(user_id))
+            profile, tutor = known_context["user_profile"], known_context["tutor_profile"]
+        else:
+            profile, tutor, memory = await timed_phase(
+                phases,
+                "context",
+                asyncio.gather(
+                    fetch_user_profile(user_id),
+                    fetch_tutor_profile(user_id),
+                    fetch_user_memory(user_id),
+                ),
+            )
+    except BaseException:
+        relay_metrics.record_setup_failure()
+        await discard_connection(connect_task)
+        raise
+    profile = profile or {}
     profile["id"] = user_id
-    tutor = await fetch_tutor_profile(user_id) or {}
-    memory = await fetch_user_memory(user_id)
+    tutor = tutor or {}
 
     user_location = {}
     latitude = init_msg.get("latitude")
@@ -755,48 +958,71 @@ async def realtime_ws(ws: WebSocket):
 
     tool_call_handler = str(init_msg.get("tool_call_handler") or "backend").lower()
     backend_handles_tools = tool_call_handler != "frontend"
+    binary_audio = str(init_msg.get("audio_framing") or "json").lower() == "binary"
     tool_context = {
         "user_id": user_id,
         "user_profile": profile,
         "tutor_profile": tutor,
         "user_location": user_location,
     }
-    handled_tool_call_ids: set[str] = set()
-
-    session_config = _build_realtime_session(profile, tutor, memory)
+    # Frontend-handled tools reuse this context through /realtime/tool.
+    if not backend_handles_tools and session_token is None:
+        session_token = realtime_sessions.mint(user_id, tool_context)
 
-    xai_url = f"{XAI_REALTIME_URL}?model={XAI_REALTIME_MODEL}"
     try:
-        async with websockets_client.connect(
-            xai_url,
-            additional_headers={"Authorization": f"Bearer {api_key}"},
-            max_size=16 * 1024 * 1024,
-            ping_interval=20,
-        ) as xai_ws:
-            await xai_ws.send(
-                json.dumps({"type": "session.update", "session": session_config})
-            )
-            await ws.send_json({"type": "relay.ready"})
+        session_update = json.dumps(
+            {"type": "session.update", "session": _build_realtime_session(profile, tutor, memory)}
+        )
+        xai_ws = await connect_task
+        # Tools run in the background so audio keeps flowing meanwhile.
+        tool_calls = RealtimeToolCalls(
+            execute=lambda call: execute_tool(
+                str(call["name"]), call.get("arguments"), tool_context
+            ),
+            send=lambda call, output: _send_realtime_tool_result(xai_ws, call, output),
+        )
+        try:
+            await timed_phase(phases, "session_update", xai_ws.send(session_update))
+            ready: dict = {"type": "relay.ready"}
+            if binary_audio:
+                ready["audio_framing"] = "binary"
+            if session_token and not backend_handles_tools:
+                ready["session_token"] = session_token
+            await ws.send_json(ready)
+            phases["ready"] = (time.perf_counter() - setup_started) * 1000
+            relay_metrics.record_setup(phases)
+
+            # Bounded queues decouple each socket's reader from the writer of
+            # the other one (see realtime_relay.RelayQueue).
+            upstream = RelayQueue()
+            downstream = RelayQueue()
+            queues = {"upstream": upstream, "downstream": downstream}
+
+            async def end_downstream(event: dict) -> None:
+                # Flushed to the browser after what is already queued.
+                await downstream.put(json.dumps(event))
+                await downstream.close()
+
+            def upstream_closed_event(e: Exception) -> dict:
+                close = getattr(e, "rcvd", None)
+                return {
+                    "type": "relay.upstream_closed",
+                    "code": close.code if close else None,
+                    "reason": close.reason if close else "",
+                }
 
             async def client_to_xai():
                 try:
                     while True:
-                        msg = await ws.receive_text()
-                        await xai_ws.send(msg)
+                        message = await ws.receive()
+                        if message["type"] == "websocket.disconnect":
+                            return
+                        if message.get("text") is not None:
+                            await upstream.put(message["text"])
+                        elif binary_audio and message.get("bytes"):
+                            await upstream.put(message["bytes"])
                 except WebSocketDisconnect:
                     return
-                except websockets_client.ConnectionClosed as e:
-                    try:
-                        await ws.send_json(
-                            {
-                                "type": "relay.upstream_closed",
-                                "code": getattr(e, "code", None),
-                                "reason": getattr(e, "reason", ""),
-                            }
-                        )
-                    except Exception:
-                        pass
-                    return
                 except Exception as e:
                     try:
                         await ws.send_json(
@@ -809,78 +1035,170 @@ async def realtime_ws(ws: WebSocket):
                         pass
                     return
 
-            async def xai_to_client():
-                try:
-                    async for msg in xai_ws:
-                        if isinstance(msg, bytes):
-                            msg = msg.decode("utf-8", errors="ignore")
-
-                        if backend_handles_tools:
-                            try:
-                                payload = json.loads(msg)
-                            except json.JSONDecodeError:
-                                payload = None
-
-                            if isinstance(payload, dict):
-                                tool_call = _extract_realtime_function_call(payload)
-                                if tool_call:
-                                    call_id = str(tool_call["call_id"])
-                                    if call_id not in handled_tool_call_ids:
-                                        handled_tool_call_ids.add(call_id)
-                                        await _send_realtime_tool_result(
-                                            xai_ws=xai_ws,
-                                            tool_call=tool_call,
-                                            context=tool_context,
-                                        )
-                        try:
-                            await ws.send_text(msg)
-                        except Exception:
-                            return
-                except websockets_client.ConnectionClosed as e:
+            # Cached setup and recent items, re-sent if the upstream drops.
+            replay = SessionReplay(session_update)
+            audio_framer = BinaryAudioFramer() if binary_audio else None
+            reconnect_lock = asyncio.Lock()
+
+            async def resume_upstream(failed: Any) -> bool:
+                """Replace the dropped `failed` connection; False if that failed."""
+                nonlocal xai_ws
+                async with reconnect_lock:
+                    if xai_ws is not failed:
+                        return True  # the other direction already reconnected
+                    started = time.perf_counter()
                     try:
-                        await ws.send_json(
+                        xai_ws = await reconnect_upstream(
+                            lambda: _connect_realtime_upstream(api_key), replay
+                        )
+                    except Exception:
+                        relay_metrics.count("reconnect_failures")
+                        return False
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    relay_metrics.record_reconnect(elapsed_ms)
+                    # Tool outputs that hit the dropped connection.
+                    await tool_calls.resend_unsent()
+                    await downstream.put(
+                        json.dumps(
                             {
-                                "type": "relay.upstream_closed",
-                                "code": getattr(e, "code", None),
-                                "reason": getattr(e, "reason", ""),
+                                "type": "relay.upstream_reconnected",
+                                "reconnect_ms": round(elapsed_ms),
                             }
                         )
-                    except Exception:
-                        pass
-                    return
+                    )
+                    return True
+
+            async def upstream_writer():
+                try:
+                    while True:
+                        message = await upstream.get()
+                        if message is None:
+                            return
+                        replay.observe_client(message)
+                        if isinstance(message, bytes):
+                            message = audio_append_event(message)
+                        while True:
+                            current = xai_ws
+                            try:
+                                await current.send(message)
+                                break
+                            except websockets_client.ConnectionClosedError as e:
+                                if not await resume_upstream(current):
+                                    await end_downstream(upstream_closed_event(e))
+                                    return
+                except websockets_client.ConnectionClosed as e:
+                    await end_downstream(upstream_closed_event(e))
                 except Exception as e:
+                    await end_downstream(
+                        {"type": "relay.error", "error": {"message": f"client_to_xai: {e}"}}
+                    )
+
+            async def xai_to_client():
+                while True:
+                    current = xai_ws
                     try:
-                        await ws.send_json(
-                            {
-                                "type": "relay.error",
-                                "error": {"message": f"xai_to_client: {e}"},
-                            }
+                        async for msg in current:
+                            if isinstance(msg, bytes):
+                                msg = msg.decode("utf-8", errors="ignore")
+
+                            if audio_framer is not None:
+                                frames = audio_framer.frames(msg)
+                                if frames is not None:
+                                    for frame in frames:
+                                        await downstream.put(frame)
+                                    continue
+
+                            # Audio deltas and other events are not decoded.
+                            payload = parse_tool_event(msg, REPLAY_EVENT_TYPES)
+                            if payload is not None:
+                                replay.observe(payload)
+                                if backend_handles_tools:
+                                    tool_call = _extract_realtime_function_call(payload)
+                                    if tool_call:
+                                        tool_calls.dispatch(tool_call)
+                            await downstream.put(msg)
+                        await downstream.close()
+                        return
+                    except websockets_client.ConnectionClosedError as e:
+                        if await resume_upstream(current):
+                            continue
+                        await end_downstream(upstream_closed_event(e))
+                        return
+                    except Exception as e:
+                        await end_downstream(
+                            {"type": "relay.error", "error": {"message": f"xai_to_client: {e}"}}
                         )
-                    except Exception:
-                        pass
-                    return
+                        return
 
-            done, pending = await asyncio.wait(
-                {
-                    asyncio.create_task(client_to_xai()),
-                    asyncio.create_task(xai_to_client()),
-                },
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-            for task in pending:
-                task.cancel()
+            async def downstream_writer():
+                while True:
+                    message = await downstream.get()
+                    if message is None:
+                        return
+                    try:
+                        if isinstance(message, bytes):
+                            await ws.send_bytes(message)
+                        else:
+                            await ws.send_text(message)
+                    except Exception:
+                        return
+
+            relay_metrics.open_relay(queues)
+            tasks = [
+                asyncio.create_task(client_to_xai()),
+                asyncio.create_task(upstream_writer()),
+                asyncio.create_task(xai_to_client()),
+                asyncio.create_task(downstream_writer()),
+            ]
+            try:
+                # The session ends when the browser leaves or everything
+                # queued for it (including a final upstream notice) is sent.
+                await asyncio.wait(
+                    {tasks[0], tasks[3]}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                relay_metrics.close_relay(queues)
+        finally:
+            await tool_calls.cancel_all()
+            await xai_ws.close()
     except Exception as e:
+        if "ready" not in phases:
+            relay_metrics.record_setup_failure()
+            await discard_connection(connect_task)
         try:
             await ws.send_json({"type": "error", "error": {"message": str(e)}})
         except Exception:
             pass
     finally:
+        realtime_sessions.revoke(session_token)
         try:
             await ws.close()
         except Exception:
             pass
 
 
+async def _realtime_tool_context(
+    user_id: str, latitude: Optional[float], longitude: Optional[float]
+) -> dict:
+    profile, tutor = await asyncio.gather(
+        fetch_user_profile(user_id), fetch_tutor_profile(user_id)
+    )
+    profile = profile or {}
+    profile["id"] = user_id
+    user_location = {}
+    if latitude is not None and longitude is not None:
+        user_location = {"latitude": latitude, "longitude": longitude}
+    return {
+        "user_id": user_id,
+        "user_profile": profile,
+        "tutor_profile": tutor or {},
+        "user_location": user_location,
+    }
+
+
 @app.post("/realtime/session")
 async def realtime_session(
     request: RealtimeSessionRequest,
@@ -891,14 +1209,22 @@ async def realtime_session(
         raise HTTPException(
             status_code=500, detail="XAI_API_KEY no configurada (o X_API_KEY)"
         )
-    return {
+    tool_call_handler = "frontend" if (request.tool_call_handler or "").lower() == "frontend" else "backend"
+    session = {
         "ws_path": "/realtime/ws",
         "model": XAI_REALTIME_MODEL,
         "voice": XAI_REALTIME_VOICE,
-        "tool_call_handler": "backend",
+        "tool_call_handler": tool_call_handler,
         "input_sample_rate": 24000,
         "output_sample_rate": 24000,
+        "audio_framings": ["json", "binary"],
     }
+    if tool_call_handler == "frontend":
+        # Only the browser calls /realtime/tool; the backend handler needs no handle.
+        context = await _realtime_tool_context(user_id, request.latitude, request.longitude)
+        session["session_token"] = realtime_sessions.mint(user_id, context)
+        session["session_expires_in"] = int(realtime_sessions.ttl_seconds)
+    return session
 
 
 @app.post("/realtime/tool")
@@ -907,19 +1233,16 @@ async def realtime_tool(
     user_id: str = Depends(get_current_user_id),
 ):
     _enforce_rate_limit("rt-tool", user_id, 60, 3600)
-    profile = await fetch_user_profile(user_id) or {}
-    profile["id"] = user_id
-    tutor = await fetch_tutor_profile(user_id) or {}
-    user_location = {}
-    if request.latitude is not None and request.longitude is not None:
-        user_location = {"latitude": request.latitude, "longitude": request.longitude}
-
-    context = {
-        "user_id": user_id,
-        "user_profile": profile,
-        "tutor_profile": tutor,
-        "user_location": user_location,
-    }
+    # The session's context is resolved once; without a valid token (expired,
+    # another worker) it is fetched again as before.
+    context = realtime_sessions.resolve(request.session_token, user_id)
+    if context is None:
+        context = await _realtime_tool_context(user_id, request.latitude, request.longitude)
+    elif request.latitude is not None and request.longitude is not None:
+        context = {
+            **context,
+            "user_location": {"latitude": request.latitude, "longitude": request.longitude},
+        }
     result = await execute_tool(request.name, request.arguments, context)
     return {"result": result}
 
@@ -930,53 +1253,32 @@ async def voice(
     audio: UploadFile = File(...),
     voice_name: str = "nova",
     history: str = None,
+    conversation_id: str = None,
     user_id: str = Depends(get_current_user_id),
 ):
     """Voice pipeline (STT -> Chatbot -> TTS).
 
     The chatbot context is rebuilt server-side from the authenticated user.
     The optional `history` form field is still accepted but `user_profile_json`
-    has been removed because it could be spoofed.
+    has been removed because it could be spoofed. With `conversation_id` the
+    history is kept server-side and `history` is ignored.
     """
     _enforce_rate_limit("voice-pipe", user_id, 60, 3600)
+    _check_conversation_id(conversation_id)
     _check_audio_size(request.headers.get("content-length"))
     try:
-        if not audio.content_type or (
-            not audio.content_type.startswith('audio') and
-            not audio.content_type.startswith('video')
-        ):
-            raise HTTPException(
-                status_code=400,
-                detail="El archivo debe ser de tipo audio o video/webm",
-            )
-
-        audio_bytes = bytearray()
-        while True:
-            chunk = await audio.read(64 * 1024)
-            if not chunk:
-                break
-            audio_bytes.extend(chunk)
-            if len(audio_bytes) > MAX_AUDIO_BYTES:
-                raise HTTPException(status_code=413, detail="Audio demasiado grande")
-
-        if len(audio_bytes) == 0:
-            raise HTTPException(status_code=400, detail="El archivo de audio está vacío")
-
-        parsed_history = None
-        if history:
-            try:
-                parsed_history = json.loads(history)
-            except json.JSONDecodeError:
-                pass
+        audio_bytes = await _read_audio_upload(audio)
+        parsed_history = _parse_voice_history(history, conversation_id)
 
         profile = await fetch_user_profile(user_id) or {}
         profile["id"] = user_id
 
         response_audio, transcribed_text, chatbot_response = await process_voice_message(
-            bytes(audio_bytes),
+            audio_bytes,
             voice=voice_name,
             history=parsed_history,
             user_profile=profile,
+            conversation_id=conversation_id,
         )
 
         audio_base64 = base64.b64encode(response_audio).decode("utf-8")
@@ -992,3 +1294,68 @@ async def voice(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando audio: {str(e)}")
+
+
+@app.post("/voice/stream")
+async def voice_stream(
+    request: Request,
+    audio: UploadFile = File(...),
+    voice_name: str = "nova",
+    history: str = None,
+    conversation_id: str = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Pipelined voice pipeline: same input as /voice, answer spoken as it streams.
+
+    Server-sent events like /chat/stream: {"text": transcript} first, then one
+    {"index", "sentence", "audio", "audioType"} per sentence, in order, while
+    the rest of the answer is still being generated (see voice.speak_stream),
+    then {"response": full answer} and [DONE]. Transcription runs before the
+    response starts, so its errors are still HTTP errors.
+    """
+    _enforce_rate_limit("voice-pipe", user_id, 60, 3600)
+    _check_conversation_id(conversation_id)
+    _check_audio_size(request.headers.get("content-length"))
+    audio_bytes = await _read_audio_upload(audio)
+    profile = await fetch_user_profile(user_id) or {}
+    profile["id"] = user_id
+
+    events = process_voice_message_stream(
+        audio_bytes,
+        voice=voice_name,
+        history=_parse_voice_history(history, conversation_id),
+        user_profile=profile,
+        conversation_id=conversation_id,
+    )
+    try:
+        transcript = await anext(events)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error procesando audio: {str(e)}")
+
+    async def event_generator():
+        try:
+            yield f"data: {json.dumps({'text': transcript['text']})}\n\n"
+            async for event in events:
+                if event["type"] == "audio":
+                    payload = {
+                        "index": event["index"],
+                        "sentence": event["text"],
+                        "audio": base64.b64encode(event["audio"]).decode("utf-8"),
+                        "audioType": "audio/ogg",
+                    }
+                else:
+                    payload = {"response": event["response"]}
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
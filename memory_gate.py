@@ -0,0 +1,151 @@
+"""Cheap local gate in front of memory extraction.
+
+Most /memory/summarize windows are small talk ("hola", the weather) and carry
+nothing worth remembering, yet extraction always costs an LLM call. The gate
+scores the user's messages with Spanish keyword heuristics and the pipeline
+skips extraction when the score stays below MEMORY_GATE_THRESHOLD:
+
+- strong patterns (1.0): self-descriptions ("me llamo", "vivo en", "tengo 80
+  años"), likes and dislikes, feelings ("estoy muy sola"), family and pets
+  introduced with a possessive ("mi nieta", "mis hijos");
+- health terms (1.0): illnesses, medication, doctors, pain...;
+- weak signals (0.5 each): a bare family term, or a first-person statement.
+
+The default threshold favours recall: a missed fact is lost, a false positive
+only costs the call the gate was meant to save. MEMORY_GATE_THRESHOLD=0
+disables the gate. `python -m benchmarks.gate_bench` reports precision/recall
+on a labelled corpus for tuning.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from memory_index import fold
+
+MEMORY_GATE_THRESHOLD = float(os.getenv("MEMORY_GATE_THRESHOLD", "1.0"))
+
+STRONG_WEIGHT = 1.0
+HEALTH_WEIGHT = 1.0
+FAMILY_WEIGHT = 0.5
+FIRST_PERSON_WEIGHT = 0.5
+
+# Patterns run on accent/case folded text (see memory_index.fold).
+_FAMILY = (
+    r"hij[oa]s?|niet[oa]s?|bisniet[oa]s?|marido|espos[oa]|mujer|novi[oa]|herman[oa]s?|"
+    r"sobrin[oa]s?|prim[oa]s?|padres?|madre|papa|mama|abuel[oa]s?|suegr[oa]s?|yerno|nuera|"
+    r"cunad[oa]s?|familia|perr[oa]s?|perrit[oa]|gat[oa]s?|gatit[oa]|vecin[oa]s?|amig[oa]s?"
+)
+
+STRONG_PATTERNS = {
+    "nombre": r"\bme llamo\b|\bmi nombre\b|\bllamame\b",
+    "edad": r"\btengo \d+ anos\b|\bcumplo \d+\b|\bmi cumpleanos\b",
+    "origen": r"\bsoy de\b|\bnaci en\b|\bme crie en\b",
+    "vivienda": r"\bvivo (en|con|sol[oa])\b|\bme he mudado\b|\bme mude\b",
+    "trabajo": r"\btrabaje\b|\btrabajaba\b|\bme jubile\b|\bestoy jubilad[oa]\b|\bfui (maestr|enfermer|profesor)",
+    "gustos": (
+        r"\b(no )?me (gusta|gustan|encanta|encantan|apasiona|chifla|entretiene|aburre)\b|"
+        r"\bprefiero\b|\bodio\b|\bmi (comida|cancion|musica|equipo|programa|pelicula) favorit[oa]\b|"
+        r"\bsoy (del|de la|aficionad[oa]|hincha)\b|\bmi aficion\b"
+    ),
+    "animo": (
+        r"\bestoy (muy |un poco |bastante )?"
+        r"(triste|sol[oa]|cansad[oa]|content[oa]|preocupad[oa]|nervios[oa]|deprimid[oa]|aburrid[oa]|"
+        r"enferm[oa]|mal|fatal|feliz|asustad[oa])\b|\bme siento\b|\becho de menos\b"
+    ),
+    "familia": rf"\b(mi|mis|tengo (un|una|dos|tres|cuatro|cinco)?)\s*({_FAMILY})\b|\bsoy viud[oa]\b",
+}
+
+HEALTH_PATTERN = (
+    r"\b(diabetes|diabetic[oa]|tension|hipertension|colesterol|azucar|artrosis|artritis|"
+    r"alzheimer|parkinson|cancer|ictus|infarto|corazon|marcapasos|asma|epoc|alergi[ao]|alergic[oa]|"
+    r"pastillas?|medicamentos?|medicacion|medicinas?|insulina|sintrom|"
+    r"medic[oa]|doctor[a]?|enfermer[oa]|hospital|urgencias|ambulatorio|centro de salud|"
+    r"operacion|operaron|operar|rehabilitacion|fisio|fisioterapia|"
+    r"dolor|duele|duelen|rodilla|cadera|espalda|caida|me cai|mareos?|"
+    r"audifonos?|gafas|silla de ruedas|andador|baston)\b"
+)
+
+FIRST_PERSON_PATTERN = (
+    r"\b(yo|mi|mis|me|conmigo|tengo|tenia|soy|era|fui|estoy|estuve|vivo|vivia|"
+    r"he (estado|ido|hecho|visto)|voy a|suelo|siempre|nunca)\b"
+)
+
+_STRONG = {name: re.compile(pattern) for name, pattern in STRONG_PATTERNS.items()}
+_HEALTH = re.compile(HEALTH_PATTERN)
+_FAMILY_TERM = re.compile(rf"\b({_FAMILY})\b")
+_FIRST_PERSON = re.compile(FIRST_PERSON_PATTERN)
+# On the original text: a capitalised word after "soy" is usually a name.
+_SOY_NAME = re.compile(r"\b[Ss]oy\s+[A-ZÁÉÍÓÚÑ]")
+
+
+@dataclass
+class GateDecision:
+    extract: bool
+    score: float
+    signals: List[str] = field(default_factory=list)
+
+
+def score_text(text: str) -> tuple[float, List[str]]:
+    """Gate score of one text and the names of the signals that fired."""
+    folded = fold(text)
+    signals = [name for name, pattern in _STRONG.items() if pattern.search(folded)]
+    if "nombre" not in signals and _SOY_NAME.search(text):
+        signals.insert(0, "nombre")
+    score = STRONG_WEIGHT * len(signals)
+    if _HEALTH.search(folded):
+        signals.append("salud")
+        score += HEALTH_WEIGHT
+    if "familia" not in signals and _FAMILY_TERM.search(folded):
+        signals.append("familiar")
+        score += FAMILY_WEIGHT
+    if _FIRST_PERSON.search(folded):
+        signals.append("primera_persona")
+        score += FIRST_PERSON_WEIGHT
+    return score, signals
+
+
+def evaluate(messages: List[dict], threshold: Optional[float] = None) -> GateDecision:
+    """Decide whether `messages` may contain something to remember.
+
+    Only the user's messages are scored (the assistant's questions mention
+    family and health all the time). Messages are scored one by one and the
+    best score decides, so a long chatty window does not add up weak signals.
+    """
+    threshold = MEMORY_GATE_THRESHOLD if threshold is None else threshold
+    if threshold <= 0:
+        return GateDecision(extract=True, score=0.0)
+    best = GateDecision(extract=False, score=0.0)
+    for message in messages:
+        if message.get("role") != "user" or not isinstance(message.get("content"), str):
+            continue
+        score, signals = score_text(message["content"])
+        if score > best.score:
+            best = GateDecision(extract=False, score=score, signals=signals)
+    best.extract = best.score >= threshold
+    return best
+
+
+_stats_lock = threading.Lock()
+_stats = {"checked": 0, "skipped": 0}
+
+
+def record(decision: GateDecision) -> None:
+    with _stats_lock:
+        _stats["checked"] += 1
+        if not decision.extract:
+            _stats["skipped"] += 1
+
+
+def gate_stats() -> dict:
+    """Gate decisions since process start.
+
+    Each skipped window avoids the extraction call (or the single combined
+    call), so `llm_calls_avoided` equals `skipped`.
+    """
+    with _stats_lock:
+        return {**_stats, "llm_calls_avoided": _stats["skipped"], "threshold": MEMORY_GATE_THRESHOLD}
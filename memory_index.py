@@ -0,0 +1,149 @@
+"""Relevance-ranked selection of memory facts for prompts.
+
+A user's memory keeps growing, so prompts cannot carry every fact. `select_facts`
+builds a small BM25 index over the facts (accent/case folded Spanish tokens,
+stopwords removed, plural endings trimmed) and returns:
+
+- the 'hard' facts (name, family, illnesses...) first, most recent first;
+- then the 'soft' facts most relevant to the current message, best first.
+  Without a query, or when nothing matches, the most recent soft facts are
+  used instead.
+
+Both kinds stop at `max_facts` or when the token budget is spent.
+
+Facts come back in their stored order so the prompt text stays stable across
+turns. Indexes are cached per fact set, so a conversation reuses its user's index.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import List, Optional
+
+MEMORY_PROMPT_MAX_FACTS = int(os.getenv("MEMORY_PROMPT_MAX_FACTS", "12"))
+MEMORY_PROMPT_TOKEN_BUDGET = int(os.getenv("MEMORY_PROMPT_TOKEN_BUDGET", "300"))
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+_INDEX_CACHE_SIZE = 256
+
+STOPWORDS = frozenset(
+    "a al algo como con de del el ella ellos en entre es esa ese esta este estan "
+    "fue ha han hay la las le les lo los me mi mis muy ni no nos o para pero por "
+    "que se sea si sin sobre su sus te ti tu tus un una uno unos unas y ya yo".split()
+)
+
+
+def fold(text: str) -> str:
+    """Accent- and case-folded text without punctuation."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", stripped.casefold()).split())
+
+
+def _stem(word: str) -> str:
+    # Plural trimming is enough to match "nietos"/"nieto", "flores"/"flor".
+    if len(word) > 4 and word.endswith("es") and word[-3] not in "aeiou":
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(w) for w in fold(text).split() if w not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FactIndex:
+    """BM25 over the texts of one fact list."""
+
+    def __init__(self, texts: List[str]) -> None:
+        self.docs = [Counter(tokenize(t)) for t in texts]
+        self.lengths = [sum(d.values()) for d in self.docs]
+        self.avg_length = (sum(self.lengths) / len(self.docs)) if self.docs else 0.0
+        df: Counter = Counter()
+        for doc in self.docs:
+            df.update(doc.keys())
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def scores(self, query: str) -> List[float]:
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        out = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * length / (self.avg_length or 1))
+            for term in terms:
+                tf = doc.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (_BM25_K1 + 1) / (tf + norm)
+            out.append(score)
+        return out
+
+
+_index_cache: "OrderedDict[tuple, FactIndex]" = OrderedDict()
+# chatbot_node runs on executor threads.
+_index_lock = threading.Lock()
+
+
+def _index_for(texts: List[str]) -> FactIndex:
+    key = tuple(texts)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = FactIndex(texts)
+    with _index_lock:
+        _index_cache[key] = index
+        if len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def select_facts(
+    facts: List[dict],
+    query: str = "",
+    max_facts: Optional[int] = None,
+    token_budget: Optional[int] = None,
+) -> List[dict]:
+    """Recent hard facts, then the soft facts most relevant to `query`, in stored order."""
+    max_facts = MEMORY_PROMPT_MAX_FACTS if max_facts is None else max_facts
+    token_budget = MEMORY_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    facts = [f for f in facts if isinstance(f, dict) and f.get("text")]
+
+    def recency(i: int) -> str:
+        return str(facts[i].get("created_at", ""))
+
+    hard = [i for i, f in enumerate(facts) if f.get("category") == "hard"]
+    soft = [i for i, f in enumerate(facts) if f.get("category") != "hard"]
+    chosen: set = set()
+    budget = _fill(facts, sorted(hard, key=recency, reverse=True), chosen, max_facts, token_budget)
+    if soft and budget > 0 and len(chosen) < max_facts:
+        scores = _index_for([f["text"] for f in facts]).scores(query) if query else [0.0] * len(facts)
+        # Relevant facts first, then the most recent ones.
+        ranked = sorted(soft, key=lambda i: (scores[i], recency(i)), reverse=True)
+        _fill(facts, ranked, chosen, max_facts, budget)
+    return [f for i, f in enumerate(facts) if i in chosen]
+
+
+def _fill(facts: List[dict], ranked: List[int], chosen: set, max_facts: int, budget: int) -> int:
+    """Add facts from `ranked` to `chosen` while they fit; returns the budget left."""
+    for i in ranked:
+        if len(chosen) >= max_facts:
+            break
+        cost = estimate_tokens(facts[i]["text"])
+        if cost > budget:
+            continue
+        chosen.add(i)
+        budget -= cost
+    return budget
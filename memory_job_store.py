@@ -0,0 +1,228 @@
+"""Durable SQLite store for memory-pipeline jobs and their stage outputs.
+
+Each job queued by memory_queue is written here before it runs, together with
+the output of every completed stage (extraction, merged facts...). A job that
+fails half-way is retried from its last completed stage, so an extraction that
+was already paid for is not asked again, and jobs left unfinished by a worker
+restart are replayed. Finished jobs and jobs that ran out of attempts are
+deleted, and rows untouched for MEMORY_JOB_TTL_SECONDS are pruned, so the
+conversation text they hold is not kept around.
+
+Several processes may share the file (uvicorn workers): every job is leased
+to the store that created or claimed it, each write renews the lease, and
+another process only replays a job once its lease has expired. Closing a
+store releases its leases so a restart replays them straight away.
+
+All SQLite work runs on one dedicated thread, never on the event loop: the
+queue awaits `call(...)` or fires `defer(...)`, and a single thread keeps the
+writes in the order they were issued.
+
+Enabled with MEMORY_JOB_DB (default `memory_jobs.sqlite`; empty disables).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MEMORY_JOB_DB = os.getenv("MEMORY_JOB_DB", "memory_jobs.sqlite")
+# A job not written for this long by the process holding it may be replayed elsewhere.
+MEMORY_JOB_LEASE_SECONDS = float(os.getenv("MEMORY_JOB_LEASE_SECONDS", "600"))
+# Rows not written for this long are deleted whatever their state.
+MEMORY_JOB_TTL_SECONDS = float(os.getenv("MEMORY_JOB_TTL_SECONDS", str(24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    messages TEXT NOT NULL,
+    stages TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+# Columns added after the first release, for files created before them.
+_MIGRATIONS = {
+    "owner": "ALTER TABLE memory_jobs ADD COLUMN owner TEXT",
+    "lease_until": "ALTER TABLE memory_jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+}
+
+
+class JobCheckpoints:
+    """Stage outputs of one job, as seen by run_memory_pipeline."""
+
+    def __init__(self, store: "MemoryJobStore", job_id: str, stages: dict) -> None:
+        self.store = store
+        self.job_id = job_id
+        self.stages = stages
+
+    def get(self, stage: str) -> Any:
+        return self.stages.get(stage)
+
+    def save(self, stage: str, output: Any) -> None:
+        self.stages[stage] = output
+        self.store.defer(self.store._write_stages, self.job_id, dict(self.stages))
+
+
+class MemoryJobStore:
+    def __init__(self, path: str, lease_seconds: float = MEMORY_JOB_LEASE_SECONDS) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-jobs")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(memory_jobs)")}
+        for column, sql in _MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(sql)
+        self._counts: dict = {}
+        self._refresh_counts()
+
+    def close(self) -> None:
+        """Finish queued writes, release this store's leases and close the file."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE memory_jobs SET owner = NULL, lease_until = 0 WHERE owner = ?", (self.owner,)
+            )
+            self._conn.close()
+
+    # -- running off the event loop -----------------------------------------
+
+    async def call(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run `fn(*args)` on the store thread and wait for it."""
+        return await asyncio.wrap_future(self._executor.submit(fn, *args))
+
+    def defer(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Queue `fn(*args)` on the store thread without waiting; failures are logged."""
+        self._executor.submit(fn, *args).add_done_callback(_log_failure)
+
+    # -- operations (run on the store thread) --------------------------------
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _lease(self) -> float:
+        return time.time() + self.lease_seconds
+
+    def _refresh_counts(self) -> None:
+        rows = self._execute("SELECT status, COUNT(*) FROM memory_jobs GROUP BY status").fetchall()
+        self._counts = dict(rows)
+
+    def create(self, user_id: str, messages: List[dict], job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO memory_jobs (id, user_id, messages, owner, lease_until, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, json.dumps(messages, ensure_ascii=False), self.owner, self._lease(), now, now),
+        )
+        self._refresh_counts()
+        return job_id
+
+    def update_messages(self, job_id: str, messages: List[dict]) -> None:
+        self._execute(
+            "UPDATE memory_jobs SET messages = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(messages, ensure_ascii=False), self._lease(), time.time(), job_id),
+        )
+
+    def start_attempt(self, job_id: str) -> JobCheckpoints:
+        """Mark the job running (one more attempt) and return its checkpoints."""
+        self._execute(
+            "UPDATE memory_jobs SET status = 'running', attempts = attempts + 1, owner = ?, "
+            "lease_until = ?, updated_at = ? WHERE id = ?",
+            (self.owner, self._lease(), time.time(), job_id),
+        )
+        self._refresh_counts()
+        row = self._execute("SELECT stages FROM memory_jobs WHERE id = ?", (job_id,)).fetchone()
+        return JobCheckpoints(self, job_id, json.loads(row[0]) if row else {})
+
+    def _write_stages(self, job_id: str, stages: dict) -> None:
+        self._execute(
+            "UPDATE memory_jobs SET stages = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(stages, ensure_ascii=False), self._lease(), time.time(), job_id),
+        )
+
+    def finish(self, job_id: str) -> None:
+        """Delete a job that completed or will not be retried."""
+        self._execute("DELETE FROM memory_jobs WHERE id = ?", (job_id,))
+        self._refresh_counts()
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Record a failed attempt of a job that will be retried."""
+        self._execute(
+            "UPDATE memory_jobs SET status = 'failed', error = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+            (error[:500], self._lease(), time.time(), job_id),
+        )
+        self._refresh_counts()
+
+    def claim_unfinished(self, max_attempts: int) -> List[Tuple[str, str, List[dict], int]]:
+        """Lease the jobs no live store holds and that may still run, oldest first.
+
+        Returns (job_id, user_id, messages, attempts) for each claimed job.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, user_id, messages, attempts FROM memory_jobs "
+                    "WHERE attempts < ? AND lease_until < ? AND (owner IS NULL OR owner != ?) "
+                    "ORDER BY created_at",
+                    (max_attempts, now, self.owner),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE memory_jobs SET owner = ?, lease_until = ? WHERE id = ?",
+                    [(self.owner, self._lease(), row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(job_id, user_id, json.loads(messages), attempts) for job_id, user_id, messages, attempts in rows]
+
+    def prune(self, max_attempts: int, ttl_seconds: float = MEMORY_JOB_TTL_SECONDS) -> int:
+        """Delete abandoned jobs that ran out of attempts and rows older than the TTL."""
+        now = time.time()
+        deleted = self._execute(
+            "DELETE FROM memory_jobs WHERE (attempts >= ? AND lease_until < ?) OR updated_at < ?",
+            (max_attempts, now, now - ttl_seconds),
+        ).rowcount
+        self._refresh_counts()
+        return deleted
+
+    def counts(self) -> dict:
+        """Jobs per status as of the last write (read without touching the file)."""
+        return dict(self._counts)
+
+
+def _log_failure(future: concurrent.futures.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Memory job store write failed", exc_info=future.exception())
+
+
+def open_job_store(path: Optional[str] = None) -> Optional[MemoryJobStore]:
+    path = MEMORY_JOB_DB if path is None else path
+    return MemoryJobStore(path) if path else None
@@ -0,0 +1,340 @@
+"""Debounced per-user job queue for the memory pipeline.
+
+The front-end calls POST /memory/summarize every few turns. Running one
+pipeline per call makes pipelines for the same user overlap (racing on the
+upsert) and multiplies LLM spend, so calls are queued here instead:
+
+- requests for a user arriving within MEMORY_DEBOUNCE_SECONDS of each other
+  are coalesced into one job whose messages are concatenated (the front-end sends
+  overlapping windows, so the turns a new window repeats from the end of the
+  queued one are dropped);
+  a job waits at most MEMORY_MAX_WAIT_SECONDS after its first request;
+- at most one pipeline runs per user; a job that becomes due while the user's
+  previous pipeline is still running waits for it;
+- a pool of MEMORY_WORKERS workers bounds the pipelines running across users.
+
+Jobs are also recorded in a durable store (memory_job_store) with the output
+of each completed stage: a failed job is retried up to MEMORY_JOB_MAX_ATTEMPTS
+times from its last completed stage, and jobs left unfinished by a restart (or
+by another worker process whose lease expired) are replayed when the queue
+starts and then every MEMORY_JOB_REPLAY_SECONDS. `stats()` backs the
+"memory_queue" section of GET /metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+
+import memory_service
+from llm_metrics import llm_route
+from memory_job_store import MEMORY_JOB_DB, JobCheckpoints, MemoryJobStore, open_job_store
+
+logger = logging.getLogger(__name__)
+
+MEMORY_DEBOUNCE_SECONDS = float(os.getenv("MEMORY_DEBOUNCE_SECONDS", "20"))
+MEMORY_MAX_WAIT_SECONDS = float(os.getenv("MEMORY_MAX_WAIT_SECONDS", "120"))
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "4"))
+# Upper bound on messages kept per coalesced job (oldest are dropped).
+MEMORY_MAX_JOB_MESSAGES = int(os.getenv("MEMORY_MAX_JOB_MESSAGES", "200"))
+MEMORY_JOB_MAX_ATTEMPTS = int(os.getenv("MEMORY_JOB_MAX_ATTEMPTS", "3"))
+# Delay before retry n is n * MEMORY_JOB_RETRY_SECONDS.
+MEMORY_JOB_RETRY_SECONDS = float(os.getenv("MEMORY_JOB_RETRY_SECONDS", "30"))
+# Seconds between scans for jobs to replay (expired leases) and rows to prune.
+MEMORY_JOB_REPLAY_SECONDS = float(os.getenv("MEMORY_JOB_REPLAY_SECONDS", "300"))
+# Seconds given to pending/running jobs when the app shuts down.
+MEMORY_SHUTDOWN_GRACE_SECONDS = 20.0
+
+Runner = Callable[[str, List[dict], Optional[JobCheckpoints]], Awaitable[None]]
+
+
+@dataclass
+class _Job:
+    user_id: str
+    first_submitted: float
+    due_at: float
+    messages: List[dict] = field(default_factory=list)
+    requests: int = 0
+    queued: bool = False
+    job_id: Optional[str] = None
+    attempts: int = 0
+
+
+class MemoryJobQueue:
+    def __init__(
+        self,
+        runner: Runner,
+        debounce_seconds: float = MEMORY_DEBOUNCE_SECONDS,
+        max_wait_seconds: float = MEMORY_MAX_WAIT_SECONDS,
+        workers: int = MEMORY_WORKERS,
+        route: str = "/memory/summarize",
+        store_path: Optional[str] = None,
+        max_attempts: int = MEMORY_JOB_MAX_ATTEMPTS,
+        retry_seconds: float = MEMORY_JOB_RETRY_SECONDS,
+    ) -> None:
+        self.runner = runner
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.workers = workers
+        self.route = route
+        self.store_path = store_path
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.store: Optional[MemoryJobStore] = None
+        # Debounced jobs not started yet, one per user.
+        self._pending: dict[str, _Job] = {}
+        # Failed jobs waiting for their retry, by job id.
+        self._retrying: dict[str, _Job] = {}
+        self._running: set[str] = set()
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._replay_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self._counters = {
+            "submitted": 0,
+            "coalesced": 0,
+            "completed": 0,
+            "failed": 0,
+            "retried": 0,
+            "replayed": 0,
+        }
+        self._wait_seconds = _Latency()
+        self._run_seconds = _Latency()
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the worker pool on the running loop (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker_tasks:
+            return
+        self._loop = loop
+        self._stopping = False
+        self._ready = asyncio.Queue()
+        self._worker_tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        if self.store is None and self.store_path:
+            self.store = open_job_store(self.store_path)
+        if self.store is not None:
+            self._replay_task = loop.create_task(self._replay())
+
+    async def _replay(self) -> None:
+        """Queue the jobs no live process holds any more, then keep checking."""
+        store = self.store
+        while True:
+            try:
+                pruned = await store.call(store.prune, self.max_attempts)
+                claimed = await store.call(store.claim_unfinished, self.max_attempts)
+            except Exception:
+                logger.exception("Memory queue: could not scan the job store")
+                claimed, pruned = [], 0
+            now = time.monotonic()
+            for job_id, user_id, messages, attempts in claimed:
+                job = _Job(user_id, now, now, messages=messages, job_id=job_id, attempts=attempts)
+                self._counters["replayed"] += 1
+                self._enqueue(job)
+            if claimed or pruned:
+                logger.info("Memory queue: replayed %d unfinished jobs, pruned %d", len(claimed), pruned)
+            await asyncio.sleep(MEMORY_JOB_REPLAY_SECONDS)
+
+    async def stop(self, grace_seconds: float = MEMORY_SHUTDOWN_GRACE_SECONDS) -> None:
+        """Flush pending jobs, give them `grace_seconds` to finish, then cancel."""
+        if not self._worker_tasks:
+            return
+        self._stopping = True
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            self._replay_task = None
+        for user_id in list(self._timers):
+            self._timers.pop(user_id).cancel()
+        for user_id, job in self._pending.items():
+            if not job.queued and user_id not in self._running:
+                self._enqueue(job)
+        deadline = time.monotonic() + grace_seconds
+        while (self._pending or self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending:
+            logger.warning("Memory queue: dropping %d pending jobs on shutdown", len(self._pending))
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._pending.clear()
+        # Stored jobs (pending, retrying or cut short) are replayed on next start.
+        self._retrying.clear()
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+            self.store = None
+
+    # -- producer -----------------------------------------------------------
+
+    def submit(self, user_id: str, messages: List[dict]) -> None:
+        """Queue `messages` for `user_id`, coalescing with any pending job."""
+        self.start()
+        now = time.monotonic()
+        job = self._pending.get(user_id)
+        self._counters["submitted"] += 1
+        if job is not None:
+            self._counters["coalesced"] += 1
+        else:
+            job = self._pending[user_id] = _Job(user_id, first_submitted=now, due_at=now)
+        job.requests += 1
+        job.messages += messages[_overlap(job.messages, messages):]
+        del job.messages[:-MEMORY_MAX_JOB_MESSAGES]
+        if self.store is not None:
+            # Written on the store's thread, in order, while the request returns.
+            if job.job_id is None:
+                job.job_id = uuid.uuid4().hex
+                self.store.defer(self.store.create, user_id, list(job.messages), job.job_id)
+            else:
+                self.store.defer(self.store.update_messages, job.job_id, list(job.messages))
+        if job.queued:
+            return
+        job.due_at = min(now + self.debounce_seconds, job.first_submitted + self.max_wait_seconds)
+        self._schedule(job)
+
+    def _schedule(self, job: _Job) -> None:
+        timer = self._timers.pop(job.user_id, None)
+        if timer is not None:
+            timer.cancel()
+        delay = max(0.0, job.due_at - time.monotonic())
+        self._timers[job.user_id] = self._loop.call_later(delay, self._on_due, job.user_id)
+
+    def _on_due(self, user_id: str) -> None:
+        self._timers.pop(user_id, None)
+        job = self._pending.get(user_id)
+        # A user with a pipeline in flight is re-checked when it finishes.
+        if job is not None and not job.queued and user_id not in self._running:
+            self._enqueue(job)
+
+    def _enqueue(self, job: _Job) -> None:
+        job.queued = True
+        self._ready.put_nowait(job)
+
+    def _retry_later(self, job: _Job) -> None:
+        self._retrying[job.job_id or id(job)] = job
+        self._loop.call_later(self.retry_seconds * job.attempts, self._retry, job)
+
+    def _retry(self, job: _Job) -> None:
+        if self._retrying.pop(job.job_id or id(job), None) is not None:
+            self._counters["retried"] += 1
+            self._enqueue(job)
+
+    # -- consumers ----------------------------------------------------------
+
+    async def _worker(self) -> None:
+        llm_route.set(self.route)
+        while True:
+            job = await self._ready.get()
+            user_id = job.user_id
+            if user_id in self._running:
+                # A retried or replayed job for a user whose pipeline is running.
+                self._loop.call_later(0.1, self._ready.put_nowait, job)
+                continue
+            if self._pending.get(user_id) is job:
+                del self._pending[user_id]
+            self._running.add(user_id)
+            started = time.monotonic()
+            self._wait_seconds.add(started - job.first_submitted)
+            job.attempts += 1
+            store = self.store if job.job_id else None
+            try:
+                checkpoints = await store.call(store.start_attempt, job.job_id) if store else None
+                await self.runner(user_id, job.messages, checkpoints)
+                outcome = "completed"
+                if store is not None:
+                    await _store_outcome(store, job.job_id, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Memory queue: pipeline failed for user %s", user_id)
+                outcome = "failed"
+                exhausted = job.attempts >= self.max_attempts
+                if store is not None:
+                    # A job that will never run again is deleted with its messages.
+                    await _store_outcome(store, job.job_id, None if exhausted else repr(e))
+                if not exhausted and not self._stopping:
+                    self._retry_later(job)
+            finally:
+                self._running.discard(user_id)
+                self._run_seconds.add(time.monotonic() - started)
+                newer = self._pending.get(user_id)
+                if newer is not None and not newer.queued and (
+                    self._stopping or newer.due_at <= time.monotonic()
+                ):
+                    self._enqueue(newer)
+            self._counters[outcome] += 1
+
+    # -- metrics ------------------------------------------------------------
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "pending_users": len(self._pending),
+            "retrying": len(self._retrying),
+            "queued": self._ready.qsize() if self._ready else 0,
+            "running": len(self._running),
+            "workers": len(self._worker_tasks),
+            "wait_ms": self._wait_seconds.summary(),
+            "run_ms": self._run_seconds.summary(),
+            "stored": self.store.counts() if self.store else {},
+        }
+
+
+async def _store_outcome(store: MemoryJobStore, job_id: str, error: Optional[str]) -> None:
+    """Delete a finished job, or record the `error` of one that will be retried."""
+    try:
+        if error is None:
+            await store.call(store.finish, job_id)
+        else:
+            await store.call(store.fail, job_id, error)
+    except Exception:
+        logger.exception("Memory queue: could not update job %s in the store", job_id)
+
+
+def _overlap(window: List[dict], new: List[dict]) -> int:
+    """Length of the longest tail of `window` that `new` starts with.
+
+    Clients resend the last turns of the conversation, so only that overlap is
+    dropped; a repeated "sí" or "gracias" later on is a turn of its own.
+    """
+    def turn(m: dict) -> tuple:
+        return m.get("role"), m.get("content")
+
+    for size in range(min(len(window), len(new)), 0, -1):
+        if all(turn(a) == turn(b) for a, b in zip(window[-size:], new[:size])):
+            return size
+    return 0
+
+
+class _Latency:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self) -> dict:
+        return {
+            "avg": round(1000 * self.total / self.count, 1) if self.count else 0.0,
+            "max": round(1000 * self.max, 1),
+        }
+
+
+def _run_pipeline(
+    user_id: str, messages: List[dict], checkpoints: Optional[JobCheckpoints]
+) -> Awaitable[None]:
+    return memory_service.run_memory_pipeline(user_id, messages, checkpoints)
+
+
+memory_jobs = MemoryJobQueue(_run_pipeline, store_path=MEMORY_JOB_DB)
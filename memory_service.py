@@ -1,16 +1,38 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
 import os
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING, Awaitable, List, Optional, Tuple, TypeVar
 
 import httpx
-from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
 from pydantic import BaseModel, Field
 
+from llm_hedging import build_chat_model
+import memory_gate
+from memory_index import fold
+
+if TYPE_CHECKING:
+    from memory_job_store import JobCheckpoints
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Write attempts per pipeline run when concurrent writers keep winning the CAS.
+MEMORY_UPSERT_ATTEMPTS = int(os.getenv("MEMORY_UPSERT_ATTEMPTS", "3"))
+
+# "staged": extract -> merge -> narrative (default).
+# "single": one structured call returning merged facts and narrative, with the
+# staged path as fallback when its output fails validation.
+MEMORY_PIPELINE_MODE = os.getenv("MEMORY_PIPELINE_MODE", "staged")
+
 # ---------------------------------------------------------------------------
 # Pydantic models
 # ---------------------------------------------------------------------------
@@ -41,17 +63,39 @@ class MergeResult(BaseModel):
     facts: List[MergedFact] = Field(default_factory=list)
 
 
+class CombinedFact(BaseModel):
+    text: str
+    category: str = Field(description="'hard' o 'soft'")
+    source_id: Optional[int] = Field(
+        default=None,
+        description="id del hecho existente que este hecho conserva o actualiza; "
+                    "null si es un hecho nuevo",
+    )
+
+
+class CombinedResult(BaseModel):
+    facts: List[CombinedFact] = Field(default_factory=list)
+    narrative: str = Field(
+        default="",
+        description="Resumen narrativo breve del usuario, en tercera persona",
+    )
+    changed: bool = Field(
+        default=True,
+        description="false si la conversación no aporta información personal nueva",
+    )
+
+
 # ---------------------------------------------------------------------------
 # LLM singleton
 # ---------------------------------------------------------------------------
 
-_llm_instance: Optional[ChatOpenAI] = None
+_llm_instance: Optional[BaseChatModel] = None
 
 
-def _get_llm() -> ChatOpenAI:
+def _get_llm() -> BaseChatModel:
     global _llm_instance
     if _llm_instance is None:
-        _llm_instance = ChatOpenAI(model="gpt-5.4-mini", temperature=0)
+        _llm_instance = build_chat_model("gpt-5.4-mini", "memory", temperature=0)
     return _llm_instance
 
 
@@ -82,13 +126,36 @@ async def _load_memory(user_id: str) -> dict:
         return data[0] if data else {}
 
 
-async def _upsert_memory(memory: dict) -> None:
-    """Upsert a memory row into Supabase."""
+class MemoryConflict(Exception):
+    """The memory row changed since it was read."""
+
+
+async def _upsert_memory(
+    memory: dict, expected_updated_at: Optional[str] = None, row_exists: Optional[bool] = None
+) -> None:
+    """Compare-and-swap write of a memory row into Supabase.
+
+    When the row exists it is only updated if its `updated_at` is still
+    `expected_updated_at` (null included, for rows written before the column
+    was filled); otherwise it is only inserted if none exists yet.
+    `row_exists` defaults to whether `expected_updated_at` is set.
+    Raises MemoryConflict when another writer got there first.
+    """
+    if row_exists is None:
+        row_exists = expected_updated_at is not None
     url = f"{_supabase_url()}/rest/v1/user_memory"
-    headers = {**_supabase_headers(), "Prefer": "resolution=merge-duplicates"}
+    headers = {**_supabase_headers(), "Prefer": "return=representation"}
     async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=headers, json=memory)
+        if not row_exists:
+            headers["Prefer"] += ",resolution=ignore-duplicates"
+            resp = await client.post(url, headers=headers, json=memory)
+        else:
+            updated_at = "is.null" if expected_updated_at is None else f"eq.{expected_updated_at}"
+            params = {"id": f"eq.{memory['id']}", "updated_at": updated_at}
+            resp = await client.patch(url, headers=headers, params=params, json=memory)
         resp.raise_for_status()
+        if not resp.json():
+            raise MemoryConflict(memory["id"])
 
 
 # ---------------------------------------------------------------------------
@@ -124,6 +191,91 @@ def _expire_soft_facts(facts: List[dict]) -> List[dict]:
     return kept
 
 
+# ---------------------------------------------------------------------------
+# Local merge
+# ---------------------------------------------------------------------------
+
+# Normalized similarity at or above which two same-category facts are near
+# duplicates. Only an exact normalized match is dropped locally: a near match
+# may differ in just a number or a negation ("Tiene 80 años" / "Tiene 81 años",
+# "Le gusta el fútbol" / "No le gusta el fútbol"), so it goes to the LLM merge.
+DUPLICATE_THRESHOLD = 0.9
+# Same-category facts sharing at least this share of the shorter fact's content
+# words may contradict each other ("Vive en Sevilla" / "Vive en Madrid") and
+# go to the LLM merge.
+CONFLICT_THRESHOLD = 0.5
+
+_STOPWORDS = frozenset(
+    "a al algo con de del el en es esta este estan ha la las le les lo los "
+    "me mi mis muy no o para pero por que se su sus tiene un una uno unos unas y ya".split()
+)
+
+
+def _normalize_fact(text: str) -> str:
+    """Accent- and case-folded fact text without punctuation."""
+    return fold(text)
+
+
+def _content_words(normalized: str) -> set:
+    return {w for w in normalized.split() if w not in _STOPWORDS}
+
+
+def _is_near_duplicate(a: str, b: str) -> bool:
+    return SequenceMatcher(None, a, b).ratio() >= DUPLICATE_THRESHOLD
+
+
+def _may_conflict(a: str, b: str) -> bool:
+    if _is_near_duplicate(a, b):
+        return True
+    words_a, words_b = _content_words(a), _content_words(b)
+    if not words_a or not words_b:
+        return False
+    return len(words_a & words_b) / min(len(words_a), len(words_b)) >= CONFLICT_THRESHOLD
+
+
+def _facts_hash(facts: List[dict]) -> str:
+    """Order-independent hash of a fact set (normalized text + category)."""
+    keys = sorted(f"{f.get('category', '')}|{_normalize_fact(f.get('text', ''))}" for f in facts)
+    return hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
+
+
+def _local_merge(
+    existing_facts: List[dict], new_facts: List[dict]
+) -> Tuple[List[dict], List[dict], List[dict]]:
+    """Merge what can be decided without an LLM.
+
+    Returns (merged, ambiguous_existing, ambiguous_new): exact (normalized)
+    duplicates of a known fact are dropped (the original created_at is kept),
+    clearly new facts are appended, and new facts that nearly match or may
+    contradict a same-category existing fact are set aside together with those
+    facts for the LLM merge. `merged` holds everything else.
+    """
+    known = [_normalize_fact(f.get("text", "")) for f in existing_facts]
+    seen = set(known)
+    contested: set = set()
+    clear_new: List[dict] = []
+    ambiguous_new: List[dict] = []
+
+    for fact in new_facts:
+        norm = _normalize_fact(fact.get("text", ""))
+        if not norm or norm in seen:
+            continue
+        seen.add(norm)
+        conflicts = {
+            i for i, k in enumerate(known)
+            if existing_facts[i].get("category") == fact.get("category") and _may_conflict(norm, k)
+        }
+        if conflicts:
+            contested |= conflicts
+            ambiguous_new.append(fact)
+        else:
+            clear_new.append(fact)
+
+    merged = [f for i, f in enumerate(existing_facts) if i not in contested] + clear_new
+    ambiguous_existing = [f for i, f in enumerate(existing_facts) if i in contested]
+    return merged, ambiguous_existing, ambiguous_new
+
+
 # ---------------------------------------------------------------------------
 # Stage 1: Extract
 # ---------------------------------------------------------------------------
@@ -151,7 +303,9 @@ async def _extract(messages: List[dict]) -> Optional[ExtractionResult]:
     )
 
     try:
-        result = await structured_llm.ainvoke(prompt)
+        result = await structured_llm.ainvoke(
+            prompt, config={"metadata": {"llm_node": "memory.extract"}}
+        )
         return result
     except Exception:
         logger.exception("Stage 1 (extract) failed")
@@ -184,7 +338,9 @@ async def _merge(
     )
 
     try:
-        result = await structured_llm.ainvoke(prompt)
+        result = await structured_llm.ainvoke(
+            prompt, config={"metadata": {"llm_node": "memory.merge"}}
+        )
         return result
     except Exception:
         logger.exception("Stage 2a (merge) failed")
@@ -211,79 +367,411 @@ async def _rebuild_narrative(
     )
 
     try:
-        response = await llm.ainvoke(prompt)
+        response = await llm.ainvoke(
+            prompt, config={"metadata": {"llm_node": "memory.narrative"}}
+        )
         return response.content
     except Exception:
         logger.exception("Stage 2b (narrative) failed — using fallback")
         return narrative_update
 
 
+# ---------------------------------------------------------------------------
+# Single-call mode: extract + merge + narrative
+# ---------------------------------------------------------------------------
+
+async def _extract_and_merge(
+    existing_facts: List[dict], narrative: str, messages: List[dict]
+) -> Optional[CombinedResult]:
+    """One structured call replacing the three LLM stages. None on failure."""
+    llm = _get_llm()
+    structured_llm = llm.with_structured_output(CombinedResult)
+
+    conversation_text = "\n".join(
+        f"{m.get('role', 'unknown')}: {m.get('content', '')}" for m in messages
+    )
+    facts_text = "\n".join(
+        f"[{i}] ({f.get('category', '')}) {f.get('text', '')}" for i, f in enumerate(existing_facts)
+    )
+
+    prompt = (
+        "Eres un asistente que mantiene la memoria sobre un usuario mayor. "
+        "Tienes los hechos conocidos (con su id), el resumen actual y una "
+        "conversación reciente. Debes:\n"
+        "1. Extraer los hechos personales nuevos de la conversación y "
+        "clasificarlos como 'hard' (permanentes: nombre, familia, enfermedades "
+        "crónicas, dirección) o 'soft' (preferencias, estados de ánimo, "
+        "intereses actuales).\n"
+        "2. Devolver la lista fusionada completa: conserva los hechos que no "
+        "se contradicen, si un hecho nuevo contradice uno existente quédate "
+        "con el nuevo y elimina duplicados. Indica en 'source_id' el id del "
+        "hecho existente que se conserva o actualiza, o null si es nuevo.\n"
+        "3. Escribir un resumen narrativo breve en tercera persona.\n"
+        "Si la conversación no aporta nada nuevo, devuelve changed=false.\n\n"
+        f"Hechos conocidos:\n{facts_text or '(ninguno)'}\n\n"
+        f"Resumen actual:\n{narrative or '(vacío)'}\n\n"
+        f"Conversación:\n{conversation_text}"
+    )
+
+    try:
+        return await structured_llm.ainvoke(
+            prompt, config={"metadata": {"llm_node": "memory.combined"}}
+        )
+    except Exception:
+        logger.exception("Single-call memory stage failed")
+        return None
+
+
+def _apply_combined(
+    result: CombinedResult, existing_facts: List[dict], now_iso: str
+) -> Optional[List[dict]]:
+    """Merged facts with created_at restored, or None if the output is invalid.
+
+    A fact keeps the created_at of its source when its text is unchanged and
+    gets `now_iso` otherwise (new or updated facts), as in the staged merge.
+    """
+    merged: List[dict] = []
+    for fact in result.facts:
+        if not fact.text.strip() or fact.category not in ("hard", "soft"):
+            return None
+        created_at = now_iso
+        if fact.source_id is not None:
+            if not 0 <= fact.source_id < len(existing_facts):
+                return None
+            source = existing_facts[fact.source_id]
+            if _normalize_fact(fact.text) == _normalize_fact(source.get("text", "")):
+                created_at = source.get("created_at", now_iso)
+        merged.append({"text": fact.text, "category": fact.category, "created_at": created_at})
+    return merged
+
+
+# ---------------------------------------------------------------------------
+# Stage timing
+# ---------------------------------------------------------------------------
+
+PIPELINE_STAGES = ("extract", "load", "merge", "narrative", "combined", "upsert", "total")
+
+_stage_stats: dict = {stage: {"runs": 0, "total_seconds": 0.0, "max_seconds": 0.0} for stage in PIPELINE_STAGES}
+_stage_lock = threading.Lock()
+
+
+def _record_stages(timings: dict) -> None:
+    with _stage_lock:
+        for stage, seconds in timings.items():
+            stats = _stage_stats[stage]
+            stats["runs"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def pipeline_metrics() -> dict:
+    """Per-stage run counts and latencies of the memory pipeline since process start."""
+    with _stage_lock:
+        return {
+            stage: {
+                "runs": s["runs"],
+                "avg_ms": round(1000 * s["total_seconds"] / s["runs"], 1) if s["runs"] else 0.0,
+                "max_ms": round(1000 * s["max_seconds"], 1),
+            }
+            for stage, s in _stage_stats.items()
+        } | {"gate": memory_gate.gate_stats()}
+
+
+async def _timed(timings: dict, stage: str, awaitable: Awaitable[T]) -> T:
+    # Accumulated: a conflict retry reloads, re-merges and rewrites the row.
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
 # ---------------------------------------------------------------------------
 # Pipeline
 # ---------------------------------------------------------------------------
 
-async def run_memory_pipeline(user_id: str, messages: List[dict]) -> None:
+class MemoryPipelineError(Exception):
+    """A stage failed; the job can be retried from its last checkpoint."""
+
+
+async def run_memory_pipeline(
+    user_id: str,
+    messages: List[dict],
+    checkpoints: Optional["JobCheckpoints"] = None,
+) -> None:
     """Full two-stage memory pipeline, designed to run as a background task.
 
-    Stage 1: Extract facts from the conversation.
-    Stage 2a: Merge with existing facts.
-    Stage 2b: Rebuild narrative.
+    Stage 1: Extract facts from the conversation, while the existing memory
+             is loaded from Supabase (the two do not depend on each other).
+    Stage 2a: Merge with existing facts (locally; LLM only for conflicts).
+    Stage 2b: Rebuild narrative (skipped when the fact set is unchanged).
     Finally: Upsert to Supabase.
+
+    With MEMORY_PIPELINE_MODE=single the three LLM stages are replaced by one
+    call; if that output fails validation the staged path runs instead.
+
+    A local keyword gate (memory_gate) runs first and skips the whole
+    pipeline when the user's messages are unlikely to contain anything to
+    remember.
+
+    With `checkpoints` (see memory_job_store) each completed stage output is
+    saved and a retried job skips the stages it already completed. A failed
+    stage raises MemoryPipelineError so the caller can retry.
+
+    Stage latencies are recorded and exposed by `pipeline_metrics()`.
     """
-    # Stage 1 — Extract
-    extraction = await _extract(messages)
-    if extraction is None:
-        logger.warning("Memory pipeline aborted: extraction failed")
-        return
+    timings: dict = {}
+    started = time.perf_counter()
+    try:
+        await _run_stages(user_id, messages, timings, checkpoints)
+    finally:
+        timings["total"] = time.perf_counter() - started
+        _record_stages(timings)
+        logger.info(
+            "Memory pipeline timings (ms): %s",
+            {stage: round(seconds * 1000) for stage, seconds in timings.items()},
+        )
 
-    if not extraction.new_facts and not extraction.narrative_update:
-        logger.info("Memory pipeline: nothing new to store")
-        return
 
-    # Stamp created_at on new facts (Python-set, NOT LLM)
-    now_iso = datetime.now(timezone.utc).isoformat()
-    new_facts = [
-        {
-            "text": f.text,
-            "category": f.category,
-            "created_at": now_iso,
-        }
-        for f in extraction.new_facts
-    ]
+async def _cancel(task: asyncio.Task) -> None:
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
 
-    # Load existing memory from Supabase
+async def _loaded_memory(load_task: asyncio.Task) -> dict:
     try:
-        existing_memory = await _load_memory(user_id)
+        return await load_task
     except Exception:
         logger.exception("Memory pipeline: failed to load existing memory")
-        existing_memory = {}
+        return {}
+
+
+def _checkpoint(checkpoints: Optional["JobCheckpoints"], stage: str) -> Optional[dict]:
+    return checkpoints.get(stage) if checkpoints is not None else None
+
+
+def _save_checkpoint(checkpoints: Optional["JobCheckpoints"], stage: str, output: dict) -> None:
+    if checkpoints is not None:
+        checkpoints.save(stage, output)
+
+
+async def _run_stages(
+    user_id: str, messages: List[dict], timings: dict, checkpoints: Optional["JobCheckpoints"]
+) -> None:
+    if checkpoints is None or not checkpoints.stages:
+        decision = memory_gate.evaluate(messages)
+        memory_gate.record(decision)
+        if not decision.extract:
+            logger.info("Memory pipeline: gate skipped extraction (score %.1f)", decision.score)
+            return
+    load_task = asyncio.create_task(_timed(timings, "load", _load_memory(user_id)))
+    if MEMORY_PIPELINE_MODE == "single" and _checkpoint(checkpoints, "extract") is None:
+        if await _run_single_call(user_id, messages, load_task, timings, checkpoints):
+            return
+        logger.warning("Memory pipeline: single-call output invalid, using staged path")
+    await _run_staged(user_id, messages, load_task, timings, checkpoints)
+
+
+async def _run_single_call(
+    user_id: str,
+    messages: List[dict],
+    load_task: asyncio.Task,
+    timings: dict,
+    checkpoints: Optional["JobCheckpoints"],
+) -> bool:
+    """Single-call mode. Returns False when the staged path should run instead."""
+    existing_memory = await _loaded_memory(load_task)
+    saved = _checkpoint(checkpoints, "combined")
+    if saved is not None:
+        await _store(
+            user_id,
+            existing_memory,
+            saved["new_facts"],
+            saved["narrative"],
+            timings,
+            checkpoints,
+            first_attempt=saved,
+        )
+        return True
+
+    existing_facts = _expire_soft_facts(existing_memory.get("facts", []))
+    previous_narrative = existing_memory.get("narrative", "")
+
+    result = await _timed(
+        timings, "combined", _extract_and_merge(existing_facts, previous_narrative, messages)
+    )
+    if result is None:
+        return False
+    if not result.changed:
+        logger.info("Memory pipeline: nothing new to store")
+        return True
 
-    existing_facts: List[dict] = existing_memory.get("facts", [])
+    now_iso = datetime.now(timezone.utc).isoformat()
+    merged_facts = _apply_combined(result, existing_facts, now_iso)
+    if merged_facts is None:
+        return False
 
-    # Expire soft facts
-    existing_facts = _expire_soft_facts(existing_facts)
+    # If the CAS write loses, the facts this call added or changed are merged
+    # into the fresh row like extracted facts.
+    combined = {
+        "facts": merged_facts,
+        "narrative": result.narrative or previous_narrative,
+        "new_facts": [f for f in merged_facts if f["created_at"] == now_iso],
+        "based_on": existing_memory.get("updated_at"),
+    }
+    _save_checkpoint(checkpoints, "combined", combined)
+    await _store(
+        user_id,
+        existing_memory,
+        combined["new_facts"],
+        result.narrative,
+        timings,
+        checkpoints,
+        first_attempt=combined,
+    )
+    return True
+
+
+async def _run_staged(
+    user_id: str,
+    messages: List[dict],
+    load_task: asyncio.Task,
+    timings: dict,
+    checkpoints: Optional["JobCheckpoints"],
+) -> None:
+    extracted = _checkpoint(checkpoints, "extract")
+    if extracted is None:
+        try:
+            # Stage 1 — Extract
+            extraction = await _timed(timings, "extract", _extract(messages))
+        except BaseException:
+            await _cancel(load_task)
+            raise
+        if extraction is None:
+            await _cancel(load_task)
+            raise MemoryPipelineError("extraction failed")
+
+        # Stamp created_at on new facts (Python-set, NOT LLM)
+        now_iso = datetime.now(timezone.utc).isoformat()
+        extracted = {
+            "new_facts": [
+                {
+                    "text": f.text,
+                    "category": f.category,
+                    "created_at": now_iso,
+                }
+                for f in extraction.new_facts
+            ],
+            "narrative_update": extraction.narrative_update,
+        }
+        _save_checkpoint(checkpoints, "extract", extracted)
 
-    # Stage 2a — Merge
-    merge_result = await _merge(existing_facts, new_facts)
-    if merge_result is None:
-        logger.warning("Memory pipeline aborted: merge failed")
-        return  # Do NOT continue to upsert
+    if not extracted["new_facts"] and not extracted["narrative_update"]:
+        await _cancel(load_task)
+        logger.info("Memory pipeline: nothing new to store")
+        return
 
-    merged_facts = [f.dict() for f in merge_result.facts]
+    # Existing memory, loaded from Supabase alongside Stage 1
+    existing_memory = await _loaded_memory(load_task)
+    await _store(
+        user_id,
+        existing_memory,
+        extracted["new_facts"],
+        extracted["narrative_update"],
+        timings,
+        checkpoints,
+        first_attempt=_checkpoint(checkpoints, "merged"),
+    )
 
-    # Stage 2b — Narrative
-    narrative = await _rebuild_narrative(merged_facts, extraction.narrative_update)
 
-    # Upsert to Supabase
-    memory_row = {
-        "id": user_id,
-        "facts": merged_facts,
-        "narrative": narrative,
-        "updated_at": now_iso,
-    }
+async def _merge_into(
+    existing_memory: dict, new_facts: List[dict], narrative_update: str, timings: dict
+) -> Optional[Tuple[List[dict], str]]:
+    """Stages 2a/2b against one version of the stored row. None if the merge failed."""
+    loaded_facts: List[dict] = existing_memory.get("facts", [])
 
-    try:
-        await _upsert_memory(memory_row)
-        logger.info("Memory pipeline: upserted memory for user %s", user_id)
-    except Exception:
-        logger.exception("Memory pipeline: upsert failed (silently discarded)")
+    # Expire soft facts
+    existing_facts = _expire_soft_facts(loaded_facts)
+
+    # Stage 2a — Merge: dedupe locally, LLM only for possible contradictions
+    merged_facts, ambiguous_existing, ambiguous_new = _local_merge(existing_facts, new_facts)
+    if ambiguous_new:
+        merge_result = await _timed(timings, "merge", _merge(ambiguous_existing, ambiguous_new))
+        if merge_result is None:
+            return None
+        merged_facts += [f.model_dump() for f in merge_result.facts]
+
+    # Stage 2b — Narrative, only when the fact set actually changed
+    previous_narrative = existing_memory.get("narrative", "")
+    if previous_narrative and _facts_hash(merged_facts) == _facts_hash(loaded_facts):
+        logger.info("Memory pipeline: facts unchanged, keeping narrative")
+        narrative = previous_narrative
+    else:
+        narrative = await _timed(
+            timings, "narrative", _rebuild_narrative(merged_facts, narrative_update)
+        )
+    return merged_facts, narrative
+
+
+async def _store(
+    user_id: str,
+    existing_memory: dict,
+    new_facts: List[dict],
+    narrative_update: str,
+    timings: dict,
+    checkpoints: Optional["JobCheckpoints"] = None,
+    first_attempt: Optional[dict] = None,
+) -> None:
+    """Merge and write with optimistic concurrency.
+
+    The write is conditioned on the `updated_at` that was read. When another
+    pipeline wrote in between, the row is reloaded, `new_facts` are merged
+    into it again and the write is retried, up to MEMORY_UPSERT_ATTEMPTS times.
+    `first_attempt` is an already merged {"facts", "narrative", "based_on"};
+    it is used only if the stored row is still the version it was merged from.
+    """
+    for attempt in range(1, MEMORY_UPSERT_ATTEMPTS + 1):
+        if first_attempt and first_attempt.get("based_on") == existing_memory.get("updated_at"):
+            merged = first_attempt["facts"], first_attempt["narrative"]
+        else:
+            merged = await _merge_into(existing_memory, new_facts, narrative_update, timings)
+            if merged is None:
+                raise MemoryPipelineError("merge failed")
+            _save_checkpoint(
+                checkpoints,
+                "merged",
+                {"facts": merged[0], "narrative": merged[1], "based_on": existing_memory.get("updated_at")},
+            )
+        first_attempt = None
+        merged_facts, narrative = merged
+
+        # Upsert to Supabase
+        memory_row = {
+            "id": user_id,
+            "facts": merged_facts,
+            "narrative": narrative,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            await _timed(
+                timings,
+                "upsert",
+                _upsert_memory(
+                    memory_row, existing_memory.get("updated_at"), row_exists=bool(existing_memory)
+                ),
+            )
+            logger.info("Memory pipeline: upserted memory for user %s", user_id)
+            return
+        except MemoryConflict:
+            logger.info(
+                "Memory pipeline: concurrent update for user %s (attempt %d), re-merging",
+                user_id,
+                attempt,
+            )
+        except Exception as e:
+            raise MemoryPipelineError("upsert failed") from e
+        try:
+            existing_memory = await _timed(timings, "load", _load_memory(user_id))
+        except Exception as e:
+            raise MemoryPipelineError("failed to reload memory after conflict") from e
+    raise MemoryPipelineError(f"gave up after {MEMORY_UPSERT_ATTEMPTS} conflicting writes")
@@ -0,0 +1,555 @@
+"""Helpers and metrics for the /realtime/ws relay (main.py).
+
+- Setup: upstream connect and context fetch run concurrently; `timed_phase`
+  records auth, context, connect, session_update and ready latencies.
+- Parsing: `parse_tool_event` decodes only the few event types that can carry
+  a function call; audio deltas are relayed without being parsed.
+- Binary audio framing: raw PCM16 both ways instead of base64 JSON
+  (`audio_append_event`, `BinaryAudioFramer`).
+- Backpressure: a bounded `RelayQueue` per direction drops stale audio,
+  never control events.
+- Reconnects: `reconnect_upstream` resumes the session from `SessionReplay`.
+- Tools: `RealtimeToolCalls` runs backend function calls in the background.
+
+`stats()` backs the "realtime" section of GET /metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import orjson
+
+from llm_metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Deadline for one backend tool call; past it the model gets an error output.
+# Each tool also has its own, shorter, timeout in tool_registry.
+REALTIME_TOOL_CALL_TIMEOUT_SECONDS = float(os.getenv("REALTIME_TOOL_CALL_TIMEOUT_SECONDS", "60"))
+# Per-direction queue bounds; 4 MiB is about a minute of base64 PCM16 audio.
+REALTIME_QUEUE_MAX_BYTES = int(os.getenv("REALTIME_QUEUE_MAX_BYTES", str(4 * 1024 * 1024)))
+REALTIME_QUEUE_MAX_MESSAGES = int(os.getenv("REALTIME_QUEUE_MAX_MESSAGES", "1024"))
+REALTIME_RECONNECT_ATTEMPTS = int(os.getenv("REALTIME_RECONNECT_ATTEMPTS", "4"))
+# Wait before retry n is base * 2**(n-1); the first reconnect is immediate.
+REALTIME_RECONNECT_DELAY_SECONDS = float(os.getenv("REALTIME_RECONNECT_DELAY_SECONDS", "0.5"))
+# Conversation items re-created upstream after a reconnect.
+REALTIME_REPLAY_ITEMS = int(os.getenv("REALTIME_REPLAY_ITEMS", "20"))
+
+SETUP_PHASES = ("auth", "context", "connect", "session_update", "ready")
+# Latency samples kept per phase for percentiles.
+MAX_SAMPLES = 512
+
+
+# Upstream events that can carry a function call (see
+# main._extract_realtime_function_call); the only ones the relay decodes.
+TOOL_EVENT_TYPES = frozenset(
+    {
+        "response.output_item.done",
+        "conversation.item.created",
+        "response.function_call_arguments.done",
+    }
+)
+
+# Upstream events carrying a base64 PCM16 chunk of assistant audio.
+AUDIO_DELTA_TYPES = frozenset({"response.output_audio.delta", "response.audio.delta"})
+# Audio events a full relay queue may drop, by direction of travel.
+DROPPABLE_TYPES = AUDIO_DELTA_TYPES | {"input_audio_buffer.append"}
+
+# The sniff only looks at the first chars, where the top-level keys are.
+_SNIFF_CHARS = 160
+_TYPE_FIELD = re.compile(r'"type"\s*:\s*"([^"\\]+)"')
+
+
+def sniff_event_type(message: str) -> Optional[str]:
+    """The top-level event `type` read from the message prefix, or None.
+
+    The match only counts when nothing before it opens a nested object or
+    array, so an inner `"type"` (e.g. `item.type`) is never taken for the
+    event's.
+    """
+    start = message.find("{", 0, _SNIFF_CHARS)
+    if start < 0:
+        return None
+    match = _TYPE_FIELD.search(message, start + 1, _SNIFF_CHARS)
+    if match is None:
+        return None
+    prefix = message[start + 1 : match.start()]
+    if "{" in prefix or "[" in prefix:
+        return None
+    return match.group(1)
+
+
+# Events SessionReplay learns conversation items from (a superset of the above).
+REPLAY_EVENT_TYPES = TOOL_EVENT_TYPES | {
+    "conversation.item.added",
+    "conversation.item.input_audio_transcription.completed",
+}
+
+
+def parse_tool_event(message: str, types: frozenset = TOOL_EVENT_TYPES) -> Optional[dict]:
+    """The decoded event if it may carry a function call, else None.
+
+    `types` widens the set of decoded events (e.g. REPLAY_EVENT_TYPES).
+
+    Messages whose type cannot be sniffed are parsed, so an upstream change of
+    key order costs CPU but never loses a tool call.
+    """
+    event_type = sniff_event_type(message)
+    if event_type is not None and event_type not in types:
+        return None
+    try:
+        payload = orjson.loads(message)
+    except orjson.JSONDecodeError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+_DELTA_FIELD = re.compile(r'"delta"\s*:\s*"([A-Za-z0-9+/=]*)"')
+
+
+def audio_append_event(pcm: bytes) -> str:
+    """Upstream `input_audio_buffer.append` event for a raw PCM16 frame."""
+    return '{"type":"input_audio_buffer.append","audio":"' + base64.b64encode(pcm).decode("ascii") + '"}'
+
+
+def split_audio_delta(message: str) -> Optional[tuple[dict, bytes]]:
+    """(event without its delta, raw PCM16) of an upstream audio delta event.
+
+    None for other events. Only the short rest of the event is JSON-decoded.
+    """
+    if sniff_event_type(message) not in AUDIO_DELTA_TYPES:
+        return None
+    # Base64 has no quotes or escapes, so the field can be cut out as is.
+    match = _DELTA_FIELD.search(message)
+    try:
+        if match is not None:
+            event = orjson.loads(message[: match.start()] + '"delta":""' + message[match.end():])
+            return event, base64.b64decode(match.group(1))
+        event = orjson.loads(message)
+        delta = event.get("delta")
+        return (event, base64.b64decode(delta)) if isinstance(delta, str) else None
+    except (binascii.Error, orjson.JSONDecodeError, AttributeError):
+        return None
+
+
+AUDIO_ITEM_FIELDS = ("response_id", "item_id", "output_index", "content_index")
+
+
+class BinaryAudioFramer:
+    """Downstream frames for upstream audio deltas with binary framing.
+
+    `frames(message)` is None for events that are not audio deltas. For a
+    delta it is its PCM16 as a binary frame, preceded by a
+    `{"type": "relay.audio_item", "response_id", "item_id", ...}` text frame
+    whenever the delta belongs to another item than the previous one.
+    """
+
+    def __init__(self) -> None:
+        self._current: Optional[tuple] = None
+
+    def frames(self, message: str) -> Optional[list]:
+        split = split_audio_delta(message)
+        if split is None:
+            return None
+        event, pcm = split
+        key = tuple(event.get(field) for field in AUDIO_ITEM_FIELDS)
+        if key == self._current:
+            return [pcm]
+        self._current = key
+        header = {"type": "relay.audio_item", **dict(zip(AUDIO_ITEM_FIELDS, key))}
+        return [orjson.dumps(header).decode(), pcm]
+
+
+def is_droppable(message) -> bool:
+    """Whether a relayed message is audio that may be dropped when late."""
+    return isinstance(message, bytes) or sniff_event_type(message) in DROPPABLE_TYPES
+
+
+QUEUE_STATS = ("messages", "bytes", "dropped", "dropped_bytes", "waits", "max_depth", "max_depth_bytes")
+
+
+class RelayQueue:
+    """Bounded FIFO of text/binary frames for one relay direction.
+
+    `put` never blocks for audio: when the queue is over `max_bytes` or
+    `max_messages`, the oldest queued audio is dropped to make room, and if
+    only control events are queued the new audio chunk itself is dropped.
+    Control events wait for room (backpressure on the reading socket).
+    `close()` lets the consumer drain what is queued and then get None.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = REALTIME_QUEUE_MAX_BYTES,
+        max_messages: int = REALTIME_QUEUE_MAX_MESSAGES,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self._items: deque = deque()
+        self._bytes = 0
+        self._closed = False
+        self._changed = asyncio.Condition()
+        self.stats = dict.fromkeys(QUEUE_STATS, 0)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def depth_bytes(self) -> int:
+        return self._bytes
+
+    def _full(self, size: int) -> bool:
+        return bool(self._items) and (
+            len(self._items) >= self.max_messages or self._bytes + size > self.max_bytes
+        )
+
+    def _drop_oldest_audio(self) -> bool:
+        for i, (message, size, droppable) in enumerate(self._items):
+            if droppable:
+                del self._items[i]
+                self._bytes -= size
+                self._count_drop(size)
+                return True
+        return False
+
+    def _count_drop(self, size: int) -> None:
+        self.stats["dropped"] += 1
+        self.stats["dropped_bytes"] += size
+
+    async def put(self, message) -> None:
+        size = len(message)
+        droppable = is_droppable(message)
+        async with self._changed:
+            while self._full(size) and self._drop_oldest_audio():
+                pass
+            if self._full(size):
+                if droppable:
+                    self._count_drop(size)
+                    return
+                self.stats["waits"] += 1
+                await self._changed.wait_for(lambda: self._closed or not self._full(size))
+            if self._closed:
+                return
+            self._items.append((message, size, droppable))
+            self._bytes += size
+            self.stats["messages"] += 1
+            self.stats["bytes"] += size
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._items))
+            self.stats["max_depth_bytes"] = max(self.stats["max_depth_bytes"], self._bytes)
+            self._changed.notify_all()
+
+    async def get(self):
+        """Next frame, or None once the queue is closed and drained."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._items or self._closed)
+            if not self._items:
+                return None
+            message, size, _ = self._items.popleft()
+            self._bytes -= size
+            self._changed.notify_all()
+            return message
+
+    async def close(self) -> None:
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+class SessionReplay:
+    """What a fresh upstream connection needs to resume a session.
+
+    Keeps the backend's `session.update`, any the browser sent later, and the
+    last `max_items` conversation items seen upstream (messages with their
+    text or transcript, function calls and their outputs).
+    """
+
+    def __init__(self, session_update: str, max_items: Optional[int] = None) -> None:
+        self.session_update = session_update
+        self.max_items = REALTIME_REPLAY_ITEMS if max_items is None else max_items
+        self.client_updates: deque = deque(maxlen=4)
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+
+    def observe_client(self, message) -> None:
+        if isinstance(message, str) and sniff_event_type(message) == "session.update":
+            self.client_updates.append(message)
+
+    def observe(self, event: dict) -> None:
+        if event.get("type") == "conversation.item.input_audio_transcription.completed":
+            item = self._items.get(str(event.get("item_id")))
+            if item is not None:
+                item["transcript"] = event.get("transcript") or ""
+            return
+        item = event.get("item")
+        if not isinstance(item, dict) or not item.get("id"):
+            return
+        entry = _replay_entry(item)
+        if entry is None:
+            return
+        previous = self._items.pop(item["id"], None)
+        if previous and not entry.get("transcript"):
+            entry["transcript"] = previous.get("transcript", "")
+        self._items[item["id"]] = entry
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def events(self) -> list[str]:
+        """Messages to send, in order, on a new upstream connection."""
+        out = [self.session_update, *self.client_updates]
+        for entry in self._items.values():
+            item = _replay_item(entry)
+            if item is not None:
+                out.append(orjson.dumps({"type": "conversation.item.create", "item": item}).decode())
+        return out
+
+
+def _replay_entry(item: dict) -> Optional[dict]:
+    item_type = item.get("type")
+    if item_type == "message":
+        parts = [p for p in item.get("content") or [] if isinstance(p, dict)]
+        text = " ".join(str(p.get("text") or p.get("transcript") or "") for p in parts).strip()
+        return {"type": "message", "role": item.get("role"), "transcript": text}
+    if item_type == "function_call":
+        return {k: item.get(k) for k in ("type", "call_id", "name", "arguments")}
+    if item_type == "function_call_output":
+        return {k: item.get(k) for k in ("type", "call_id", "output")}
+    return None
+
+
+def _replay_item(entry: dict) -> Optional[dict]:
+    if entry["type"] != "message":
+        return entry
+    if not entry["transcript"] or entry["role"] not in ("user", "assistant"):
+        return None
+    part_type = "input_text" if entry["role"] == "user" else "text"
+    return {
+        "type": "message",
+        "role": entry["role"],
+        "content": [{"type": part_type, "text": entry["transcript"]}],
+    }
+
+
+async def reconnect_upstream(connect: Callable[[], Awaitable], replay: SessionReplay):
+    """Open a new upstream connection and resume the session on it.
+
+    Tries REALTIME_RECONNECT_ATTEMPTS times with exponential backoff and
+    re-raises the last error when every attempt fails.
+    """
+    attempts = max(1, REALTIME_RECONNECT_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        try:
+            upstream = await connect()
+        except Exception:
+            if attempt == attempts:
+                raise
+            logger.warning("Realtime reconnect attempt %d failed", attempt, exc_info=True)
+            await asyncio.sleep(REALTIME_RECONNECT_DELAY_SECONDS * 2 ** (attempt - 1))
+            continue
+        try:
+            for message in replay.events():
+                await upstream.send(message)
+        except BaseException:
+            await upstream.close()
+            raise
+        return upstream
+
+
+def _summary(samples) -> dict:
+    return {
+        "p50": percentile(samples, 0.5),
+        "p95": percentile(samples, 0.95),
+        "max": round(max(samples), 1) if samples else None,
+    }
+
+
+async def timed_phase(phases: dict, name: str, awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, storing its wall time in ms under `phases[name]`."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        phases[name] = (time.perf_counter() - started) * 1000
+
+
+async def discard_connection(connect_task: asyncio.Task) -> None:
+    """Cancel a pending upstream connect, or close the connection it opened."""
+    connect_task.cancel()
+    [result] = await asyncio.gather(connect_task, return_exceptions=True)
+    if not isinstance(result, BaseException):
+        await result.close()
+
+
+class RelayMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {
+            "sessions": 0,
+            "setup_failures": 0,
+            "tool_calls": 0,
+            "tool_timeouts": 0,
+            "tool_errors": 0,
+            "tool_cancelled": 0,
+            "tool_outputs_resent": 0,
+            "reconnects": 0,
+            "reconnect_failures": 0,
+        }
+        self._setup_ms = {phase: deque(maxlen=MAX_SAMPLES) for phase in SETUP_PHASES}
+        self._reconnect_ms: deque = deque(maxlen=MAX_SAMPLES)
+        self._queue_totals = {
+            direction: dict.fromkeys(QUEUE_STATS, 0) for direction in ("upstream", "downstream")
+        }
+        self._live: dict[int, dict[str, RelayQueue]] = {}
+
+    def record_setup(self, phases: dict) -> None:
+        with self._lock:
+            self._counters["sessions"] += 1
+            for phase, ms in phases.items():
+                if phase in self._setup_ms:
+                    self._setup_ms[phase].append(ms)
+
+    def record_reconnect(self, ms: float) -> None:
+        with self._lock:
+            self._counters["reconnects"] += 1
+            self._reconnect_ms.append(ms)
+
+    def record_setup_failure(self) -> None:
+        self.count("setup_failures")
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def open_relay(self, queues: dict[str, RelayQueue]) -> None:
+        """Track a session's {"upstream": q, "downstream": q} while it relays."""
+        with self._lock:
+            self._live[id(queues)] = queues
+
+    def close_relay(self, queues: dict[str, RelayQueue]) -> None:
+        """Add the session's queue counters to the totals."""
+        with self._lock:
+            self._live.pop(id(queues), None)
+            for direction, queue in queues.items():
+                totals = self._queue_totals[direction]
+                for key, value in queue.stats.items():
+                    if key.startswith("max_"):
+                        totals[key] = max(totals[key], value)
+                    else:
+                        totals[key] += value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "setup_ms": {phase: _summary(samples) for phase, samples in self._setup_ms.items()},
+                "reconnect_ms": _summary(self._reconnect_ms),
+                "active_relays": len(self._live),
+                "queues": {
+                    direction: {
+                        **totals,
+                        "depth": sum(len(q[direction]) for q in self._live.values()),
+                        "depth_bytes": sum(q[direction].depth_bytes for q in self._live.values()),
+                    }
+                    for direction, totals in self._queue_totals.items()
+                },
+            }
+
+
+relay_metrics = RelayMetrics()
+
+
+class RealtimeToolCalls:
+    """Backend-executed function calls of one relay session.
+
+    `dispatch` starts a call in the background and returns immediately;
+    repeated events for the same call_id are ignored. `execute(call)` returns
+    the tool output and `send(call, output)` delivers it upstream; sends are
+    serialised so each output is followed by its own `response.create`.
+
+    A call that times out or raises is answered with an error output. Outputs
+    whose send raised are kept and `resend_unsent()` delivers them once the
+    upstream has been reconnected.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[dict], Awaitable[str]],
+        send: Callable[[dict, str], Awaitable[None]],
+        timeout: float = REALTIME_TOOL_CALL_TIMEOUT_SECONDS,
+    ) -> None:
+        self.execute = execute
+        self.send = send
+        self.timeout = timeout
+        self._call_ids: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+        self._unsent: list[tuple[dict, str]] = []
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    def dispatch(self, tool_call: dict) -> bool:
+        call_id = str(tool_call["call_id"])
+        if call_id in self._call_ids:
+            return False
+        self._call_ids.add(call_id)
+        task = asyncio.create_task(self._run(tool_call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        relay_metrics.count("tool_calls")
+        return True
+
+    @property
+    def unsent(self) -> int:
+        return len(self._unsent)
+
+    async def _run(self, tool_call: dict) -> None:
+        name = tool_call.get("name")
+        try:
+            output = await asyncio.wait_for(self.execute(tool_call), self.timeout)
+        except asyncio.TimeoutError:
+            relay_metrics.count("tool_timeouts")
+            logger.warning("Realtime tool %s timed out", name)
+            output = f"Error: la herramienta {name} no ha respondido a tiempo y no se sabe si se ha completado."
+        except Exception as e:
+            relay_metrics.count("tool_errors")
+            logger.exception("Realtime tool %s failed", name)
+            output = f"Error ejecutando {name}: {e}"
+        async with self._send_lock:
+            await self._send(tool_call, output)
+
+    async def _send(self, tool_call: dict, output: str) -> bool:
+        try:
+            await self.send(tool_call, output)
+            return True
+        except Exception:
+            logger.warning("Realtime tool %s output not sent; kept for resend", tool_call.get("name"))
+            self._unsent.append((tool_call, output))
+            return False
+
+    async def resend_unsent(self) -> None:
+        """Send the outputs whose send failed, e.g. once the upstream is back."""
+        async with self._send_lock:
+            pending, self._unsent = self._unsent, []
+            for tool_call, output in pending:
+                if await self._send(tool_call, output):
+                    relay_metrics.count("tool_outputs_resent")
+
+    async def cancel_all(self) -> None:
+        """Cancel the calls still running (the session is closing)."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+            relay_metrics.count("tool_cancelled")
+        await asyncio.gather(*tasks, return_exceptions=True)
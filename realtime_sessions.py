@@ -0,0 +1,119 @@
+"""Short-lived handles to the tool context of a realtime voice session.
+
+With `tool_call_handler: "frontend"` the browser runs function calls through
+POST /realtime/tool, which used to fetch the user and tutor profiles from
+Supabase on every call. /realtime/session (when asked for the frontend
+handler) or the /realtime/ws init now resolve that context once and keep it
+here; the browser gets back a signed handle (`session_token`) and passes it
+to /realtime/tool, which reads the context from memory. A handle from
+/realtime/session sent in the /realtime/ws init is reused by the relay, and
+the relay revokes its handle when the socket closes.
+
+A handle is `<session id>.<expiry>.<signature>`, HMAC-SHA256 over the id, the
+expiry and the owning user_id. It is only a reference: the context never
+leaves the server, a handle is useless to any other user, and it stops
+resolving after REALTIME_SESSION_TTL_SECONDS or once evicted (the store keeps
+at most REALTIME_SESSION_MAX_ENTRIES, oldest first). The store is per process;
+a handle minted by another worker simply misses and /realtime/tool falls back
+to fetching the context.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+REALTIME_SESSION_TTL_SECONDS = float(os.getenv("REALTIME_SESSION_TTL_SECONDS", "1800"))
+REALTIME_SESSION_MAX_ENTRIES = int(os.getenv("REALTIME_SESSION_MAX_ENTRIES", "10000"))
+# Without a configured secret every process signs with its own random key,
+# which is enough for a per-process store.
+REALTIME_SESSION_SECRET = os.getenv("REALTIME_SESSION_SECRET", "")
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+class RealtimeSessionStore:
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        secret: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ttl_seconds = REALTIME_SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = REALTIME_SESSION_MAX_ENTRIES if max_entries is None else max_entries
+        secret = REALTIME_SESSION_SECRET if secret is None else secret
+        self._key = secret.encode("utf-8") if secret else secrets.token_bytes(32)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # session id -> (user_id, expires_at, context)
+        self._entries: OrderedDict[str, tuple[str, int, dict]] = OrderedDict()
+        self._stats = {"minted": 0, "hits": 0, "misses": 0, "invalid": 0, "expired": 0, "evicted": 0}
+
+    def _sign(self, session_id: str, expires_at: int, user_id: str) -> str:
+        message = f"{session_id}.{expires_at}.{user_id}".encode("utf-8")
+        return _b64(hmac.new(self._key, message, hashlib.sha256).digest())
+
+    def mint(self, user_id: str, context: dict) -> str:
+        """Store `context` for `user_id` and return its signed handle."""
+        session_id = _b64(secrets.token_bytes(16))
+        expires_at = int(self._clock() + self.ttl_seconds)
+        with self._lock:
+            self._entries[session_id] = (user_id, expires_at, context)
+            self._stats["minted"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+        return f"{session_id}.{expires_at}.{self._sign(session_id, expires_at, user_id)}"
+
+    def _verify(self, handle: str, user_id: str) -> Optional[tuple[str, int]]:
+        try:
+            session_id, expires, signature = handle.split(".")
+            expires_at = int(expires)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(signature, self._sign(session_id, expires_at, user_id)):
+            return None
+        return session_id, expires_at
+
+    def resolve(self, handle: Optional[str], user_id: str) -> Optional[dict]:
+        """The context behind `handle`, or None if it is not valid for `user_id`."""
+        if not handle:
+            return None
+        verified = self._verify(handle, user_id)
+        with self._lock:
+            if verified is None:
+                self._stats["invalid"] += 1
+                return None
+            session_id, expires_at = verified
+            if expires_at <= self._clock():
+                self._stats["expired"] += 1
+                self._entries.pop(session_id, None)
+                return None
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return entry[2]
+
+    def revoke(self, handle: Optional[str]) -> None:
+        if handle:
+            with self._lock:
+                self._entries.pop(handle.split(".", 1)[0], None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "active": len(self._entries)}
+
+
+realtime_sessions = RealtimeSessionStore()
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _app_storage_in_tmp_path(tmp_path, monkeypatch) -> None:
+    """Apps started by TestClient keep their conversation checkpoints and memory jobs under tmp_path."""
+    import conversation_store
+    import memory_queue
+
+    monkeypatch.setattr(
+        conversation_store, "CHAT_CHECKPOINT_URL", f"sqlite:///{tmp_path / 'conversations.sqlite'}"
+    )
+    monkeypatch.setattr(memory_queue.memory_jobs, "store_path", str(tmp_path / "memory_jobs.sqlite"))
@@ -250,6 +250,7 @@ def test_chat_endpoint_passes_coordinates_to_chatbot(monkeypatch) -> None:
         tutor_profile: dict | None = None,
         user_memory: dict | None = None,
         user_location: dict | None = None,
+        conversation_id: str | None = None,
     ) -> str:
         captured["message"] = message
         captured["user_location"] = user_location
@@ -293,6 +294,7 @@ def test_chat_stream_endpoint_passes_coordinates_to_chatbot(monkeypatch) -> None
         tutor_profile: dict | None = None,
         user_memory: dict | None = None,
         user_location: dict | None = None,
+        conversation_id: str | None = None,
     ):
         captured["message"] = message
         captured["user_location"] = user_location
@@ -0,0 +1,115 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+
+class _RecordingLLM:
+    """Fake chat model that answers with the number of user messages it saw."""
+
+    def __init__(self) -> None:
+        self.seen: list[list] = []
+
+    def invoke(self, messages):
+        self.seen.append(messages)
+        users = [m for m in messages if isinstance(m, HumanMessage)]
+        return AIMessage(content=f"Respuesta {len(users)}")
+
+
+@pytest.fixture
+def conversations(monkeypatch):
+    import chatbot
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    llm = _RecordingLLM()
+    monkeypatch.setattr(chatbot, "llm_with_tools", llm)
+    chatbot.enable_conversations(InMemorySaver())
+    yield llm
+    chatbot.enable_conversations(None)
+
+
+@pytest.mark.asyncio
+async def test_second_turn_sees_stored_history_without_client_history(conversations) -> None:
+    import chatbot
+
+    profile = {"id": "user-1", "name": "Carmen"}
+    first = await chatbot.chatbot_async("Hola", user_profile=profile, conversation_id="c1")
+    second = await chatbot.chatbot_async("¿Te acuerdas?", user_profile=profile, conversation_id="c1")
+
+    assert first == "Respuesta 1"
+    assert second == "Respuesta 2"
+    assert await chatbot.get_conversation("user-1", "c1") == [
+        {"role": "user", "content": "Hola"},
+        {"role": "assistant", "content": "Respuesta 1"},
+        {"role": "user", "content": "¿Te acuerdas?"},
+        {"role": "assistant", "content": "Respuesta 2"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_conversations_are_isolated_per_user(conversations) -> None:
+    import chatbot
+
+    await chatbot.chatbot_async("Hola", user_profile={"id": "user-1"}, conversation_id="c1")
+    other = await chatbot.chatbot_async("Hola", user_profile={"id": "user-2"}, conversation_id="c1")
+
+    assert other == "Respuesta 1"
+    await chatbot.delete_conversation("user-1", "c1")
+    assert await chatbot.get_conversation("user-1", "c1") == []
+    assert len(await chatbot.get_conversation("user-2", "c1")) == 2
+
+
+@pytest.mark.asyncio
+async def test_long_conversations_are_compacted(conversations, monkeypatch) -> None:
+    import chatbot
+    import conversation_store
+
+    monkeypatch.setattr(
+        chatbot,
+        "compaction_removals",
+        lambda stored: conversation_store.compaction_removals(stored, max_messages=4),
+    )
+    profile = {"id": "user-1"}
+    for i in range(4):
+        await chatbot.chatbot_async(f"Mensaje {i}", user_profile=profile, conversation_id="c1")
+
+    # Compaction runs before each turn is appended: 4 stored messages + the new turn.
+    turns = await chatbot.get_conversation("user-1", "c1")
+    assert [t["content"] for t in turns if t["role"] == "user"] == ["Mensaje 1", "Mensaje 2", "Mensaje 3"]
+
+
+def test_thread_id_requires_user() -> None:
+    from conversation_store import thread_id_for
+
+    assert thread_id_for("user-1", "c1") == "user-1:c1"
+    with pytest.raises(ValueError):
+        thread_id_for("", "c1")
+
+
+@pytest.mark.asyncio
+async def test_sqlite_threads_keep_only_latest_checkpoints_and_idle_ones_expire(monkeypatch, tmp_path) -> None:
+    import chatbot
+    from conversation_store import expire_conversations, open_checkpointer
+
+    monkeypatch.setattr(chatbot, "llm_with_tools", _RecordingLLM())
+    async with open_checkpointer(f"sqlite:///{tmp_path / 'conversations.sqlite'}") as saver:
+        chatbot.enable_conversations(saver)
+        try:
+            for i in range(10):
+                await chatbot.chatbot_async(f"Mensaje {i}", user_profile={"id": "user-1"}, conversation_id="c1")
+            await chatbot.chatbot_async("Hola", user_profile={"id": "user-2"}, conversation_id="c1")
+
+            async with saver.conn.execute(
+                "SELECT COUNT(*) FROM checkpoints WHERE thread_id = 'user-1:c1'"
+            ) as cur:
+                assert (await cur.fetchone())[0] == 3
+            async with saver.conn.execute(
+                "SELECT COUNT(*) FROM writes WHERE checkpoint_id NOT IN (SELECT checkpoint_id FROM checkpoints)"
+            ) as cur:
+                assert (await cur.fetchone())[0] == 0
+            # The stored history is intact.
+            assert len(await chatbot.get_conversation("user-1", "c1")) == 20
+
+            assert await expire_conversations(saver, ttl_seconds=3600) == 0
+            assert await expire_conversations(saver, ttl_seconds=-1) == 2
+            assert await chatbot.get_conversation("user-1", "c1") == []
+        finally:
+            chatbot.enable_conversations(None)
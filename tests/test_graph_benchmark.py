@@ -0,0 +1,25 @@
+def test_replay_runs_corpus_through_both_graph_paths() -> None:
+    import chatbot
+    import tool_registry
+    from benchmarks.graph_bench import load_corpus, run_benchmark
+
+    corpus = load_corpus()
+    graph, specs = chatbot.graph, tool_registry.TOOL_SPECS_BY_NAME
+
+    report = run_benchmark(corpus, repeat=1, warmup=0, allocations=True)
+
+    expected = [
+        turn.get("reply") or "Resultado de buscar_actividades para José."
+        for conversation in corpus
+        for turn in conversation["turns"]
+    ]
+    assert report["replies"]["ainvoke"] == expected
+    assert report["replies"]["stream"] == expected
+    for mode in ("ainvoke", "stream"):
+        summary = report[mode]
+        assert summary["turns"] == len(expected)
+        assert summary["overhead_ms"]["p50"] > 0
+        assert summary["alloc_peak_kib"]["p99"] is not None
+    # Fakes are uninstalled afterwards.
+    assert chatbot.graph is graph
+    assert tool_registry.TOOL_SPECS_BY_NAME is specs
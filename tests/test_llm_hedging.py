@@ -0,0 +1,179 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+# Seconds the fake server waits before the first byte, per requested model.
+MODEL_DELAYS = {"slow-model": 2.0, "fast-model": 0.0, "medium-model": 0.3}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    requests_seen: list = []
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model = body["model"]
+        type(self).requests_seen.append(model)
+        if model == "broken-model":
+            self.send_response(500)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"error": {"message": "boom"}}')
+            return
+        time.sleep(MODEL_DELAYS.get(model, 0.0))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        base = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": model}
+        if body.get("tools"):
+            # Structured output: answer with a call to the first tool, arguments split in two deltas.
+            name = body["tools"][0]["function"]["name"]
+            arguments = json.dumps({"nombre": model})
+            calls = [
+                {"index": 0, "id": "call_1", "type": "function", "function": {"name": name, "arguments": arguments[:5]}},
+                {"index": 0, "function": {"arguments": arguments[5:]}},
+            ]
+            chunks = [
+                {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "tool_calls": [call]}, "finish_reason": None}]}
+                for call in calls
+            ] + [{**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]}]
+        else:
+            chunks = [
+                {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": f"Hola desde {model}"}, "finish_reason": None}]},
+                {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+            ]
+        try:
+            for chunk in chunks:
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture
+def fake_openai():
+    FakeOpenAIHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def _hedged(base_url: str, primary: str, backup: str, **policy):
+    from llm_hedging import HedgedChatModel, HedgePolicy
+
+    def model(name: str) -> ChatOpenAI:
+        return ChatOpenAI(model=name, base_url=base_url, api_key="test", max_retries=0)
+
+    return HedgedChatModel(
+        primary=model(primary),
+        backup=model(backup),
+        policy=HedgePolicy(default_threshold_s=0.2, **policy),
+    )
+
+
+def test_slow_primary_is_hedged_and_backup_wins(fake_openai) -> None:
+    llm = _hedged(fake_openai, "slow-model", "fast-model")
+
+    started = time.perf_counter()
+    result = llm.invoke("hola")
+    elapsed = time.perf_counter() - started
+
+    assert result.content == "Hola desde fast-model"
+    assert elapsed < 1.5
+    assert llm.policy.stats() == {"calls": 1, "hedges": 1, "hedge_wins": 1, "fallbacks": 0}
+
+
+@pytest.mark.asyncio
+async def test_hedge_budget_caps_extra_requests(fake_openai) -> None:
+    llm = _hedged(
+        fake_openai, "medium-model", "fast-model", budget_ratio=0.0, burst=1, min_samples=1, min_threshold_s=0.1
+    )
+
+    first = await llm.ainvoke("hola")
+    second = await llm.ainvoke("hola")
+
+    assert first.content == "Hola desde fast-model"
+    # Budget exhausted: the second call waits for the primary.
+    assert second.content == "Hola desde medium-model"
+    assert llm.policy.stats()["hedges"] == 1
+    assert FakeOpenAIHandler.requests_seen.count("fast-model") == 1
+    # The primary's real 0.3s TTFT was recorded, not the 0.2s threshold it missed.
+    assert llm.policy.threshold() >= 0.3
+
+
+@pytest.mark.asyncio
+async def test_failed_primary_falls_back_to_backup(fake_openai) -> None:
+    llm = _hedged(fake_openai, "broken-model", "fast-model")
+
+    result = await llm.ainvoke("hola")
+
+    assert result.content == "Hola desde fast-model"
+    assert llm.policy.stats()["fallbacks"] == 1
+    assert llm.policy.stats()["hedges"] == 0
+
+
+class Persona(BaseModel):
+    nombre: str
+
+
+def test_structured_output_goes_through_the_hedged_race(fake_openai) -> None:
+    llm = _hedged(fake_openai, "slow-model", "fast-model")
+
+    result = llm.with_structured_output(Persona).invoke("hola")
+
+    assert result == Persona(nombre="fast-model")
+    assert llm.policy.stats()["hedge_wins"] == 1
+
+
+class TickingModel(BaseChatModel):
+    """Streams a chunk every 10 ms for ~10 s; sets `closed` once the stream is torn down."""
+
+    closed: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "ticking"
+
+    def _generate(self, *args: Any, **kwargs: Any):
+        raise NotImplementedError
+
+    async def _astream(self, *args: Any, **kwargs: Any):
+        try:
+            for i in range(1000):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=f"{i} "))
+                await asyncio.sleep(0.01)
+        finally:
+            self.closed.set()
+
+
+def test_sync_stream_closed_early_stops_the_helper_thread() -> None:
+    from llm_hedging import HedgedChatModel, HedgePolicy
+
+    primary = TickingModel(closed=threading.Event())
+    llm = HedgedChatModel(primary=primary, backup=primary, policy=HedgePolicy())
+    before = threading.active_count()
+
+    stream = llm._stream([HumanMessage("hola")])
+    assert next(stream).text == "0 "
+    stream.close()
+
+    assert primary.closed.wait(1.0)
+    deadline = time.monotonic() + 1.0
+    while threading.active_count() > before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == before
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+
+def _fake_model(node: str, content: str = "hola que tal") -> GenericFakeChatModel:
+    from llm_metrics import LLMMetricsCallback
+
+    message = AIMessage(
+        content=content,
+        usage_metadata={
+            "input_tokens": 120,
+            "output_tokens": 8,
+            "total_tokens": 128,
+            "input_token_details": {"cache_read": 100},
+        },
+    )
+    return GenericFakeChatModel(messages=iter([message]), callbacks=[LLMMetricsCallback(node)])
+
+
+def test_callback_records_tokens_per_route_and_node() -> None:
+    from llm_metrics import llm_metrics, llm_route
+
+    llm_metrics.reset()
+    token = llm_route.set("/memory/summarize")
+    try:
+        _fake_model("memory").invoke("hola", config={"metadata": {"llm_node": "memory.extract"}})
+    finally:
+        llm_route.reset(token)
+
+    stats = llm_metrics.snapshot()["/memory/summarize"]["memory.extract"]
+    assert stats["calls"] == 1
+    assert stats["prompt_tokens"] == 120
+    assert stats["completion_tokens"] == 8
+    assert stats["cached_tokens"] == 100
+    assert stats["ttft_ms_p50"] is not None
+
+
+@pytest.mark.asyncio
+async def test_streaming_run_records_time_to_first_token() -> None:
+    from llm_metrics import llm_metrics
+
+    llm_metrics.reset()
+    chunks = [chunk async for chunk in _fake_model("chatbot").astream("hola")]
+
+    assert chunks
+    stats = llm_metrics.snapshot()["-"]["chatbot"]
+    assert stats["ttft_ms_p50"] <= stats["wall_ms_p50"]
+    assert llm_metrics.ttft_percentile("chatbot", 0.95) is not None
+
+
+def test_track_llm_call_reads_openai_usage_and_errors() -> None:
+    from llm_metrics import llm_metrics, track_llm_call
+
+    llm_metrics.reset()
+    usage = SimpleNamespace(
+        prompt_tokens=50,
+        completion_tokens=20,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+    )
+    with track_llm_call("activities.llm_json", "gpt-5.4-mini") as call:
+        call.record_openai_usage(usage)
+    with pytest.raises(RuntimeError):
+        with track_llm_call("activities.llm_json", "gpt-5.4-mini"):
+            raise RuntimeError("boom")
+
+    stats = llm_metrics.snapshot()["-"]["activities.llm_json"]
+    assert stats["calls"] == 2
+    assert stats["errors"] == 1
+    assert stats["prompt_tokens"] == 50
+    assert stats["models"] == {"gpt-5.4-mini": 2}
+
+
+def test_metrics_endpoint_requires_secret(monkeypatch) -> None:
+    import main
+
+    monkeypatch.setattr(main, "METRICS_SECRET", "s3cret")
+
+    with TestClient(main.app) as client:
+        denied = client.get("/metrics")
+        allowed = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+
+    assert denied.status_code == 401
+    assert allowed.status_code == 200
+    assert set(allowed.json()) == {
+        "llm",
+        "tools",
+        "tool_prefetch",
+        "memory_pipeline",
+        "memory_queue",
+        "realtime",
+        "tts_cache",
+    }
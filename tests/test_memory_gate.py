@@ -0,0 +1,66 @@
+import asyncio
+
+
+def test_chit_chat_is_skipped_and_personal_statements_pass() -> None:
+    from memory_gate import evaluate
+
+    assert not evaluate([{"role": "user", "content": "Hola, ¿qué tiempo hace hoy?"}]).extract
+    assert not evaluate([{"role": "user", "content": "Estoy bien, gracias."}]).extract
+    decision = evaluate([{"role": "user", "content": "Me tomo la pastilla de la tensión por la mañana"}])
+    assert decision.extract
+    assert "salud" in decision.signals
+    assert evaluate([{"role": "user", "content": "Soy Carmen"}]).extract
+
+
+def test_assistant_messages_are_not_scored_and_threshold_is_tunable() -> None:
+    from memory_gate import evaluate
+
+    messages = [
+        {"role": "assistant", "content": "¿Y su nieta? ¿Le sigue doliendo la rodilla?"},
+        {"role": "user", "content": "Sí, sí. Oye, ¿qué hora es?"},
+    ]
+    assert not evaluate(messages).extract
+    # A first-person remark alone only passes with a lower threshold.
+    remark = [{"role": "user", "content": "Esta tarde voy a ver la tele"}]
+    assert not evaluate(remark).extract
+    assert evaluate(remark, threshold=0.5).extract
+    assert evaluate(messages, threshold=0).extract
+
+
+def test_gated_window_makes_no_llm_call_and_is_counted(monkeypatch) -> None:
+    import memory_gate
+    import memory_service
+
+    calls: list = []
+
+    async def fake_extract(messages):
+        calls.append(messages)
+
+    async def fake_load(user_id):
+        calls.append(user_id)
+        return {}
+
+    monkeypatch.setattr(memory_service, "_extract", fake_extract)
+    monkeypatch.setattr(memory_service, "_load_memory", fake_load)
+    before = memory_gate.gate_stats()
+
+    asyncio.run(memory_service.run_memory_pipeline("user-1", [{"role": "user", "content": "Hola, buenas"}]))
+
+    assert calls == []
+    after = memory_service.pipeline_metrics()["gate"]
+    assert after["checked"] == before["checked"] + 1
+    assert after["llm_calls_avoided"] == before["llm_calls_avoided"] + 1
+
+
+def test_corpus_report_has_precision_recall_and_calls_avoided() -> None:
+    from benchmarks.gate_bench import load_corpus, run_benchmark
+
+    corpus = load_corpus()
+    report = run_benchmark(corpus, thresholds=(1.0,))
+
+    [result] = report["thresholds"]
+    assert report["windows"] == len(corpus)
+    assert result["recall"] >= 0.9
+    assert result["precision"] >= 0.9
+    assert result["llm_calls_avoided"] == result["true_negatives"] + result["false_negatives"]
+    assert result["llm_calls_avoided"] > 0
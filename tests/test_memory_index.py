@@ -0,0 +1,89 @@
+def _fact(text: str, category: str = "soft", created_at: str = "2026-10-01T00:00:00+00:00") -> dict:
+    return {"text": text, "category": category, "created_at": created_at}
+
+
+FACTS = [
+    _fact("Se llama Carmen", "hard"),
+    _fact("Tiene diabetes tipo 2", "hard"),
+    _fact("Le encantan las flores del patio", created_at="2026-09-01T00:00:00+00:00"),
+    _fact("Sus nietos se llaman Pablo y Marta", created_at="2026-09-02T00:00:00+00:00"),
+    _fact("Echa de menos bailar sevillanas", created_at="2026-09-03T00:00:00+00:00"),
+    _fact("Ve el telediario cada noche", created_at="2026-10-10T00:00:00+00:00"),
+]
+
+
+def test_relevant_soft_facts_are_selected_with_hard_facts_pinned() -> None:
+    from memory_index import select_facts
+
+    selected = select_facts(FACTS, "¿Qué tal están mis nietos?", max_facts=3)
+
+    assert [f["text"] for f in selected] == [
+        "Se llama Carmen",
+        "Tiene diabetes tipo 2",
+        "Sus nietos se llaman Pablo y Marta",
+    ]
+
+
+def test_accents_case_and_plurals_match() -> None:
+    from memory_index import select_facts
+
+    selected = select_facts(FACTS, "HOY HE PLANTADO UNA FLOR", max_facts=3)
+
+    assert selected[-1]["text"] == "Le encantan las flores del patio"
+
+
+def test_without_query_recent_facts_fill_the_budget() -> None:
+    from memory_index import estimate_tokens, select_facts
+
+    budget = sum(estimate_tokens(f["text"]) for f in FACTS[:2]) + estimate_tokens(FACTS[5]["text"])
+    selected = select_facts(FACTS, "", max_facts=10, token_budget=budget)
+
+    assert [f["text"] for f in selected] == [
+        "Se llama Carmen",
+        "Tiene diabetes tipo 2",
+        "Ve el telediario cada noche",
+    ]
+
+
+def test_hard_facts_respect_the_cap_and_budget_keeping_the_most_recent() -> None:
+    from memory_index import estimate_tokens, select_facts
+
+    hard = [_fact(f"Dato importante {i}", "hard", created_at=f"2026-09-{i + 10}T00:00:00+00:00") for i in range(20)]
+
+    assert [f["text"] for f in select_facts(hard + FACTS[2:], "flores", max_facts=2)] == [
+        "Dato importante 18",
+        "Dato importante 19",
+    ]
+    budget = estimate_tokens("Dato importante 19")
+    assert [f["text"] for f in select_facts(hard, max_facts=10, token_budget=budget)] == ["Dato importante 19"]
+
+
+def test_index_cache_is_safe_across_threads(monkeypatch) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import memory_index
+
+    monkeypatch.setattr(memory_index, "_INDEX_CACHE_SIZE", 2)
+    fact_sets = [[f"Dato {i}", f"Otro dato {i % 3}"] for i in range(50)]
+
+    def select(texts):
+        facts = [_fact(t) for t in texts]
+        return len(memory_index.select_facts(facts, "dato"))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(select, fact_sets * 20)) == {2}
+    assert len(memory_index._index_cache) <= 2
+
+
+def test_system_message_only_includes_selected_facts() -> None:
+    from chatbot import build_system_message
+
+    facts = FACTS + [_fact(f"Dato sin importancia número {i}") for i in range(40)]
+    message = build_system_message(
+        user_memory={"facts": facts, "narrative": ""},
+        query="Cuéntame algo de bailar",
+    )
+
+    assert "Echa de menos bailar sevillanas" in message["content"]
+    assert "Se llama Carmen" in message["content"]
+    assert message["content"].count("Dato sin importancia") < 40
@@ -0,0 +1,186 @@
+import asyncio
+
+import pytest
+
+
+def _queue(runs: list, delay: float = 0.0, **kwargs):
+    from memory_queue import MemoryJobQueue
+
+    async def runner(user_id, messages, checkpoints=None):
+        runs.append(("start", user_id, [m["content"] for m in messages]))
+        await asyncio.sleep(delay)
+        runs.append(("end", user_id))
+
+    return MemoryJobQueue(runner, **{"debounce_seconds": 0.05, "workers": 2, **kwargs})
+
+
+@pytest.mark.asyncio
+async def test_requests_within_window_are_coalesced() -> None:
+    runs: list = []
+    queue = _queue(runs)
+
+    queue.submit("user-1", [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}])
+    await asyncio.sleep(0.02)
+    queue.submit("user-1", [{"role": "assistant", "content": "b"}, {"role": "user", "content": "c"}])
+    await asyncio.sleep(0.15)
+    await queue.stop()
+
+    assert runs == [("start", "user-1", ["a", "b", "c"]), ("end", "user-1")]
+    stats = queue.stats()
+    assert stats["submitted"] == 2
+    assert stats["coalesced"] == 1
+    assert stats["completed"] == 1
+    assert stats["pending_users"] == 0
+
+
+@pytest.mark.asyncio
+async def test_coalescing_keeps_repeated_turns_outside_the_overlap() -> None:
+    runs: list = []
+    queue = _queue(runs)
+
+    queue.submit("user-1", [{"role": "user", "content": "sí"}, {"role": "assistant", "content": "¿Salimos?"}])
+    await asyncio.sleep(0.02)
+    queue.submit("user-1", [{"role": "assistant", "content": "¿Salimos?"}, {"role": "user", "content": "sí"}])
+    await asyncio.sleep(0.15)
+    await queue.stop()
+
+    assert runs[0] == ("start", "user-1", ["sí", "¿Salimos?", "sí"])
+
+
+@pytest.mark.asyncio
+async def test_one_pipeline_per_user_and_bounded_workers() -> None:
+    runs: list = []
+    queue = _queue(runs, delay=0.1, workers=1)
+
+    queue.submit("user-1", [{"role": "user", "content": "uno"}])
+    queue.submit("user-2", [{"role": "user", "content": "dos"}])
+    await asyncio.sleep(0.08)
+    # user-1 is running; this becomes a second job that waits for it.
+    queue.submit("user-1", [{"role": "user", "content": "tres"}])
+    await asyncio.sleep(0.5)
+    await queue.stop()
+
+    # A single worker never overlaps pipelines.
+    starts_and_ends = [event[0] for event in runs]
+    assert starts_and_ends == ["start", "end"] * 3
+    assert ("start", "user-1", ["tres"]) in runs
+    assert queue.stats()["completed"] == 3
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_jobs() -> None:
+    runs: list = []
+    queue = _queue(runs, debounce_seconds=60)
+
+    queue.submit("user-1", [{"role": "user", "content": "hola"}])
+    await queue.stop(grace_seconds=1)
+
+    assert runs == [("start", "user-1", ["hola"]), ("end", "user-1")]
+
+
+@pytest.mark.asyncio
+async def test_failed_job_resumes_from_its_extract_checkpoint(tmp_path) -> None:
+    from memory_queue import MemoryJobQueue
+
+    attempts: list = []
+
+    async def runner(user_id, messages, checkpoints):
+        extracted = checkpoints.get("extract")
+        attempts.append(extracted)
+        if extracted is None:
+            checkpoints.save("extract", {"new_facts": [{"text": "Le gusta el té"}]})
+            raise RuntimeError("merge failed")
+
+    queue = MemoryJobQueue(
+        runner, debounce_seconds=0.01, retry_seconds=0.02, store_path=str(tmp_path / "jobs.sqlite")
+    )
+    queue.submit("user-1", [{"role": "user", "content": "Me gusta el té"}])
+    await asyncio.sleep(0.2)
+
+    assert attempts == [None, {"new_facts": [{"text": "Le gusta el té"}]}]
+    stats = queue.stats()
+    assert (stats["failed"], stats["retried"], stats["completed"]) == (1, 1, 1)
+    # Finished jobs are removed from the store.
+    assert stats["stored"] == {}
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_unfinished_jobs_are_replayed_on_start(tmp_path) -> None:
+    from memory_job_store import MemoryJobStore
+    from memory_queue import MemoryJobQueue
+
+    path = str(tmp_path / "jobs.sqlite")
+    store = MemoryJobStore(path)
+    interrupted = store.create("user-1", [{"role": "user", "content": "hola"}])
+    store.start_attempt(interrupted).save("extract", {"new_facts": []})
+    exhausted = store.create("user-2", [{"role": "user", "content": "adiós"}])
+    for _ in range(3):
+        store.start_attempt(exhausted)
+    store.close()
+
+    runs: list = []
+
+    async def runner(user_id, messages, checkpoints):
+        runs.append((user_id, checkpoints.get("extract")))
+
+    queue = MemoryJobQueue(runner, store_path=path, max_attempts=3)
+    queue.start()
+    await asyncio.sleep(0.05)
+
+    assert runs == [("user-1", {"new_facts": []})]
+    assert queue.stats()["replayed"] == 1
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_out_of_attempts_is_deleted_from_the_store(tmp_path) -> None:
+    from memory_queue import MemoryJobQueue
+
+    async def runner(user_id, messages, checkpoints):
+        raise RuntimeError("merge failed")
+
+    queue = MemoryJobQueue(
+        runner, debounce_seconds=0.01, retry_seconds=0.02, max_attempts=2, store_path=str(tmp_path / "jobs.sqlite")
+    )
+    queue.submit("user-1", [{"role": "user", "content": "Me llamo Carmen"}])
+    await asyncio.sleep(0.2)
+
+    stats = queue.stats()
+    assert (stats["failed"], stats["retried"]) == (2, 1)
+    # No row, and so no conversation text, outlives the last attempt.
+    assert stats["stored"] == {}
+    await queue.stop()
+
+
+def test_jobs_leased_by_a_live_store_are_not_replayed_elsewhere(tmp_path) -> None:
+    import time
+
+    from memory_job_store import MemoryJobStore
+
+    path = str(tmp_path / "jobs.sqlite")
+    worker_a = MemoryJobStore(path, lease_seconds=0.1)
+    worker_b = MemoryJobStore(path)
+    job_id = worker_a.create("user-1", [{"role": "user", "content": "hola"}])
+
+    # Still leased by worker A, which is running it.
+    assert worker_b.claim_unfinished(max_attempts=3) == []
+    time.sleep(0.15)
+    # Worker A stopped renewing its lease: B takes the job over, once.
+    assert [job[0] for job in worker_b.claim_unfinished(max_attempts=3)] == [job_id]
+    assert worker_b.claim_unfinished(max_attempts=3) == []
+    assert worker_a.claim_unfinished(max_attempts=3) == []
+    worker_a.close()
+    worker_b.close()
+
+
+def test_prune_deletes_rows_past_the_ttl(tmp_path) -> None:
+    from memory_job_store import MemoryJobStore
+
+    store = MemoryJobStore(str(tmp_path / "jobs.sqlite"))
+    store.create("user-1", [{"role": "user", "content": "hola"}])
+
+    assert store.prune(max_attempts=3) == 0
+    assert store.prune(max_attempts=3, ttl_seconds=-1) == 1
+    assert store.counts() == {}
+    store.close()
@@ -48,3 +48,393 @@ class TestExpireSoftFacts:
         ]
         result = _expire_soft_facts(facts)
         assert len(result) == 3
+
+
+class TestLocalMerge:
+    def test_accent_and_case_variants_are_duplicates(self) -> None:
+        from memory_service import _local_merge
+
+        existing = [_make_fact("Tiene dos nietos, Pablo y Marta", "hard", "2026-01-01T00:00:00+00:00")]
+        new = [_make_fact("tiene dos nietos pablo y marta", "hard", _days_ago(0))]
+
+        merged, ambiguous_existing, ambiguous_new = _local_merge(existing, new)
+
+        assert merged == existing
+        assert ambiguous_existing == ambiguous_new == []
+
+    def test_unrelated_facts_are_appended_without_llm(self) -> None:
+        from memory_service import _local_merge
+
+        existing = [_make_fact("Tiene diabetes", "hard", _days_ago(100))]
+        new = [
+            _make_fact("Le gusta la jardinería", "soft", _days_ago(0)),
+            _make_fact("Su hija se llama Lucía", "hard", _days_ago(0)),
+        ]
+
+        merged, _, ambiguous_new = _local_merge(existing, new)
+
+        assert [f["text"] for f in merged] == ["Tiene diabetes", "Le gusta la jardinería", "Su hija se llama Lucía"]
+        assert ambiguous_new == []
+
+    def test_same_category_overlap_is_left_for_the_llm(self) -> None:
+        from memory_service import _local_merge
+
+        existing = [
+            _make_fact("Vive en Sevilla", "hard", _days_ago(200)),
+            _make_fact("Tiene diabetes", "hard", _days_ago(100)),
+        ]
+        new = [_make_fact("Vive en Madrid con su hijo", "hard", _days_ago(0))]
+
+        merged, ambiguous_existing, ambiguous_new = _local_merge(existing, new)
+
+        assert [f["text"] for f in merged] == ["Tiene diabetes"]
+        assert [f["text"] for f in ambiguous_existing] == ["Vive en Sevilla"]
+        assert ambiguous_new == new
+
+    def test_near_duplicates_are_left_for_the_llm(self) -> None:
+        from memory_service import _local_merge
+
+        for stored, update in [
+            ("Tiene 80 años", "Tiene 81 años"),
+            ("Tiene 3 nietos", "Tiene 4 nietos"),
+            ("Le gusta el fútbol", "No le gusta el fútbol"),
+        ]:
+            existing = [_make_fact(stored, "hard", _days_ago(100))]
+            new = [_make_fact(update, "hard", _days_ago(0))]
+
+            merged, ambiguous_existing, ambiguous_new = _local_merge(existing, new)
+
+            assert merged == []
+            assert ambiguous_existing == existing
+            assert ambiguous_new == new
+
+
+def test_combined_output_keeps_created_at_only_for_unchanged_text() -> None:
+    from memory_service import CombinedFact, CombinedResult, _apply_combined
+
+    existing = [
+        _make_fact("Tiene 80 años", "hard", "2025-01-01T00:00:00+00:00"),
+        _make_fact("Vive en Sevilla", "hard", "2025-02-01T00:00:00+00:00"),
+    ]
+    result = CombinedResult(
+        facts=[
+            CombinedFact(text="Tiene 81 años", category="hard", source_id=0),
+            CombinedFact(text="vive en sevilla", category="hard", source_id=1),
+        ]
+    )
+
+    merged = _apply_combined(result, existing, "2026-10-19T00:00:00+00:00")
+
+    assert [f["created_at"] for f in merged] == ["2026-10-19T00:00:00+00:00", "2025-02-01T00:00:00+00:00"]
+
+
+class TestPipelineLlmCalls:
+    def _patch(self, monkeypatch, extraction, stored):
+        import memory_service
+        from memory_service import ExtractedFact, ExtractionResult, MergedFact, MergeResult
+
+        calls: dict = {"merge": [], "narrative": 0, "upserts": []}
+
+        async def fake_extract(messages):
+            return ExtractionResult(
+                new_facts=[ExtractedFact(text=t, category=c) for t, c in extraction],
+                narrative_update="Novedades",
+            )
+
+        async def fake_load(user_id):
+            return stored
+
+        async def fake_merge(existing, new):
+            calls["merge"].append((existing, new))
+            return MergeResult(facts=[MergedFact(**f) for f in new])
+
+        async def fake_narrative(facts, update):
+            calls["narrative"] += 1
+            return "Narrativa nueva"
+
+        async def fake_upsert(row, expected_updated_at=None, row_exists=None):
+            calls["upserts"].append(row)
+
+        monkeypatch.setattr(memory_service, "_extract", fake_extract)
+        monkeypatch.setattr(memory_service, "_load_memory", fake_load)
+        monkeypatch.setattr(memory_service, "_merge", fake_merge)
+        monkeypatch.setattr(memory_service, "_rebuild_narrative", fake_narrative)
+        monkeypatch.setattr(memory_service, "_upsert_memory", fake_upsert)
+        return calls
+
+    def test_duplicates_skip_merge_and_narrative(self, monkeypatch) -> None:
+        import asyncio
+
+        from memory_service import run_memory_pipeline
+
+        stored = {
+            "facts": [_make_fact("Se llama María", "hard", _days_ago(300))],
+            "narrative": "María vive en Valencia.",
+        }
+        calls = self._patch(monkeypatch, [("Se llama Maria", "hard")], stored)
+
+        asyncio.run(run_memory_pipeline("user-1", [{"role": "user", "content": "Soy María"}]))
+
+        assert calls["merge"] == []
+        assert calls["narrative"] == 0
+        assert calls["upserts"][0]["narrative"] == "María vive en Valencia."
+        assert calls["upserts"][0]["facts"] == stored["facts"]
+
+    def test_only_the_conflicting_subset_reaches_the_llm(self, monkeypatch) -> None:
+        import asyncio
+
+        from memory_service import run_memory_pipeline
+
+        stored = {
+            "facts": [
+                _make_fact("Vive en Sevilla", "hard", _days_ago(300)),
+                _make_fact("Tiene diabetes", "hard", _days_ago(300)),
+            ],
+            "narrative": "",
+        }
+        calls = self._patch(monkeypatch, [("Vive en Madrid", "hard"), ("Le gusta el té", "soft")], stored)
+
+        asyncio.run(run_memory_pipeline("user-1", [{"role": "user", "content": "Me he mudado"}]))
+
+        [(existing, new)] = calls["merge"]
+        assert [f["text"] for f in existing] == ["Vive en Sevilla"]
+        assert [f["text"] for f in new] == ["Vive en Madrid"]
+        assert calls["narrative"] == 1
+        assert sorted(f["text"] for f in calls["upserts"][0]["facts"]) == [
+            "Le gusta el té",
+            "Tiene diabetes",
+            "Vive en Madrid",
+        ]
+
+
+def test_load_runs_concurrently_with_extract_and_stages_are_timed(monkeypatch) -> None:
+    import asyncio
+    import time
+
+    import memory_service
+    from memory_service import ExtractedFact, ExtractionResult, pipeline_metrics, run_memory_pipeline
+
+    async def slow_extract(messages):
+        await asyncio.sleep(0.2)
+        return ExtractionResult(new_facts=[ExtractedFact(text="Le gusta el té", category="soft")])
+
+    async def slow_load(user_id):
+        await asyncio.sleep(0.2)
+        return {"facts": [], "narrative": ""}
+
+    async def fake_narrative(facts, update):
+        return "Le gusta el té."
+
+    upserts: list = []
+
+    async def fake_upsert(row, expected_updated_at=None, row_exists=None):
+        upserts.append(row)
+
+    monkeypatch.setattr(memory_service, "_extract", slow_extract)
+    monkeypatch.setattr(memory_service, "_load_memory", slow_load)
+    monkeypatch.setattr(memory_service, "_rebuild_narrative", fake_narrative)
+    monkeypatch.setattr(memory_service, "_upsert_memory", fake_upsert)
+    before = pipeline_metrics()
+
+    started = time.perf_counter()
+    asyncio.run(run_memory_pipeline("user-1", [{"role": "user", "content": "Me encanta el té"}]))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.35
+    assert upserts and upserts[0]["narrative"] == "Le gusta el té."
+    after = pipeline_metrics()
+    for stage in ("extract", "load", "narrative", "upsert", "total"):
+        assert after[stage]["runs"] == before[stage]["runs"] + 1
+    assert after["merge"]["runs"] == before["merge"]["runs"]
+
+
+class TestSingleCallMode:
+    def _case(self, case_id: str) -> dict:
+        from benchmarks.memory_bench import load_cases
+
+        return next(c for c in load_cases() if c["id"] == case_id)
+
+    def test_single_call_replaces_the_three_stages(self) -> None:
+        import asyncio
+
+        from benchmarks.memory_bench import run_case
+
+        case = self._case("contradiccion")
+        staged = asyncio.run(run_case(case, "staged", 0, 0))
+        single = asyncio.run(run_case(case, "single", 0, 0))
+
+        assert staged["nodes"] == ["memory.extract", "memory.merge", "memory.narrative"]
+        assert single["nodes"] == ["memory.combined"]
+        facts = {f["text"]: f["created_at"] for f in single["upsert"]["facts"]}
+        # Unchanged facts keep their created_at; updated and new facts are restamped.
+        assert facts["Se llama María"] == "2026-01-20T08:00:00+00:00"
+        assert facts["Vive en Madrid con su hijo Jorge"] != "2026-01-20T08:00:00+00:00"
+        assert sorted(facts) == sorted(f["text"] for f in staged["upsert"]["facts"])
+
+    def test_invalid_single_call_output_falls_back_to_staged(self) -> None:
+        import asyncio
+
+        from benchmarks.memory_bench import run_case
+
+        case = self._case("hecho-nuevo")
+        case["llm"]["memory.combined"]["facts"][0]["source_id"] = 42
+
+        result = asyncio.run(run_case(case, "single", 0, 0))
+
+        assert result["nodes"] == ["memory.combined", "memory.extract", "memory.narrative"]
+        assert len(result["upsert"]["facts"]) == 4
+
+
+def test_conflicting_write_is_re_merged_and_retried(monkeypatch) -> None:
+    import asyncio
+
+    import memory_service
+    from memory_service import ExtractedFact, ExtractionResult, MemoryConflict, run_memory_pipeline
+
+    stored = {
+        "id": "user-1",
+        "facts": [_make_fact("Se llama María", "hard", _days_ago(300))],
+        "narrative": "María vive en Valencia.",
+        "updated_at": "v1",
+    }
+    writes: list = []
+
+    async def fake_extract(messages):
+        return ExtractionResult(new_facts=[ExtractedFact(text="Le gusta el té", category="soft")])
+
+    async def fake_load(user_id):
+        return dict(stored)
+
+    async def fake_narrative(facts, update):
+        return "Narrativa"
+
+    async def fake_upsert(row, expected_updated_at=None, row_exists=None):
+        writes.append(expected_updated_at)
+        if len(writes) == 1:
+            # Another pipeline wrote between our load and our write.
+            stored["facts"] = stored["facts"] + [_make_fact("Tiene un gato", "soft", _days_ago(0))]
+            stored["updated_at"] = "v2"
+        if expected_updated_at != stored["updated_at"]:
+            raise MemoryConflict(row["id"])
+        stored.update(row)
+
+    monkeypatch.setattr(memory_service, "_extract", fake_extract)
+    monkeypatch.setattr(memory_service, "_load_memory", fake_load)
+    monkeypatch.setattr(memory_service, "_rebuild_narrative", fake_narrative)
+    monkeypatch.setattr(memory_service, "_upsert_memory", fake_upsert)
+
+    asyncio.run(run_memory_pipeline("user-1", [{"role": "user", "content": "Me gusta el té"}]))
+
+    assert writes == ["v1", "v2"]
+    assert [f["text"] for f in stored["facts"]] == ["Se llama María", "Tiene un gato", "Le gusta el té"]
+
+
+def test_retry_with_extract_checkpoint_skips_extraction(monkeypatch, tmp_path) -> None:
+    import asyncio
+
+    import pytest
+
+    import memory_service
+    from memory_job_store import MemoryJobStore
+    from memory_service import MemoryPipelineError, run_memory_pipeline
+
+    store = MemoryJobStore(str(tmp_path / "jobs.sqlite"))
+    messages = [{"role": "user", "content": "Me gusta el té"}]
+    job_id = store.create("user-1", messages)
+    extract_calls: list = []
+    upserts: list = []
+
+    async def fake_extract(messages):
+        from memory_service import ExtractedFact, ExtractionResult
+
+        extract_calls.append(messages)
+        return ExtractionResult(new_facts=[ExtractedFact(text="Le gusta el té", category="soft")])
+
+    async def fake_load(user_id):
+        return {"id": user_id, "facts": [], "narrative": "", "updated_at": "v1"}
+
+    async def fake_narrative(facts, update):
+        return "Narrativa"
+
+    async def failing_upsert(row, expected_updated_at=None, row_exists=None):
+        raise RuntimeError("supabase caído")
+
+    async def fake_upsert(row, expected_updated_at=None, row_exists=None):
+        upserts.append(row)
+
+    monkeypatch.setattr(memory_service, "_extract", fake_extract)
+    monkeypatch.setattr(memory_service, "_load_memory", fake_load)
+    monkeypatch.setattr(memory_service, "_rebuild_narrative", fake_narrative)
+    monkeypatch.setattr(memory_service, "_upsert_memory", failing_upsert)
+    with pytest.raises(MemoryPipelineError):
+        asyncio.run(run_memory_pipeline("user-1", messages, store.start_attempt(job_id)))
+
+    monkeypatch.setattr(memory_service, "_upsert_memory", fake_upsert)
+    asyncio.run(run_memory_pipeline("user-1", messages, store.start_attempt(job_id)))
+
+    assert len(extract_calls) == 1
+    assert [f["text"] for f in upserts[0]["facts"]] == ["Le gusta el té"]
+
+
+def test_stage_timings_add_up_across_conflict_retries(monkeypatch) -> None:
+    import asyncio
+
+    import memory_service
+    from memory_service import ExtractedFact, ExtractionResult, MemoryConflict, run_memory_pipeline
+
+    loads: list = []
+    recorded: list = []
+
+    async def fake_extract(messages):
+        return ExtractionResult(new_facts=[ExtractedFact(text="Le gusta el té", category="soft")])
+
+    async def slow_load(user_id):
+        await asyncio.sleep(0.1)
+        loads.append(user_id)
+        return {"id": user_id, "facts": [], "narrative": "", "updated_at": f"v{len(loads)}"}
+
+    async def fake_narrative(facts, update):
+        return "Narrativa"
+
+    async def fake_upsert(row, expected_updated_at=None, row_exists=None):
+        if expected_updated_at == "v1":
+            raise MemoryConflict(row["id"])
+
+    monkeypatch.setattr(memory_service, "_extract", fake_extract)
+    monkeypatch.setattr(memory_service, "_load_memory", slow_load)
+    monkeypatch.setattr(memory_service, "_rebuild_narrative", fake_narrative)
+    monkeypatch.setattr(memory_service, "_upsert_memory", fake_upsert)
+    monkeypatch.setattr(memory_service, "_record_stages", recorded.append)
+
+    asyncio.run(run_memory_pipeline("user-1", [{"role": "user", "content": "Me gusta el té"}]))
+
+    assert len(loads) == 2
+    assert recorded[0]["load"] >= 0.2
+
+
+def test_cas_write_of_a_row_with_null_updated_at_filters_on_is_null(monkeypatch) -> None:
+    import asyncio
+
+    import httpx
+
+    import memory_service
+
+    requests: list = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json=[{"id": "user-1"}])
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setenv("SUPABASE_URL", "https://supabase.test")
+    monkeypatch.setattr(
+        memory_service.httpx, "AsyncClient", lambda: real_client(transport=httpx.MockTransport(handler))
+    )
+    row = {"id": "user-1", "facts": [], "narrative": "", "updated_at": "v2"}
+
+    asyncio.run(memory_service._upsert_memory(row, None, row_exists=True))
+    asyncio.run(memory_service._upsert_memory(row, None, row_exists=False))
+
+    assert requests[0].method == "PATCH"
+    assert requests[0].url.params["updated_at"] == "is.null"
+    assert requests[1].method == "POST"
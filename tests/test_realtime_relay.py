@@ -0,0 +1,477 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+class FakeUpstream:
+    """Stands in for the xAI realtime WebSocket."""
+
+    def __init__(self, events=(), drop_after_events: bool = False) -> None:
+        self.events = list(events)
+        self.drop_after_events = drop_after_events
+        self.sent: list = []
+        self.closed = False
+
+    async def send(self, message) -> None:
+        self.sent.append(message)
+
+    async def close(self) -> None:
+        self.closed = True
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self.events:
+            yield json.dumps(event)
+        if self.drop_after_events:
+            from websockets import ConnectionClosedError
+            from websockets.frames import Close
+
+            raise ConnectionClosedError(Close(1011, "internal error"), None)
+        while not self.closed:
+            await asyncio.sleep(0.01)
+
+
+def _patch_setup(monkeypatch, upstream, delay: float = 0.0, log: list = None):
+    import main
+
+    log = log if log is not None else []
+
+    async def connect(api_key):
+        log.append(("connect", time.perf_counter()))
+        await asyncio.sleep(delay)
+        if sum(1 for event in log if event[0] == "connect") > 1:
+            raise ConnectionRefusedError("upstream unavailable")
+        return upstream
+
+    def fetch(name, value):
+        async def _fetch(user_id):
+            await asyncio.sleep(delay)
+            log.append((name, time.perf_counter()))
+            return value
+
+        return _fetch
+
+    async def resolve(token):
+        return "user-1" if token == "valid" else None
+
+    monkeypatch.setattr(main, "_get_xai_api_key", lambda: "test-key")
+    monkeypatch.setattr(main, "resolve_user_id_from_jwt", resolve)
+    monkeypatch.setattr(main, "_connect_realtime_upstream", lambda api_key: connect(api_key))
+    monkeypatch.setattr(main, "fetch_user_profile", fetch("profile", {"name": "Carmen"}))
+    monkeypatch.setattr(main, "fetch_tutor_profile", fetch("tutor", {}))
+    monkeypatch.setattr(main, "fetch_user_memory", fetch("memory", None))
+    return log
+
+
+def test_upstream_connect_overlaps_context_fetch_and_phases_are_recorded(monkeypatch) -> None:
+    import main
+    from realtime_relay import RelayMetrics
+
+    metrics = RelayMetrics()
+    monkeypatch.setattr(main, "relay_metrics", metrics)
+    upstream = FakeUpstream()
+    log = _patch_setup(monkeypatch, upstream, delay=0.2)
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/realtime/ws") as ws:
+            ws.send_json({"token": "valid"})
+            assert ws.receive_json() == {"type": "relay.ready"}
+
+    # The connect started before any fetch finished, and the fetches overlapped.
+    started = dict(log)
+    assert started["connect"] < min(started["profile"], started["tutor"], started["memory"])
+    session_update = json.loads(upstream.sent[0])
+    assert session_update["type"] == "session.update"
+    assert "Carmen" in session_update["session"]["instructions"]
+    stats = metrics.stats()
+    assert stats["sessions"] == 1
+    # Serially this would take ~0.8 s (connect + three fetches).
+    assert stats["setup_ms"]["ready"]["max"] < 600
+    assert stats["setup_ms"]["connect"]["max"] >= 200
+
+
+def test_invalid_token_never_dials_upstream(monkeypatch) -> None:
+    import main
+
+    log = _patch_setup(monkeypatch, FakeUpstream())
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/realtime/ws") as ws:
+            ws.send_json({"token": "forged"})
+            assert ws.receive_json()["error"]["message"] == "Token de autenticacion invalido"
+
+    assert log == []
+
+
+def test_frontend_tool_handler_gets_a_session_token_for_the_relay_lifetime(monkeypatch) -> None:
+    import main
+    from realtime_sessions import RealtimeSessionStore
+
+    store = RealtimeSessionStore()
+    monkeypatch.setattr(main, "realtime_sessions", store)
+    _patch_setup(monkeypatch, FakeUpstream())
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/realtime/ws") as ws:
+            ws.send_json({"token": "valid", "tool_call_handler": "frontend"})
+            ready = ws.receive_json()
+            context = store.resolve(ready["session_token"], "user-1")
+            assert context["user_profile"] == {"name": "Carmen", "id": "user-1"}
+
+    assert store.resolve(ready["session_token"], "user-1") is None
+
+
+def test_relay_reuses_the_session_token_from_realtime_session(monkeypatch) -> None:
+    import main
+    from realtime_sessions import RealtimeSessionStore
+
+    store = RealtimeSessionStore()
+    monkeypatch.setattr(main, "realtime_sessions", store)
+    log = _patch_setup(monkeypatch, FakeUpstream())
+    main.app.dependency_overrides[main.get_current_user_id] = lambda: "user-1"
+
+    try:
+        with TestClient(main.app) as client:
+            session = client.post("/realtime/session", json={"tool_call_handler": "frontend"}).json()
+            with client.websocket_connect("/realtime/ws") as ws:
+                ws.send_json(
+                    {"token": "valid", "tool_call_handler": "frontend", "session_token": session["session_token"]}
+                )
+                ready = ws.receive_json()
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert ready["session_token"] == session["session_token"]
+    # Profile and tutor were fetched for /realtime/session only.
+    assert [name for name, _ in log if name != "connect"] == ["profile", "tutor", "memory"]
+    assert store.stats()["minted"] == 1
+    # The handle ends with the relay session.
+    assert store.resolve(session["session_token"], "user-1") is None
+
+
+FUNCTION_CALL = {
+    "type": "response.function_call_arguments.done",
+    "name": "buscar_actividades",
+    "call_id": "call_1",
+    "arguments": "{}",
+}
+AUDIO_DELTA = {"type": "response.output_audio.delta", "delta": "AAAA"}
+
+
+def test_slow_tool_does_not_stall_upstream_audio(monkeypatch) -> None:
+    import main
+
+    tool_started: list = []
+    upstream = FakeUpstream([FUNCTION_CALL, FUNCTION_CALL, AUDIO_DELTA])
+    _patch_setup(monkeypatch, upstream)
+
+    async def slow_tool(name, arguments, context):
+        tool_started.append(name)
+        await asyncio.sleep(0.3)
+        return "Tres actividades cerca"
+
+    monkeypatch.setattr(main, "execute_tool", slow_tool)
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/realtime/ws") as ws:
+            ws.send_json({"token": "valid"})
+            assert ws.receive_json()["type"] == "relay.ready"
+            assert ws.receive_json()["type"] == FUNCTION_CALL["type"]
+            assert ws.receive_json()["type"] == FUNCTION_CALL["type"]
+            # The audio arrives while the tool is still running.
+            assert ws.receive_json() == AUDIO_DELTA
+            assert len(upstream.sent) == 1
+            deadline = time.monotonic() + 2
+            while len(upstream.sent) < 3 and time.monotonic() < deadline:
+                time.sleep(0.02)
+
+    # The duplicated event ran the tool once.
+    assert tool_started == ["buscar_actividades"]
+    output, response = [json.loads(m) for m in upstream.sent[1:]]
+    assert output["item"] == {
+        "type": "function_call_output",
+        "call_id": "call_1",
+        "output": "Tres actividades cerca",
+    }
+    assert response == {"type": "response.create"}
+
+
+def test_tool_calls_time_out_and_are_cancelled_on_close() -> None:
+    from realtime_relay import RealtimeToolCalls
+
+    async def scenario():
+        sent: list = []
+        cancelled: list = []
+
+        async def execute(call):
+            try:
+                await asyncio.sleep(10 if call["name"] == "lenta" else 0)
+            except asyncio.CancelledError:
+                cancelled.append(call["name"])
+                raise
+            return "ok"
+
+        async def send(call, output):
+            sent.append((call["call_id"], output))
+
+        calls = RealtimeToolCalls(execute, send, timeout=0.05)
+        calls.dispatch({"name": "rapida", "call_id": "a"})
+        calls.dispatch({"name": "lenta", "call_id": "b"})
+        await asyncio.sleep(0.1)
+        # The timed-out call is still answered, so the model does not wait for it.
+        assert sent[0] == ("a", "ok")
+        assert sent[1][0] == "b" and sent[1][1].startswith("Error: la herramienta lenta no ha respondido")
+        assert cancelled == ["lenta"]
+        assert calls.inflight == 0
+
+        other = RealtimeToolCalls(execute, send, timeout=30)
+        other.dispatch({"name": "lenta", "call_id": "c"})
+        await asyncio.sleep(0)
+        await other.cancel_all()
+        assert cancelled == ["lenta", "lenta"]
+        assert other.inflight == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_tool_gets_an_error_output_and_unsent_outputs_are_resent() -> None:
+    from realtime_relay import RealtimeToolCalls
+
+    async def scenario():
+        sent: list = []
+        upstream_up = False
+
+        async def execute(call):
+            if call["name"] == "rota":
+                raise RuntimeError("sin conexión")
+            return "ok"
+
+        async def send(call, output):
+            if not upstream_up:
+                raise ConnectionError("upstream closed")
+            sent.append((call["call_id"], output))
+
+        calls = RealtimeToolCalls(execute, send)
+        calls.dispatch({"name": "rota", "call_id": "a"})
+        calls.dispatch({"name": "clima", "call_id": "b"})
+        await asyncio.sleep(0.01)
+        assert sent == []
+        assert calls.unsent == 2
+
+        upstream_up = True
+        await calls.resend_unsent()
+        assert sent == [("a", "Error ejecutando rota: sin conexión"), ("b", "ok")]
+        assert calls.unsent == 0
+
+    asyncio.run(scenario())
+
+
+def test_only_events_that_can_carry_a_function_call_are_decoded() -> None:
+    from realtime_relay import parse_tool_event, sniff_event_type
+
+    audio = json.dumps({"type": "response.output_audio.delta", "delta": "A" * 10_000})
+    assert sniff_event_type(audio) == "response.output_audio.delta"
+    assert parse_tool_event(audio) is None
+
+    item = {"item": {"type": "function_call", "call_id": "c"}, "type": "conversation.item.created"}
+    # An inner "type" before the event's own is not trusted: the event is parsed.
+    assert sniff_event_type(json.dumps(item)) is None
+    assert parse_tool_event(json.dumps(item)) == item
+
+    done = {"event_id": "ev_1", "type": "response.function_call_arguments.done", "call_id": "c"}
+    assert parse_tool_event(json.dumps(done)) == done
+    assert parse_tool_event("no es json") is None
+
+
+def test_relay_benchmark_finds_the_same_calls_with_less_decoding() -> None:
+    from benchmarks.relay_bench import run_benchmark
+
+    report = run_benchmark(minutes=1)
+
+    assert report["json"]["tool_calls_per_minute"] == report["fast"]["tool_calls_per_minute"] == 3
+    assert report["json"]["decoded_per_minute"] == report["frames_per_minute"]
+    assert report["fast"]["decoded_per_minute"] == 3
+
+
+def test_relay_load_harness_measures_a_real_worker() -> None:
+    pytest.importorskip("uvicorn")
+    from benchmarks.relay_load import run_benchmark
+
+    report = run_benchmark(levels=(2,), duration=1.0, delta_ms=50, tool_every=5, ramp=0.1)
+
+    [level] = report["levels"]
+    assert level["ready"] == 2 and level["errors"] == []
+    for direction in ("downstream", "upstream", "tool_roundtrip"):
+        assert level["latency_ms"][direction]["p50"] is not None
+    assert level["messages_per_second"]["upstream"] > 0
+    assert level["relay"]["tool_calls"] > 0
+    assert level["worker"]["rss_mb"] > 0
+    assert report["max_sessions_within_slo"] == 2
+
+
+def test_binary_audio_framing_in_both_directions(monkeypatch) -> None:
+    import base64
+
+    import main
+
+    speech = bytes(range(256)) * 10
+    ids = {"response_id": "resp_1", "item_id": "item_1", "output_index": 0, "content_index": 0}
+    delta = {"type": "response.output_audio.delta", **ids, "delta": base64.b64encode(speech).decode()}
+    upstream = FakeUpstream(
+        [
+            delta,
+            delta,
+            {"type": "response.output_audio_transcript.delta", "delta": "Hola"},
+            {**delta, "item_id": "item_2"},
+        ]
+    )
+    _patch_setup(monkeypatch, upstream)
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/realtime/ws") as ws:
+            ws.send_json({"token": "valid", "audio_framing": "binary"})
+            assert ws.receive_json() == {"type": "relay.ready", "audio_framing": "binary"}
+            # One header per audio item gives the ids the binary frames lack.
+            assert ws.receive_json() == {"type": "relay.audio_item", **ids}
+            assert ws.receive_bytes() == speech
+            assert ws.receive_bytes() == speech
+            assert ws.receive_json()["delta"] == "Hola"
+            assert ws.receive_json() == {"type": "relay.audio_item", **ids, "item_id": "item_2"}
+            assert ws.receive_bytes() == speech
+            ws.send_bytes(b"\x01\x00\x02\x00")
+            ws.send_text(json.dumps({"type": "input_audio_buffer.commit"}))
+            deadline = time.monotonic() + 2
+            while len(upstream.sent) < 3 and time.monotonic() < deadline:
+                time.sleep(0.02)
+
+    append, commit = [json.loads(m) for m in upstream.sent[1:]]
+    assert append == {"type": "input_audio_buffer.append", "audio": base64.b64encode(b"\x01\x00\x02\x00").decode()}
+    assert commit == {"type": "input_audio_buffer.commit"}
+
+
+def test_full_queue_drops_oldest_audio_and_holds_control_events() -> None:
+    from realtime_relay import RelayQueue
+
+    async def scenario():
+        audio = [json.dumps({"type": "response.output_audio.delta", "delta": str(i) * 40}) for i in range(3)]
+        control = json.dumps({"type": "response.done"})
+        queue = RelayQueue(max_bytes=10_000, max_messages=3)
+        for message in audio:
+            await queue.put(message)
+        await queue.put(control)
+        # The stalest delta made room for the control event.
+        assert queue.stats["dropped"] == 1
+        assert [await queue.get() for _ in range(3)] == [audio[1], audio[2], control]
+
+        full = RelayQueue(max_bytes=10_000, max_messages=2)
+        await full.put(control)
+        await full.put(control)
+        await full.put(b"\x00\x01")  # binary audio with no room is dropped
+        waiting = asyncio.create_task(full.put(control))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()  # control events wait instead
+        assert await full.get() == control
+        await asyncio.wait_for(waiting, 1)
+        assert full.stats == {**full.stats, "dropped": 1, "waits": 1, "messages": 3, "max_depth": 2}
+        await full.close()
+        assert [await full.get() for _ in range(3)] == [control, control, None]
+
+    asyncio.run(scenario())
+
+
+def test_upstream_drop_is_reported_after_queued_events_and_counted(monkeypatch) -> None:
+    import main
+    from realtime_relay import RelayMetrics
+
+    metrics = RelayMetrics()
+    monkeypatch.setattr(main, "relay_metrics", metrics)
+    monkeypatch.setattr("realtime_relay.REALTIME_RECONNECT_ATTEMPTS", 1)
+    upstream = FakeUpstream([AUDIO_DELTA, AUDIO_DELTA], drop_after_events=True)
+    _patch_setup(monkeypatch, upstream)
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/realtime/ws") as ws:
+            ws.send_json({"token": "valid"})
+            assert ws.receive_json()["type"] == "relay.ready"
+            assert ws.receive_json() == AUDIO_DELTA
+            assert ws.receive_json() == AUDIO_DELTA
+            assert ws.receive_json() == {
+                "type": "relay.upstream_closed",
+                "code": 1011,
+                "reason": "internal error",
+            }
+
+    queues = metrics.stats()["queues"]
+    assert metrics.stats()["active_relays"] == 0
+    assert metrics.stats()["reconnect_failures"] == 1
+    assert queues["downstream"]["messages"] == 3
+    assert queues["downstream"]["bytes"] > 2 * len(json.dumps(AUDIO_DELTA))
+    assert queues["downstream"]["dropped"] == 0
+    assert queues["upstream"]["messages"] == 0
+
+
+def _receive_until(ws, event_type: str, limit: int = 50) -> list:
+    seen = []
+    for _ in range(limit):
+        message = ws.receive()
+        if message.get("text") is None:
+            continue
+        event = json.loads(message["text"])
+        seen.append(event)
+        if event["type"] == event_type:
+            return seen
+    raise AssertionError(f"{event_type} not received: {[e['type'] for e in seen]}")
+
+
+def test_upstream_drop_reconnects_and_resumes_the_conversation(monkeypatch) -> None:
+    import main
+    from benchmarks.fake_realtime import FakeRealtimeServer
+    from realtime_relay import RelayMetrics
+
+    metrics = RelayMetrics()
+    monkeypatch.setattr(main, "relay_metrics", metrics)
+    with FakeRealtimeServer(audio_deltas=2, delta_bytes=48) as server:
+        monkeypatch.setattr(main, "XAI_REALTIME_URL", server.url)
+        # Real websocket connects to the fake server; only auth and context are faked.
+        connect = main._connect_realtime_upstream
+        _patch_setup(monkeypatch, None)
+        monkeypatch.setattr(main, "_connect_realtime_upstream", connect)
+
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/realtime/ws") as ws:
+                ws.send_json({"token": "valid"})
+                assert ws.receive_json()["type"] == "relay.ready"
+                ws.send_json({"type": "input_audio_buffer.commit"})
+                ws.send_json({"type": "response.create"})
+                _receive_until(ws, "response.done")
+
+                server.drop_connections()
+                reconnected = _receive_until(ws, "relay.upstream_reconnected")[-1]
+
+                ws.send_json({"type": "response.create"})
+                _receive_until(ws, "response.done")
+
+    first, second = server.connections
+    resumed = [json.loads(m) for m in second]
+    assert resumed[0]["type"] == "session.update"
+    assert resumed[0] == json.loads(first[0])
+    replayed = [e["item"] for e in resumed if e["type"] == "conversation.item.create"]
+    assert replayed == [
+        {"type": "message", "role": "user", "content": [{"type": "input_text", "text": "hola"}]},
+        {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": "Hola, ¿qué tal está?"}],
+        },
+    ]
+    assert resumed[-1]["type"] == "response.create"
+    stats = metrics.stats()
+    assert stats["reconnects"] == 1
+    # Reconnect time: local handshake plus the replay, no backoff needed.
+    assert 0 < reconnected["reconnect_ms"] < 1000
+    assert stats["reconnect_ms"]["max"] < 1000
@@ -48,7 +48,15 @@ def test_extract_realtime_function_call_returns_none_for_non_tool_event() -> Non
 def test_realtime_session_defaults_to_backend_tool_handler(monkeypatch) -> None:
     import main
 
+    fetches = []
+
+    async def fetch(user_id):
+        fetches.append(user_id)
+        return {}
+
     monkeypatch.setattr(main, "_get_xai_api_key", lambda: "test-key")
+    monkeypatch.setattr(main, "fetch_user_profile", fetch)
+    monkeypatch.setattr(main, "fetch_tutor_profile", fetch)
     main.app.dependency_overrides[main.get_current_user_id] = lambda: "user-123"
 
     try:
@@ -60,3 +68,110 @@ def test_realtime_session_defaults_to_backend_tool_handler(monkeypatch) -> None:
     assert response.status_code == 200
     assert response.json()["tool_call_handler"] == "backend"
     assert response.json()["voice"] == "c630b236"
+    # The backend runs the tools itself: no handle, no profile fetch.
+    assert "session_token" not in response.json()
+    assert fetches == []
+
+
+def test_realtime_tool_resolves_the_session_context_without_refetching(monkeypatch) -> None:
+    import main
+    from realtime_sessions import RealtimeSessionStore
+
+    fetches = []
+    executed = []
+
+    async def fetch_profile(user_id):
+        fetches.append("profile")
+        return {"name": "Carmen"}
+
+    async def fetch_tutor(user_id):
+        fetches.append("tutor")
+        return {"name": "Lucía"}
+
+    async def execute(name, arguments, context):
+        executed.append(context)
+        return "ok"
+
+    monkeypatch.setattr(main, "_get_xai_api_key", lambda: "test-key")
+    monkeypatch.setattr(main, "realtime_sessions", RealtimeSessionStore())
+    monkeypatch.setattr(main, "fetch_user_profile", fetch_profile)
+    monkeypatch.setattr(main, "fetch_tutor_profile", fetch_tutor)
+    monkeypatch.setattr(main, "execute_tool", execute)
+    main.app.dependency_overrides[main.get_current_user_id] = lambda: "user-123"
+
+    try:
+        with TestClient(main.app) as client:
+            token = client.post("/realtime/session", json={"tool_call_handler": "frontend"}).json()["session_token"]
+            for _ in range(3):
+                response = client.post(
+                    "/realtime/tool", json={"name": "obtener_clima", "session_token": token}
+                )
+                assert response.json() == {"result": "ok"}
+            client.post(
+                "/realtime/tool",
+                json={"name": "obtener_clima", "session_token": token, "latitude": 40.4, "longitude": -3.7},
+            )
+    finally:
+        main.app.dependency_overrides.clear()
+
+    # One fetch per profile when the session starts, none per tool call.
+    assert sorted(fetches) == ["profile", "tutor"]
+    assert executed[0]["user_profile"] == {"name": "Carmen", "id": "user-123"}
+    assert executed[0]["tutor_profile"] == {"name": "Lucía"}
+    assert executed[3]["user_location"] == {"latitude": 40.4, "longitude": -3.7}
+    assert executed[0]["user_location"] == {}
+    assert main.realtime_sessions.stats()["hits"] == 4
+
+
+def test_realtime_tool_falls_back_to_fetching_for_foreign_or_unknown_tokens(monkeypatch) -> None:
+    import main
+    from realtime_sessions import RealtimeSessionStore
+
+    store = RealtimeSessionStore()
+    foreign = store.mint("user-999", {"user_id": "user-999"})
+    fetches = []
+
+    async def fetch(user_id):
+        fetches.append(user_id)
+        return {}
+
+    async def execute(name, arguments, context):
+        return context["user_id"]
+
+    monkeypatch.setattr(main, "realtime_sessions", store)
+    monkeypatch.setattr(main, "fetch_user_profile", fetch)
+    monkeypatch.setattr(main, "fetch_tutor_profile", fetch)
+    monkeypatch.setattr(main, "execute_tool", execute)
+    main.app.dependency_overrides[main.get_current_user_id] = lambda: "user-123"
+
+    try:
+        with TestClient(main.app) as client:
+            stolen = client.post("/realtime/tool", json={"name": "x", "session_token": foreign})
+            missing = client.post("/realtime/tool", json={"name": "x"})
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert stolen.json() == {"result": "user-123"}
+    assert missing.json() == {"result": "user-123"}
+    assert fetches == ["user-123"] * 4
+    assert store.stats()["invalid"] == 1
+
+
+def test_session_store_expires_evicts_and_rejects_tampered_handles() -> None:
+    from realtime_sessions import RealtimeSessionStore
+
+    now = [1000.0]
+    store = RealtimeSessionStore(ttl_seconds=60, max_entries=2, clock=lambda: now[0])
+    first = store.mint("u", {"n": 1})
+    second = store.mint("u", {"n": 2})
+
+    assert store.resolve(second, "u") == {"n": 2}
+    session_id, expires, signature = second.split(".")
+    assert store.resolve(f"{session_id}.{int(expires) + 600}.{signature}", "u") is None
+
+    store.mint("u", {"n": 3})
+    assert store.resolve(first, "u") is None  # evicted, oldest first
+    now[0] += 61
+    assert store.resolve(second, "u") is None
+    stats = store.stats()
+    assert (stats["evicted"], stats["invalid"], stats["misses"], stats["expired"]) == (1, 1, 1, 1)
@@ -0,0 +1,165 @@
+from langchain_core.messages import AIMessage
+
+
+def test_predict_tool_calls_scores_weather_news_and_reminders() -> None:
+    from tool_prefetch import predict_tool_calls
+
+    gps = {"latitude": 41.3874, "longitude": 2.1686}
+    profile = {"id": "user-1", "city": "Barcelona"}
+
+    assert predict_tool_calls("¿Qué tiempo hace hoy?", gps, profile) == [("obtener_clima", {})]
+    assert predict_tool_calls("¿Va a llover en Sevilla?", gps, profile) == []
+    assert predict_tool_calls("Cuéntame las noticias", {}, profile) == [("obtener_noticias", {})]
+    assert predict_tool_calls("¿Qué dice El País hoy?", {}, profile) == [
+        ("obtener_noticias_periodicos", {"periodico": "elpais"})
+    ]
+    assert predict_tool_calls("¿Cuáles son mis recordatorios?", {}, profile) == [
+        ("listar_recordatorios", {})
+    ]
+    assert predict_tool_calls("Hola, buenos días", gps, profile) == []
+
+
+def _scripted_llm(responses: list):
+    class FakeLLM:
+        def invoke(self, messages):
+            return responses.pop(0)
+
+    return FakeLLM()
+
+
+def test_graph_uses_prefetched_weather_instead_of_calling_upstream(monkeypatch) -> None:
+    import chatbot
+    import tool_registry
+    from tool_prefetch import ToolPrefetcher
+
+    calls: list[dict] = []
+
+    def fake_get_weather(**kwargs):
+        calls.append(kwargs)
+        return {"error": None, "weather": {"ciudad": "Barcelona"}}
+
+    prefetcher = ToolPrefetcher()
+    monkeypatch.setattr(chatbot, "tool_prefetcher", prefetcher)
+    monkeypatch.setattr(tool_registry, "get_weather", fake_get_weather)
+    monkeypatch.setattr(tool_registry, "format_weather_for_chat", lambda data: "Ciudad: Barcelona")
+    monkeypatch.setattr(
+        chatbot,
+        "llm_with_tools",
+        _scripted_llm(
+            [
+                AIMessage(
+                    content="",
+                    tool_calls=[{"name": "obtener_clima", "args": {"ciudad": ""}, "id": "call_1"}],
+                ),
+                AIMessage(content="Hace sol en Barcelona."),
+            ]
+        ),
+    )
+
+    result = chatbot.chatbot(
+        "¿Qué tiempo hace?",
+        user_profile={"id": "user-1", "city": "Madrid"},
+        user_location={"latitude": 41.3874, "longitude": 2.1686},
+    )
+
+    assert result == "Hace sol en Barcelona."
+    assert calls == [
+        {"city": "", "country_code": "ES", "latitude": 41.3874, "longitude": 2.1686}
+    ]
+    assert prefetcher.stats()["hits"] == 1
+    assert prefetcher.stats()["wasted"] == 0
+
+
+def test_unused_prefetch_is_counted_as_wasted(monkeypatch) -> None:
+    import chatbot
+    import tool_registry
+    from tool_prefetch import ToolPrefetcher
+
+    prefetcher = ToolPrefetcher()
+    monkeypatch.setattr(chatbot, "tool_prefetcher", prefetcher)
+    monkeypatch.setattr(
+        tool_registry, "get_weather", lambda **kwargs: {"error": None, "weather": {"ciudad": "Madrid"}}
+    )
+    monkeypatch.setattr(
+        chatbot, "llm_with_tools", _scripted_llm([AIMessage(content="¿De qué ciudad?")])
+    )
+
+    chatbot.chatbot("¿Qué tiempo hace?", user_profile={"id": "user-1", "city": "Madrid"})
+
+    stats = prefetcher.stats()
+    assert stats["started"] == 1
+    assert stats["wasted"] == 1
+    assert stats["hits"] == 0
+
+
+def test_failed_prefetch_counts_as_failure_not_hit(monkeypatch) -> None:
+    import chatbot
+    import tool_registry
+    from tool_prefetch import ToolPrefetcher
+
+    prefetcher = ToolPrefetcher()
+    monkeypatch.setattr(chatbot, "tool_prefetcher", prefetcher)
+    monkeypatch.setattr(chatbot, "PREFETCH_WAIT_SECONDS", 0.01)
+
+    def slow_weather(**kwargs):
+        import time
+
+        time.sleep(0.2)
+        return {"error": None, "weather": {"ciudad": "Madrid"}}
+
+    monkeypatch.setattr(tool_registry, "get_weather", slow_weather)
+    monkeypatch.setattr(
+        chatbot,
+        "llm_with_tools",
+        _scripted_llm(
+            [
+                AIMessage(
+                    content="",
+                    tool_calls=[{"name": "obtener_clima", "args": {"ciudad": ""}, "id": "call_1"}],
+                ),
+                AIMessage(content="Hace sol."),
+            ]
+        ),
+    )
+
+    chatbot.chatbot("¿Qué tiempo hace?", user_profile={"id": "user-1", "city": "Madrid"})
+
+    stats = prefetcher.stats()
+    assert stats["failed"] == 1
+    assert stats["hits"] == 0
+
+
+def test_prefetched_error_falls_back_to_the_real_tool_call(monkeypatch) -> None:
+    import chatbot
+    import tool_registry
+    from tool_prefetch import ToolPrefetcher
+
+    answers = ["Error al obtener el clima: tiempo de espera agotado", "Ciudad: Barcelona"]
+    seen: list = []
+
+    prefetcher = ToolPrefetcher()
+    monkeypatch.setattr(chatbot, "tool_prefetcher", prefetcher)
+    monkeypatch.setattr(tool_registry, "get_weather", lambda **kwargs: {})
+    monkeypatch.setattr(tool_registry, "format_weather_for_chat", lambda data: answers.pop(0))
+
+    class RecordingLLM:
+        replies = [
+            AIMessage(content="", tool_calls=[{"name": "obtener_clima", "args": {"ciudad": ""}, "id": "call_1"}]),
+            AIMessage(content="Hace sol en Barcelona."),
+        ]
+
+        def invoke(self, messages):
+            seen.append(messages[-1].content)
+            return self.replies.pop(0)
+
+    monkeypatch.setattr(chatbot, "llm_with_tools", RecordingLLM())
+
+    chatbot.chatbot(
+        "¿Qué tiempo hace?",
+        user_profile={"id": "user-1", "city": "Madrid"},
+        user_location={"latitude": 41.3874, "longitude": 2.1686},
+    )
+
+    assert seen[-1] == "Ciudad: Barcelona"
+    assert answers == []
+    assert (prefetcher.stats()["hits"], prefetcher.stats()["failed"]) == (0, 1)
@@ -0,0 +1,150 @@
+import asyncio
+import dataclasses
+
+import pytest
+from langchain_core.messages import AIMessage
+
+
+def test_langchain_and_realtime_tools_come_from_the_same_specs() -> None:
+    import chatbot
+    import tool_registry
+
+    realtime_names = [t["name"] for t in tool_registry.REALTIME_TOOLS]
+    assert realtime_names == [t.name for t in chatbot.tools]
+
+    clima = next(t for t in chatbot.tools if t.name == "obtener_clima")
+    schema = clima.tool_call_schema.model_json_schema()
+    # The injected graph state must never be exposed to the model.
+    assert set(schema["properties"]) == {"ciudad"}
+
+
+@pytest.mark.asyncio
+async def test_run_tool_enforces_timeout_and_records_metrics(monkeypatch) -> None:
+    import tool_registry
+
+    async def slow_tool(args: dict, ctx: dict) -> str:
+        await asyncio.sleep(1)
+        return "tarde"
+
+    spec = dataclasses.replace(
+        tool_registry.TOOL_SPECS_BY_NAME["listar_recordatorios"],
+        handler=slow_tool,
+        timeout=0.01,
+    )
+    monkeypatch.setitem(tool_registry.TOOL_SPECS_BY_NAME, "listar_recordatorios", spec)
+    before = tool_registry.tool_metrics()["listar_recordatorios"]["timeouts"]
+
+    result = await tool_registry.execute_tool("listar_recordatorios", "{}", {"user_id": "u"})
+
+    assert "ha tardado demasiado" in result
+    assert tool_registry.tool_metrics()["listar_recordatorios"]["timeouts"] == before + 1
+
+
+def test_chat_tools_read_context_from_graph_state(monkeypatch) -> None:
+    import chatbot
+    import tool_registry
+
+    captured: dict = {}
+
+    async def fake_list_active_reminders(user_id: str) -> list:
+        captured["user_id"] = user_id
+        return []
+
+    responses = [
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "listar_recordatorios", "args": {}, "id": "call_1"}],
+        ),
+        AIMessage(content="No tiene recordatorios."),
+    ]
+
+    class FakeLLM:
+        def invoke(self, messages):
+            return responses.pop(0)
+
+    monkeypatch.setattr(tool_registry, "list_active_reminders", fake_list_active_reminders)
+    monkeypatch.setattr(chatbot, "llm_with_tools", FakeLLM())
+
+    result = chatbot.chatbot("Hola", user_profile={"id": "user-42"})
+
+    assert result == "No tiene recordatorios."
+    assert captured["user_id"] == "user-42"
+
+
+@pytest.mark.asyncio
+async def test_timeout_of_a_side_effecting_tool_asks_not_to_retry(monkeypatch) -> None:
+    import tool_registry
+
+    async def slow_sms(args: dict, ctx: dict) -> str:
+        await asyncio.sleep(1)
+        return "enviado"
+
+    spec = dataclasses.replace(
+        tool_registry.TOOL_SPECS_BY_NAME["enviar_alerta_sms"], handler=slow_sms, timeout=0.01
+    )
+    monkeypatch.setitem(tool_registry.TOOL_SPECS_BY_NAME, "enviar_alerta_sms", spec)
+
+    result = await tool_registry.execute_tool("enviar_alerta_sms", "{}", {"user_id": "u"})
+
+    assert "no se sabe si se ha completado" in result
+    assert "No la vuelvas a llamar" in result
+    assert "Inténtalo de nuevo" not in result
+
+
+@pytest.mark.asyncio
+async def test_side_effecting_tool_still_queued_at_timeout_reports_busy(monkeypatch) -> None:
+    import tool_registry
+
+    release = asyncio.Event()
+
+    async def blocked_sms(args: dict, ctx: dict) -> str:
+        await release.wait()
+        return "enviado"
+
+    spec = dataclasses.replace(
+        tool_registry.TOOL_SPECS_BY_NAME["enviar_alerta_sms"], handler=blocked_sms, timeout=5, max_concurrency=1
+    )
+    monkeypatch.setitem(tool_registry.TOOL_SPECS_BY_NAME, "enviar_alerta_sms", spec)
+    monkeypatch.setattr(tool_registry, "TOOL_QUEUE_TIMEOUT_SECONDS", 0.05)
+
+    running = asyncio.create_task(tool_registry.execute_tool("enviar_alerta_sms", "{}", {"user_id": "u"}))
+    await asyncio.sleep(0.01)
+    queued = await tool_registry.execute_tool("enviar_alerta_sms", "{}", {"user_id": "u"})
+    release.set()
+
+    assert queued == "Error: la herramienta enviar_alerta_sms está ocupada. Inténtalo de nuevo."
+    assert await running == "enviado"
+
+
+def test_run_tool_sync_limits_concurrency_across_calls(monkeypatch) -> None:
+    import threading
+
+    import tool_registry
+
+    inflight = peak = 0
+    lock = threading.Lock()
+
+    async def tracked(args: dict, ctx: dict) -> str:
+        nonlocal inflight, peak
+        with lock:
+            inflight += 1
+            peak = max(peak, inflight)
+        await asyncio.sleep(0.05)
+        with lock:
+            inflight -= 1
+        return "ok"
+
+    spec = dataclasses.replace(tool_registry.TOOL_SPECS_BY_NAME["listar_recordatorios"], handler=tracked)
+    monkeypatch.setitem(tool_registry.TOOL_SPECS_BY_NAME, "listar_recordatorios", spec)
+    monkeypatch.setitem(tool_registry._sync_semaphores, "listar_recordatorios", threading.BoundedSemaphore(2))
+
+    threads = [
+        threading.Thread(target=tool_registry.run_tool_sync, args=("listar_recordatorios", {}, {}))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == 2
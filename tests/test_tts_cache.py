@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+
+def test_key_ignores_whitespace_but_not_voice_speed_or_format() -> None:
+    from tts_cache import tts_key
+
+    key = tts_key("Recordatorio  creado.\n", "nova", 0.9, "opus")
+    assert key == tts_key(" Recordatorio creado.", "nova", 0.9, "opus")
+    # Same text in decomposed form (i + combining accent) is the same clip.
+    assert tts_key("Buenos d\u00edas", "nova", 0.9, "opus") == tts_key("Buenos di\u0301as", "nova", 0.9, "opus")
+    assert len({
+        key,
+        tts_key("Recordatorio creado.", "alloy", 0.9, "opus"),
+        tts_key("Recordatorio creado.", "nova", 1.0, "opus"),
+        tts_key("Recordatorio creado.", "nova", 0.9, "mp3"),
+    }) == 4
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes() -> None:
+    from tts_cache import TTSCache
+
+    cache = TTSCache(memory_bytes=25, directory="")
+
+    async def run():
+        await cache.put("a", b"a" * 10, "a")
+        await cache.put("b", b"b" * 10, "b")
+        assert await cache.get("a") == b"a" * 10
+        await cache.put("c", b"c" * 10, "c")
+        assert await cache.get("b") is None
+        assert await cache.get("a") is not None and await cache.get("c") is not None
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["memory_evictions"] == 1
+    assert stats["memory_bytes"] == 20
+    assert stats["hit_ratio"] == 0.75
+
+
+def test_long_texts_are_cached_only_once_repeated() -> None:
+    from tts_cache import TTSCache
+
+    cache = TTSCache(directory="", max_chars=20)
+    answer = "Buenos días, Carmen. Hoy tiene cita con el médico a las diez."
+
+    async def run():
+        await cache.put("short", b"s", "Recordatorio creado.")
+        await cache.put("long", b"l", answer)
+        first = await cache.get("long")
+        await cache.put("long", b"l", answer)
+        return first, await cache.get("short"), await cache.get("long")
+
+    assert asyncio.run(run()) == (None, b"s", b"l")
+    assert (cache.stats()["stored"], cache.stats()["skipped"]) == (2, 1)
+
+
+def test_disk_tier_survives_restarts_and_keeps_lru_order(tmp_path) -> None:
+    from tts_cache import TTSCache
+
+    cache = TTSCache(memory_bytes=0, directory=str(tmp_path), disk_bytes=30)
+
+    async def fill():
+        for key in "abc":
+            await cache.put(key, key.encode() * 10, key)
+
+    asyncio.run(fill())
+    old = os.path.getmtime(tmp_path / "a.opus") - 60
+    os.utime(tmp_path / "b.opus", (old, old))  # least recently used
+
+    restarted = TTSCache(memory_bytes=1024, directory=str(tmp_path), disk_bytes=30)
+
+    async def use():
+        assert await restarted.get("a") == b"a" * 10
+        await restarted.put("d", b"d" * 10, "d")
+        # The disk hit was promoted to memory.
+        assert await restarted.get("a") == b"a" * 10
+
+    asyncio.run(use())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.opus", "c.opus", "d.opus"]
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["disk_evictions"], stats["disk_bytes"]) == (1, 1, 30)
+    assert stats["memory_hits"] == 1
+
+
+def test_workers_sharing_a_directory_keep_it_within_budget(monkeypatch, tmp_path) -> None:
+    import tts_cache
+    from tts_cache import TTSCache
+
+    # Rescan on every write, so each worker sees the other's clips.
+    monkeypatch.setattr(tts_cache, "TTS_CACHE_SWEEP_SECONDS", 0)
+    one = TTSCache(memory_bytes=0, directory=str(tmp_path), disk_bytes=30)
+    two = TTSCache(memory_bytes=0, directory=str(tmp_path), disk_bytes=30)
+
+    async def run():
+        await one.put("a", b"a" * 10, "a")
+        await two.put("b", b"b" * 10, "b")
+        os.utime(tmp_path / "a.opus", (1, 1))
+        await one.put("c", b"c" * 10, "c")
+        await two.put("d", b"d" * 10, "d")
+        # a was evicted by the other worker: a plain miss, not an error.
+        return await one.get("a"), await one.get("b")
+
+    assert asyncio.run(run()) == (None, b"b" * 10)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.opus", "c.opus", "d.opus"]
+    assert two.stats()["disk_bytes"] == 30
+    assert one.stats()["disk_errors"] == two.stats()["disk_errors"] == 0
+
+
+def test_repeated_utterances_skip_the_tts_api(monkeypatch, tmp_path) -> None:
+    import voice
+    from benchmarks.tts_bench import FakeSpeechClient
+    from tts_cache import TTSCache
+
+    speech = FakeSpeechClient(first_chunk_ms=0, chunk_ms=0)
+    cache = TTSCache(directory=str(tmp_path))
+    monkeypatch.setattr(voice, "client", speech)
+    monkeypatch.setattr(voice, "tts_cache", cache)
+
+    async def speak():
+        first = await voice.text_to_speech("Recordatorio creado.")
+        again = await voice.text_to_speech("Recordatorio   creado. ")
+        streamed = b"".join([chunk async for chunk in voice.text_to_speech_stream("Recordatorio creado.")])
+        other_voice = await voice.text_to_speech("Recordatorio creado.", voice="alloy")
+        return first, again, streamed, other_voice
+
+    first, again, streamed, other_voice = asyncio.run(speak())
+
+    assert first == again == streamed
+    assert other_voice != first
+    assert speech.calls == 2
+    assert cache.stats()["hit_ratio"] == 0.5
@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def test_sentence_splitter_cuts_complete_sentences_from_streamed_text() -> None:
+    from voice import SentenceSplitter
+
+    splitter = SentenceSplitter(min_chars=20)
+    text = "Hola. Claro que sí, Sr. García, le cuento. Hoy hace sol en Madrid! ¿Quiere saber más? Vale 3.5 euros"
+    sentences = []
+    for start in range(0, len(text), 3):
+        sentences += splitter.feed(text[start:start + 3])
+
+    # "Hola." is too short on its own; "Sr." is not an ending; 3.5 is a number.
+    assert sentences == ["Hola. Claro que sí, Sr. García, le cuento.", "Hoy hace sol en Madrid!"]
+    assert splitter.flush() == "¿Quiere saber más? Vale 3.5 euros"
+
+
+def test_speak_stream_keeps_order_and_bounds_tts_concurrency(monkeypatch) -> None:
+    import voice
+
+    in_flight = []
+    peak = []
+
+    async def tts(text, voice="nova"):
+        in_flight.append(text)
+        peak.append(len(in_flight))
+        # Later sentences finish first.
+        await asyncio.sleep(0.05 if text.startswith("Primera") else 0.01)
+        in_flight.remove(text)
+        return text.encode()
+
+    async def tokens():
+        for sentence in ("Primera frase bastante larga. ", "Segunda frase bastante larga. ", "Tercera y última"):
+            yield sentence
+
+    async def collect():
+        return [item async for item in voice.speak_stream(tokens(), concurrency=2)]
+
+    monkeypatch.setattr(voice, "text_to_speech", tts)
+    spoken = asyncio.run(collect())
+
+    assert [sentence for sentence, _ in spoken] == [
+        "Primera frase bastante larga.",
+        "Segunda frase bastante larga.",
+        "Tercera y última",
+    ]
+    assert spoken[0][1] == b"Primera frase bastante larga."
+    assert max(peak) == 2
+
+
+def test_speak_stream_raises_chat_errors_after_the_spoken_sentences(monkeypatch) -> None:
+    import voice
+
+    async def tts(text, voice="nova"):
+        return text.encode()
+
+    async def tokens():
+        yield "Una frase completa y larga. "
+        raise RuntimeError("sin conexión")
+
+    async def collect(spoken):
+        async for sentence, _ in voice.speak_stream(tokens()):
+            spoken.append(sentence)
+
+    monkeypatch.setattr(voice, "text_to_speech", tts)
+    spoken = []
+    with pytest.raises(RuntimeError, match="sin conexión"):
+        asyncio.run(collect(spoken))
+    assert spoken == ["Una frase completa y larga."]
+
+
+def test_voice_stream_endpoint_sends_transcript_ordered_audio_and_answer(monkeypatch) -> None:
+    import main
+    from benchmarks.voice_bench import SimulatedServices
+
+    services = SimulatedServices(
+        "Buenos días, Carmen. Hoy hace sol en Madrid. ¿Quiere que le lea las noticias?",
+        stt_ms=0,
+        first_token_ms=0,
+        tokens_per_second=10_000,
+        tts_ms=0,
+        tts_ms_per_char=0,
+    )
+    originals = services.install()
+
+    async def no_profile(user_id):
+        return None
+
+    monkeypatch.setattr(main, "fetch_user_profile", no_profile)
+    main.app.dependency_overrides[main.get_current_user_id] = lambda: "user-voice"
+    try:
+        with TestClient(main.app) as client:
+            response = client.post(
+                "/voice/stream", files={"audio": ("audio.webm", b"audio", "audio/webm")}
+            )
+    finally:
+        main.app.dependency_overrides.clear()
+        services.restore(originals)
+
+    events = [
+        line[len("data: "):] for line in response.text.split("\n\n") if line.startswith("data: ")
+    ]
+    assert events[-1] == "[DONE]"
+    payloads = [json.loads(event) for event in events[:-1]]
+    assert payloads[0] == {"text": "¿Qué noticias hay hoy?"}
+    audio = payloads[1:-1]
+    assert [p["index"] for p in audio] == [0, 1, 2]
+    assert [p["sentence"] for p in audio] == [
+        "Buenos días, Carmen.",
+        "Hoy hace sol en Madrid.",
+        "¿Quiere que le lea las noticias?",
+    ]
+    assert base64.b64decode(audio[0]["audio"]) == "Buenos días, Carmen.".encode()
+    assert payloads[-1] == {"response": services.answer}
+
+
+def test_voice_benchmark_pipelined_audio_starts_sooner() -> None:
+    from benchmarks.voice_bench import run_benchmark
+
+    answer = "Claro que sí, le cuento las noticias de hoy. " * 4
+    report = run_benchmark(
+        {"larga": answer},
+        concurrency=(2,),
+        stt_ms=10,
+        first_token_ms=20,
+        tokens_per_second=400,
+        tts_ms=50,
+        tts_ms_per_char=0.5,
+    )
+
+    result = report["larga"]
+    assert result["pipelined_2"]["sentences"] == 4
+    assert result["pipelined_2"]["ttfa_ms"] < result["sequential"]["ttfa_ms"]
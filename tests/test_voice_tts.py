@@ -0,0 +1,74 @@
+import base64
+
+from fastapi.testclient import TestClient
+
+
+def _client(monkeypatch, speech_client):
+    import main
+    import voice
+    from tts_cache import TTSCache
+
+    monkeypatch.setattr(voice, "client", speech_client)
+    monkeypatch.setattr(voice, "tts_cache", TTSCache(directory=""))
+    main.app.dependency_overrides[main.get_current_user_id] = lambda: "user-tts"
+    return TestClient(main.app)
+
+
+def test_tts_stream_returns_the_same_audio_as_raw_opus(monkeypatch) -> None:
+    import main
+    from benchmarks.tts_bench import FakeSpeechClient
+
+    speech = FakeSpeechClient(first_chunk_ms=0, chunk_ms=0, chunk_bytes=1000)
+    text = "Buenos días, Carmen. Hoy hace sol en Madrid."
+    try:
+        with _client(monkeypatch, speech) as client:
+            streamed = client.post("/voice/tts/stream", json={"text": text})
+            buffered = client.post("/voice/tts", json={"text": text})
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert streamed.status_code == 200
+    assert streamed.headers["content-type"] == "audio/ogg"
+    audio = base64.b64decode(buffered.json()["audio"])
+    assert len(streamed.content) == len(audio) == speech.audio_size(text)
+    assert len(streamed.content) < len(buffered.content)
+    # The streamed clip was cached, so the JSON request never reached the API.
+    assert speech.calls == 1
+    assert main.llm_metrics.ttft_percentile("voice.tts_stream", 0.5) is not None
+
+
+def test_tts_stream_validates_text_and_reports_tts_failures(monkeypatch) -> None:
+    import main
+
+    class FailingSpeech:
+        def __init__(self) -> None:
+            self.audio = self
+            self.speech = self
+            self.with_streaming_response = self
+
+        def create(self, **kwargs):
+            raise RuntimeError("cuota agotada")
+
+    try:
+        with _client(monkeypatch, FailingSpeech()) as client:
+            empty = client.post("/voice/tts/stream", json={"text": "   "})
+            failed = client.post("/voice/tts/stream", json={"text": "Hola"})
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert empty.status_code == 400
+    assert failed.status_code == 500
+    assert "cuota agotada" in failed.json()["detail"]
+
+
+def test_tts_benchmark_streaming_starts_audio_sooner_with_fewer_bytes() -> None:
+    from benchmarks.tts_bench import FakeSpeechClient, run_benchmark
+
+    texts = {"larga": "Claro que sí. " * 30}
+    report = run_benchmark(texts, runs=1, client=FakeSpeechClient(first_chunk_ms=20, chunk_ms=10))
+
+    larga = report["larga"]
+    assert larga["stream"]["chunks"] > 1
+    assert larga["stream"]["ttfa_ms"] * 2 < larga["json"]["ttfa_ms"]
+    # base64 inflates the JSON payload by a third.
+    assert 0.2 < larga["bytes_saved"] < 0.3
@@ -0,0 +1,277 @@
+"""Speculative prefetch of read-only tools for the chat path.
+
+While the first `llm_with_tools` call of a turn is in flight we already know,
+from the user's message, which tool the model is probably going to ask for
+("¿qué tiempo hace?" -> obtener_clima). This module scores the message with
+cheap keyword lists, starts the likely fetches in a small thread pool and hands
+the pre-warmed result to ToolNode when the model does request that tool, so a
+tool-using turn saves one full upstream round trip.
+
+Only read-only tools are ever prefetched — never SMS alerts or reminder
+creation. Prefetches the model does not end up using are discarded and counted
+as wasted; the number of prefetches per turn and in flight is capped.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from memory_index import fold
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("CHAT_TOOL_PREFETCH", "1") != "0"
+MAX_PREFETCHES_PER_TURN = 2
+MAX_INFLIGHT_PREFETCHES = 8
+PREFETCH_WAIT_SECONDS = 15.0
+PREFETCH_TTL_SECONDS = 60.0
+
+# (keyword, weight) lists per prefetchable tool. Keywords are matched against
+# the accent-folded, lower-cased message; multi-word keywords match as phrases.
+# A tool is prefetched once its score reaches PREFETCH_SCORE_THRESHOLD.
+PREFETCH_SCORE_THRESHOLD = 1.0
+
+WEATHER_KEYWORDS: list[tuple[str, float]] = [
+    ("clima", 1.0),
+    ("temperatura", 1.0),
+    ("llover", 1.0),
+    ("llueve", 1.0),
+    ("lluvia", 1.0),
+    ("paraguas", 1.0),
+    ("grados", 0.6),
+    ("calor", 0.6),
+    ("frio", 0.6),
+    ("sol", 0.4),
+    ("nublado", 1.0),
+    ("viento", 0.6),
+    ("que tiempo", 1.0),
+    ("tiempo hace", 1.0),
+    ("tiempo", 0.4),
+]
+
+NEWS_KEYWORDS: list[tuple[str, float]] = [
+    ("noticias", 1.0),
+    ("noticia", 1.0),
+    ("actualidad", 1.0),
+    ("titulares", 1.0),
+    ("que ha pasado", 0.6),
+    ("que pasa", 0.4),
+]
+
+NEWSPAPER_KEYWORDS: list[tuple[str, float]] = [
+    ("periodico", 1.0),
+    ("periodicos", 1.0),
+    ("prensa", 1.0),
+]
+
+REMINDER_LIST_KEYWORDS: list[tuple[str, float]] = [
+    ("mis recordatorios", 1.0),
+    ("recordatorios", 0.7),
+    ("que tengo pendiente", 1.0),
+    ("pendientes", 0.4),
+    ("avisos", 0.4),
+]
+
+# Newspaper keys as accepted by obtener_noticias_periodicos, keyed by how users
+# usually say them.
+NEWSPAPER_ALIASES: dict[str, str] = {
+    "el pais": "elpais",
+    "el mundo": "elmundo",
+    "la razon": "larazon",
+    "el periodico": "elperiodico",
+    "la vanguardia": "lavanguardia",
+    "abc": "abc",
+    "el espanol": "elespanol",
+    "el confidencial": "elconfidencial",
+    "eldiario": "eldiario",
+    "el diario": "eldiario",
+    "mundo deportivo": "mundodeportivo",
+}
+
+# "en Sevilla", "de Bilbao"... — when the user names a place the model will call
+# obtener_clima with that city, which does not match the GPS/profile prefetch.
+_NAMED_PLACE_RE = re.compile(r"\b(?:en|de|para)\s+[A-ZÁÉÍÓÚÑ][\wáéíóúñ]+")
+
+
+def _score(text: str, keywords: list[tuple[str, float]]) -> float:
+    padded = f" {text} "
+    return sum(weight for keyword, weight in keywords if f" {keyword} " in padded)
+
+
+def predict_tool_calls(
+    message: str,
+    user_location: Optional[dict] = None,
+    user_profile: Optional[dict] = None,
+) -> list[tuple[str, dict]]:
+    """Return the (tool_name, args) pairs worth prefetching for `message`.
+
+    Args are the ones the model issues for the plain request (no city, default
+    limits), which is what the prompt steers it towards. Best candidates first.
+    """
+    text = fold(message)
+    if not text:
+        return []
+
+    location = user_location or {}
+    profile = user_profile or {}
+    has_gps = location.get("latitude") is not None and location.get("longitude") is not None
+    scored: list[tuple[float, str, dict]] = []
+
+    weather_score = _score(text, WEATHER_KEYWORDS)
+    if weather_score and (has_gps or profile.get("city")) and not _NAMED_PLACE_RE.search(message or ""):
+        # With GPS the model has nothing to ask back, so the call is near-certain.
+        scored.append((weather_score + (0.2 if has_gps else 0.0), "obtener_clima", {}))
+
+    newspaper_score = _score(text, NEWSPAPER_KEYWORDS)
+    padded = f" {text} "
+    source = next(
+        (key for alias, key in NEWSPAPER_ALIASES.items() if f" {alias} " in padded),
+        None,
+    )
+    if source:
+        newspaper_score += 1.0
+    if newspaper_score:
+        scored.append(
+            (newspaper_score, "obtener_noticias_periodicos", {"periodico": source or "todos"})
+        )
+    else:
+        news_score = _score(text, NEWS_KEYWORDS)
+        if news_score:
+            scored.append((news_score, "obtener_noticias", {}))
+
+    if profile.get("id"):
+        reminder_score = _score(text, REMINDER_LIST_KEYWORDS)
+        if reminder_score:
+            scored.append((reminder_score, "listar_recordatorios", {}))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [
+        (name, args)
+        for score, name, args in scored
+        if score >= PREFETCH_SCORE_THRESHOLD
+    ]
+
+
+def args_key(args: Optional[dict], defaults: Optional[dict] = None) -> str:
+    """Canonical key for tool args, with schema defaults filled in."""
+    merged = {**(defaults or {}), **(args or {})}
+    return json.dumps(merged, sort_keys=True, ensure_ascii=False, default=str)
+
+
+@dataclass
+class _Prefetch:
+    future: concurrent.futures.Future
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class ToolPrefetcher:
+    """Per-turn store of in-flight speculative tool calls.
+
+    Entries are keyed by (turn_key, tool_name, args_key). The turn key is the id
+    of the user message that started the turn, so concurrent requests never
+    see each other's results.
+    """
+
+    def __init__(
+        self,
+        max_per_turn: int = MAX_PREFETCHES_PER_TURN,
+        max_inflight: int = MAX_INFLIGHT_PREFETCHES,
+        max_workers: int = 4,
+    ) -> None:
+        self.max_per_turn = max_per_turn
+        self.max_inflight = max_inflight
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tool-prefetch"
+        )
+        self._entries: dict[tuple[str, str, str], _Prefetch] = {}
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "hits": 0, "wasted": 0, "skipped": 0, "failed": 0}
+
+    def start(
+        self,
+        turn_key: str,
+        calls: list[tuple[str, dict, str]],
+        runner: Callable[[str, dict], Any],
+    ) -> int:
+        """Submit up to `max_per_turn` of (name, args, args_key) calls. Returns the count started."""
+        started = 0
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            for name, args, key in calls:
+                if started >= self.max_per_turn:
+                    break
+                entry_key = (turn_key, name, key)
+                if entry_key in self._entries:
+                    continue
+                if self._inflight_locked() >= self.max_inflight:
+                    self._stats["skipped"] += 1
+                    continue
+                future = self._pool.submit(runner, name, args)
+                self._entries[entry_key] = _Prefetch(future=future)
+                self._stats["started"] += 1
+                started += 1
+        return started
+
+    def settle(self, turn_key: str, tool_calls: list[tuple[str, str]]) -> None:
+        """Drop the turn's prefetches that the model did not ask for.
+
+        `tool_calls` holds the (name, args_key) pairs the model requested.
+        """
+        wanted = set(tool_calls)
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == turn_key]:
+                if (entry_key[1], entry_key[2]) not in wanted:
+                    self._discard_locked(entry_key)
+
+    def take(self, turn_key: str, name: str, key: str) -> Optional[concurrent.futures.Future]:
+        """Pop the prefetch matching a requested tool call, if any.
+
+        The caller reports the outcome with `record_hit` or `record_failure`,
+        so a prefetch that fails (or returns an error) is not counted as a hit.
+        """
+        with self._lock:
+            entry = self._entries.pop((turn_key, name, key), None)
+            return entry.future if entry is not None else None
+
+    @staticmethod
+    def is_error(content: Any) -> bool:
+        """Tool results starting with "Error" are failures to retry for real."""
+        return isinstance(content, str) and content.startswith("Error")
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self._stats["hits"] += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["failed"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "inflight": self._inflight_locked()}
+
+    def _inflight_locked(self) -> int:
+        return sum(1 for entry in self._entries.values() if not entry.future.done())
+
+    def _discard_locked(self, entry_key: tuple[str, str, str]) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        entry.future.cancel()
+        self._stats["wasted"] += 1
+        logger.debug("Tool prefetch wasted: %s", entry_key[1])
+
+    def _expire_locked(self, now: float) -> None:
+        cutoff = now - PREFETCH_TTL_SECONDS
+        for entry_key in [k for k, e in self._entries.items() if e.started_at < cutoff]:
+            self._discard_locked(entry_key)
+
+
+tool_prefetcher = ToolPrefetcher()
@@ -1,16 +1,35 @@
 """
-Tool registry for the OpenAI Realtime API voice path.
+Unified async tool engine shared by the LangGraph chat path and the Realtime
+voice relay.
 
-Mirrors the LangGraph @tool definitions in chatbot.py but exposes them as plain
-async callables that take an explicit context dict, so they can be invoked from
-the Realtime tool-call event handler without depending on module globals.
+Every tool is defined once as a `ToolSpec`: an async implementation taking
+(args, context), a JSON-schema for its parameters, per-tool concurrency and
+timeout limits, and the descriptions shown to each model. From those specs the
+module derives both the LangChain tools bound in chatbot.py and the
+`REALTIME_TOOLS` schemas sent in the Realtime `session.update`, and every call
+from either path goes through `run_tool`, which enforces the limits and
+records per-tool metrics.
+
+The context dict carries `user_id`, `user_profile`, `tutor_profile` and
+`user_location`. On the chat path it is built from the graph state injected
+into each tool call, so concurrent users never share it.
 """
 from __future__ import annotations
 import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, Awaitable, Callable
+from typing import Annotated, Any, Awaitable, Callable, Literal, Optional
 from zoneinfo import ZoneInfo
 
+from langchain_core.tools import BaseTool, StructuredTool
+from langgraph.prebuilt import InjectedState
+from pydantic import Field, create_model
+
 from news import get_spain_news, format_news_for_chat
 from weather import get_weather, format_weather_for_chat
 from spanish_newspapers import (
@@ -23,139 +42,10 @@ from spotify import get_user_data as spotify_get_user_data, format_spotify_for_c
 from reminders import create_reminder as reminders_create, list_active_reminders
 from activities import search_activities
 
-
-# OpenAI Realtime API tool schemas (function-tool form).
-REALTIME_TOOLS: list[dict] = [
-    {
-        "type": "function",
-        "name": "obtener_noticias",
-        "description": (
-            "Obtiene las noticias mas recientes de Espana desde NewsAPI. "
-            "Usa cuando el usuario pregunte por noticias o actualidad."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "limite": {
-                    "type": "integer",
-                    "description": "Numero de noticias (1-10).",
-                    "default": 5,
-                }
-            },
-        },
-    },
-    {
-        "type": "function",
-        "name": "obtener_clima",
-        "description": (
-            "Obtiene el clima actual. Si no se indica ciudad, usa el GPS del "
-            "usuario y, si no esta disponible, la ciudad del perfil."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "ciudad": {
-                    "type": "string",
-                    "description": "Ciudad de Espana (Madrid, Barcelona...). Vacio = ciudad del perfil.",
-                }
-            },
-        },
-    },
-    {
-        "type": "function",
-        "name": "obtener_noticias_periodicos",
-        "description": (
-            "Noticias directas de periodicos espanoles via RSS. Fuentes: elpais, "
-            "elmundo, larazon, elperiodico, lavanguardia, abc, elespanol, "
-            "elconfidencial, eldiario, mundodeportivo, o 'todos'."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "limite_por_fuente": {"type": "integer", "default": 3},
-                "periodico": {"type": "string", "default": "todos"},
-            },
-        },
-    },
-    {
-        "type": "function",
-        "name": "enviar_alerta_sms",
-        "description": (
-            "Envia alerta SMS al tutor/cuidador. Nombre y GPS se adjuntan "
-            "automaticamente. Usa solo cuando el usuario pida explicitamente "
-            "enviar una alerta o describa una emergencia."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "descripcion": {
-                    "type": "string",
-                    "description": "Resumen breve (1-2 frases) de lo ocurrido.",
-                }
-            },
-        },
-    },
-    {
-        "type": "function",
-        "name": "obtener_musica_spotify",
-        "description": (
-            "Obtiene actividad de Spotify del usuario (top artistas, "
-            "recientemente escuchado, playlists). Requiere cuenta vinculada."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "tipo": {
-                    "type": "string",
-                    "enum": ["all", "top", "recent", "playlists"],
-                    "default": "all",
-                }
-            },
-        },
-    },
-    {
-        "type": "function",
-        "name": "crear_recordatorio",
-        "description": (
-            "Crea un recordatorio. SIEMPRE confirma con el usuario antes de "
-            "llamar. fecha_hora en ISO 8601 con offset Europe/Madrid."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "mensaje": {"type": "string"},
-                "fecha_hora": {
-                    "type": "string",
-                    "description": "ISO 8601, ej '2026-04-29T15:00:00+02:00'.",
-                },
-                "recurrencia": {
-                    "type": "string",
-                    "description": "Expresion cron opcional, ej '0 9 * * *'.",
-                },
-            },
-            "required": ["mensaje", "fecha_hora"],
-        },
-    },
-    {
-        "type": "function",
-        "name": "listar_recordatorios",
-        "description": "Lista recordatorios activos del usuario.",
-        "parameters": {"type": "object", "properties": {}},
-    },
-    {
-        "type": "function",
-        "name": "buscar_actividades",
-        "description": (
-            "Busca actividades y lugares de interes para mayores cerca del usuario."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "radio_km": {"type": "integer", "default": 10},
-            },
-        },
-    },
-]
+DEFAULT_TOOL_TIMEOUT_SECONDS = 20.0
+DEFAULT_TOOL_CONCURRENCY = 8
+# How long a call waits for a free slot before giving up without running.
+TOOL_QUEUE_TIMEOUT_SECONDS = 5.0
 
 
 # ---------- Tool implementations ----------
@@ -300,31 +190,461 @@ async def _tool_buscar_actividades(args: dict, ctx: dict) -> str:
     )
 
 
-TOOL_REGISTRY: dict[str, Callable[[dict, dict], Awaitable[str]]] = {
-    "obtener_noticias": _tool_obtener_noticias,
-    "obtener_clima": _tool_obtener_clima,
-    "obtener_noticias_periodicos": _tool_obtener_noticias_periodicos,
-    "enviar_alerta_sms": _tool_enviar_alerta_sms,
-    "obtener_musica_spotify": _tool_obtener_musica_spotify,
-    "crear_recordatorio": _tool_crear_recordatorio,
-    "listar_recordatorios": _tool_listar_recordatorios,
-    "buscar_actividades": _tool_buscar_actividades,
+# ---------- Tool definitions ----------
+
+@dataclass(frozen=True)
+class ToolSpec:
+    name: str
+    handler: Callable[[dict, dict], Awaitable[str]]
+    # Shown to the text chat model (LangChain tool description).
+    description: str
+    # Shorter wording for the voice model's Realtime session.
+    voice_description: str
+    parameters: dict = field(default_factory=lambda: {"type": "object", "properties": {}})
+    timeout: float = DEFAULT_TOOL_TIMEOUT_SECONDS
+    max_concurrency: int = DEFAULT_TOOL_CONCURRENCY
+    # False for tools with side effects (SMS, reminders): after a timeout the
+    # work may still complete, so the model must not call them again.
+    idempotent: bool = True
+
+
+TOOL_SPECS: list[ToolSpec] = [
+    ToolSpec(
+        name="obtener_noticias",
+        handler=_tool_obtener_noticias,
+        description=(
+            "Obtiene las noticias más recientes de España. Usa esta herramienta cuando el usuario "
+            "pregunte sobre noticias, actualidad, lo que está pasando hoy, o información reciente. "
+            "Devuelve las noticias formateadas listas para presentar al usuario."
+        ),
+        voice_description=(
+            "Obtiene las noticias mas recientes de Espana desde NewsAPI. "
+            "Usa cuando el usuario pregunte por noticias o actualidad."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "limite": {
+                    "type": "integer",
+                    "description": "Número de noticias a obtener (1-10, por defecto 5).",
+                    "default": 5,
+                }
+            },
+        },
+    ),
+    ToolSpec(
+        name="obtener_clima",
+        handler=_tool_obtener_clima,
+        description=(
+            "Obtiene el clima actual de una ciudad en España. Usa esta herramienta cuando el usuario "
+            "pregunte sobre el tiempo, el clima, la temperatura o las condiciones meteorológicas. "
+            "Devuelve la información del clima formateada."
+        ),
+        voice_description=(
+            "Obtiene el clima actual. Si no se indica ciudad, usa el GPS del "
+            "usuario y, si no esta disponible, la ciudad del perfil."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "ciudad": {
+                    "type": "string",
+                    "description": (
+                        "Ciudad de España (Madrid, Barcelona, Valencia, Sevilla...). Si no se "
+                        "especifica, se usa la ubicación GPS del usuario y, si no está "
+                        "disponible, la ciudad del perfil."
+                    ),
+                    "default": "",
+                }
+            },
+        },
+    ),
+    ToolSpec(
+        name="obtener_noticias_periodicos",
+        handler=_tool_obtener_noticias_periodicos,
+        description=(
+            "Obtiene las noticias más recientes directamente de periódicos españoles. "
+            "Fuentes disponibles: El País, El Mundo, La Razón, El Periódico, La Vanguardia, "
+            "ABC, El Español, El Confidencial, eldiario.es, Mundo Deportivo. "
+            "Usa esta herramienta cuando el usuario pida noticias de periódicos españoles. "
+            "Devuelve noticias actualizadas con la fecha de hoy."
+        ),
+        voice_description=(
+            "Noticias directas de periodicos espanoles via RSS. Fuentes: elpais, "
+            "elmundo, larazon, elperiodico, lavanguardia, abc, elespanol, "
+            "elconfidencial, eldiario, mundodeportivo, o 'todos'."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "limite_por_fuente": {
+                    "type": "integer",
+                    "description": "Número de noticias de cada periódico (por defecto 3).",
+                    "default": 3,
+                },
+                "periodico": {
+                    "type": "string",
+                    "description": (
+                        "Qué periódico consultar: 'todos' (defecto), 'elpais', 'elmundo', "
+                        "'larazon', 'elperiodico', 'lavanguardia', 'abc', 'elespanol', "
+                        "'elconfidencial', 'eldiario', 'mundodeportivo'."
+                    ),
+                    "default": "todos",
+                },
+            },
+        },
+    ),
+    ToolSpec(
+        name="enviar_alerta_sms",
+        handler=_tool_enviar_alerta_sms,
+        description=(
+            "Envía una alerta de emergencia por SMS al cuidador o familiar del usuario. "
+            "Usa esta herramienta cuando el usuario pida enviar una alerta o aviso, "
+            "o cuando detectes una situación que requiera notificar a alguien "
+            "(emergencia, caída, dolor, síntoma preocupante, etc.). "
+            "El nombre del usuario y su ubicación GPS se incluyen automáticamente. "
+            "El destinatario es el tutor/cuidador registrado en el perfil."
+        ),
+        voice_description=(
+            "Envia alerta SMS al tutor/cuidador. Nombre y GPS se adjuntan "
+            "automaticamente. Usa solo cuando el usuario pida explicitamente "
+            "enviar una alerta o describa una emergencia."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "descripcion": {
+                    "type": "string",
+                    "description": (
+                        "Resumen breve (1-2 frases) de lo ocurrido, por ejemplo "
+                        "'Me he caído en el baño'. Omitir si el usuario no ha dado contexto."
+                    ),
+                    "default": "",
+                }
+            },
+        },
+        timeout=30.0,
+        max_concurrency=2,
+        idempotent=False,
+    ),
+    ToolSpec(
+        name="obtener_musica_spotify",
+        handler=_tool_obtener_musica_spotify,
+        description=(
+            "Obtiene la música de Spotify que escucha el usuario para conocer sus gustos. "
+            "Usa esta herramienta cuando el usuario pregunte por su música, sus canciones, "
+            "sus artistas favoritos, lo que ha escuchado últimamente, o cuando necesites "
+            "contexto sobre sus gustos musicales para personalizar sugerencias. "
+            "Requiere que el usuario haya vinculado su cuenta de Spotify desde "
+            "\"Cuentas conectadas\"; si no la ha vinculado, la herramienta lo indicará."
+        ),
+        voice_description=(
+            "Obtiene actividad de Spotify del usuario (top artistas, "
+            "recientemente escuchado, playlists). Requiere cuenta vinculada."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "tipo": {
+                    "type": "string",
+                    "description": (
+                        "'all' (artistas top + canciones recientes + playlists), 'top', "
+                        "'recent' o 'playlists'."
+                    ),
+                    "enum": ["all", "top", "recent", "playlists"],
+                    "default": "all",
+                }
+            },
+        },
+    ),
+    ToolSpec(
+        name="crear_recordatorio",
+        handler=_tool_crear_recordatorio,
+        description=(
+            "Crea un recordatorio para el usuario. IMPORTANTE: SIEMPRE pide confirmación "
+            "al usuario antes de llamar a esta herramienta."
+        ),
+        voice_description=(
+            "Crea un recordatorio. SIEMPRE confirma con el usuario antes de "
+            "llamar. fecha_hora en ISO 8601 con offset Europe/Madrid."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "mensaje": {
+                    "type": "string",
+                    "description": "Texto del recordatorio (ej: 'Tomar la pastilla').",
+                },
+                "fecha_hora": {
+                    "type": "string",
+                    "description": "ISO 8601, ej '2026-04-29T15:00:00+02:00'.",
+                },
+                "recurrencia": {
+                    "type": "string",
+                    "description": (
+                        "Expresión cron opcional para recordatorios recurrentes, ej "
+                        "'0 */2 * * *' (cada 2 horas), '0 9 * * *' (cada día a las 9). "
+                        "Vacío para un solo recordatorio."
+                    ),
+                    "default": "",
+                },
+            },
+            "required": ["mensaje", "fecha_hora"],
+        },
+        max_concurrency=4,
+        idempotent=False,
+    ),
+    ToolSpec(
+        name="listar_recordatorios",
+        handler=_tool_listar_recordatorios,
+        description=(
+            "Lista los recordatorios activos del usuario. Usa esta herramienta cuando "
+            "el usuario pregunte qué recordatorios tiene, o quiera ver sus recordatorios."
+        ),
+        voice_description="Lista recordatorios activos del usuario.",
+    ),
+    ToolSpec(
+        name="buscar_actividades",
+        handler=_tool_buscar_actividades,
+        description=(
+            "Busca actividades y lugares de interes para personas mayores cerca "
+            "de la ubicacion del usuario. Usa esta herramienta cuando el usuario "
+            "pregunte por actividades, cosas que hacer, planes, talleres, centros "
+            "de mayores o lugares para visitar en su zona."
+        ),
+        voice_description=(
+            "Busca actividades y lugares de interes para mayores cerca del usuario."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "radio_km": {
+                    "type": "integer",
+                    "description": "Radio de busqueda en kilometros (por defecto 10).",
+                    "default": 10,
+                },
+            },
+        },
+        timeout=45.0,
+        max_concurrency=4,
+    ),
+]
+
+TOOL_SPECS_BY_NAME: dict[str, ToolSpec] = {spec.name: spec for spec in TOOL_SPECS}
+
+
+# ---------- Engine ----------
+
+@dataclass
+class _ToolStats:
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    inflight: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+_stats: dict[str, _ToolStats] = {spec.name: _ToolStats() for spec in TOOL_SPECS}
+_stats_lock = threading.Lock()
+# asyncio semaphores are bound to one event loop and limit the app's loop.
+# run_tool_sync starts a fresh loop per call, so sync callers (ToolNode.invoke,
+# prefetch threads) are limited by a process-wide threading semaphore instead.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _semaphore(spec: ToolSpec) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    if spec.name not in per_loop:
+        per_loop[spec.name] = asyncio.Semaphore(spec.max_concurrency)
+    return per_loop[spec.name]
+
+
+_sync_semaphores: dict[str, threading.BoundedSemaphore] = {
+    spec.name: threading.BoundedSemaphore(spec.max_concurrency) for spec in TOOL_SPECS
 }
 
 
-async def execute_tool(name: str, arguments: Any, context: dict) -> str:
-    """Execute a tool by name with raw arguments (dict or JSON string)."""
-    if name not in TOOL_REGISTRY:
-        return f"Error: herramienta desconocida '{name}'."
+def _parse_arguments(arguments: Any) -> dict:
     if isinstance(arguments, str):
-        import json
         try:
             arguments = json.loads(arguments) if arguments.strip() else {}
         except json.JSONDecodeError:
             arguments = {}
-    if not isinstance(arguments, dict):
-        arguments = {}
+    return arguments if isinstance(arguments, dict) else {}
+
+
+def _timeout_message(spec: ToolSpec) -> str:
+    if spec.idempotent:
+        return f"Error: la herramienta {spec.name} ha tardado demasiado. Inténtalo de nuevo."
+    # A handler running in a worker thread keeps going after the timeout, so
+    # the SMS or reminder may still go through: retrying could duplicate it.
+    return (
+        f"Error: la herramienta {spec.name} ha tardado demasiado y no se sabe si se ha "
+        "completado. No la vuelvas a llamar; dile al usuario que no se ha podido confirmar."
+    )
+
+
+def _busy_message(name: str) -> str:
+    # Nothing ran, so even side-effecting tools are safe to retry.
+    return f"Error: la herramienta {name} está ocupada. Inténtalo de nuevo."
+
+
+async def run_tool(name: str, arguments: Any, context: Optional[dict]) -> str:
+    """Run a tool under its concurrency limit and timeout, recording metrics.
+
+    Never raises: failures come back as a Spanish error string the model can
+    relay to the user.
+    """
+    spec = TOOL_SPECS_BY_NAME.get(name)
+    if spec is None:
+        return f"Error: herramienta desconocida '{name}'."
+    args = _parse_arguments(arguments)
+    stats = _stats[name]
+    with _stats_lock:
+        stats.calls += 1
+        stats.inflight += 1
+    started = time.perf_counter()
+    semaphore = _semaphore(spec)
     try:
-        return await TOOL_REGISTRY[name](arguments, context or {})
-    except Exception as e:
-        return f"Error ejecutando {name}: {str(e)}"
+        # The wait for a slot is not part of the tool's timeout: a call that
+        # never started must not be reported as possibly completed.
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=min(spec.timeout, TOOL_QUEUE_TIMEOUT_SECONDS))
+        except asyncio.TimeoutError:
+            with _stats_lock:
+                stats.timeouts += 1
+            return _busy_message(name)
+        try:
+            return await asyncio.wait_for(spec.handler(args, context or {}), timeout=spec.timeout)
+        except asyncio.TimeoutError:
+            with _stats_lock:
+                stats.timeouts += 1
+            return _timeout_message(spec)
+        except Exception as e:
+            with _stats_lock:
+                stats.errors += 1
+            return f"Error ejecutando {name}: {str(e)}"
+        finally:
+            semaphore.release()
+    finally:
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            stats.inflight -= 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+
+
+async def execute_tool(name: str, arguments: Any, context: dict) -> str:
+    """Execute a tool by name with raw arguments (dict or JSON string)."""
+    return await run_tool(name, arguments, context)
+
+
+def run_tool_sync(name: str, arguments: Any, context: Optional[dict]) -> str:
+    """Blocking wrapper around `run_tool` — safe to call from inside an
+    already-running event loop (runs the coroutine on a helper thread then).
+
+    Every call gets its own event loop, so the tool's concurrency limit is
+    held on a threading semaphore shared by all sync callers.
+    """
+    spec = TOOL_SPECS_BY_NAME.get(name)
+    if spec is None:
+        return f"Error: herramienta desconocida '{name}'."
+    semaphore = _sync_semaphores[name]
+    if not semaphore.acquire(timeout=spec.timeout):
+        with _stats_lock:
+            _stats[name].timeouts += 1
+        return _busy_message(name)
+    try:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(run_tool(name, arguments, context))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, run_tool(name, arguments, context)).result()
+    finally:
+        semaphore.release()
+
+
+def tool_metrics() -> dict:
+    """Per-tool call counts and latencies since process start."""
+    with _stats_lock:
+        return {
+            name: {
+                "calls": s.calls,
+                "errors": s.errors,
+                "timeouts": s.timeouts,
+                "inflight": s.inflight,
+                "avg_ms": round(1000 * s.total_seconds / s.calls, 1) if s.calls else 0.0,
+                "max_ms": round(1000 * s.max_seconds, 1),
+            }
+            for name, s in _stats.items()
+        }
+
+
+# ---------- Schema generation ----------
+
+def context_from_state(state: dict) -> dict:
+    """Tool context for the LangGraph path, derived from the graph state."""
+    profile = state.get("user_profile") or {}
+    return {
+        "user_id": profile.get("id", "") or "",
+        "user_profile": profile,
+        "tutor_profile": state.get("tutor_profile") or {},
+        "user_location": state.get("user_location") or {},
+    }
+
+
+_JSON_TYPES = {"integer": int, "number": float, "string": str, "boolean": bool}
+
+
+def _args_model(spec: ToolSpec):
+    """Pydantic args schema for the LangChain tool, plus the injected graph state."""
+    properties = spec.parameters.get("properties", {})
+    required = set(spec.parameters.get("required", []))
+    fields: dict[str, Any] = {}
+    for prop, schema in properties.items():
+        annotation: Any = _JSON_TYPES.get(schema.get("type"), Any)
+        if schema.get("enum"):
+            annotation = Literal[tuple(schema["enum"])]
+        default = ... if prop in required else schema.get("default")
+        fields[prop] = (annotation, Field(default=default, description=schema.get("description")))
+    fields["state"] = (Annotated[dict, InjectedState], ...)
+    return create_model(spec.name, **fields)
+
+
+def _langchain_tool(spec: ToolSpec) -> BaseTool:
+    async def _arun(state: dict, **kwargs) -> str:
+        return await run_tool(spec.name, kwargs, context_from_state(state))
+
+    def _run(state: dict, **kwargs) -> str:
+        return run_tool_sync(spec.name, kwargs, context_from_state(state))
+
+    return StructuredTool.from_function(
+        func=_run,
+        coroutine=_arun,
+        name=spec.name,
+        description=spec.description,
+        args_schema=_args_model(spec),
+    )
+
+
+def build_langchain_tools() -> list[BaseTool]:
+    """LangChain tools for the chat graph; they read their context from the graph state."""
+    return [_langchain_tool(spec) for spec in TOOL_SPECS]
+
+
+def _realtime_schema(spec: ToolSpec) -> dict:
+    return {
+        "type": "function",
+        "name": spec.name,
+        "description": spec.voice_description,
+        "parameters": spec.parameters,
+    }
+
+
+# OpenAI Realtime API tool schemas (function-tool form).
+REALTIME_TOOLS: list[dict] = [_realtime_schema(spec) for spec in TOOL_SPECS]
@@ -0,0 +1,263 @@
+"""Content-addressed cache of synthesized speech.
+
+Many TTS outputs repeat word for word: greetings, "Recordatorio creado", the
+same reminder read aloud every day. voice.text_to_speech looks clips up here
+by `tts_key` (SHA-256 of the normalized text, voice, speed, format and model)
+before calling the API. Full chatbot answers are personalized and rarely
+repeat, so only short texts (up to TTS_CACHE_MAX_CHARS, default 200) are
+stored straight away; a longer text is stored the second time it is
+synthesized.
+
+Two tiers, both LRU and bounded by bytes:
+
+- memory: TTS_CACHE_MEMORY_BYTES (default 16 MiB) of recent clips;
+- disk, opt-in: TTS_CACHE_DIR (default empty, disabled) holding up to
+  TTS_CACHE_DISK_BYTES (default 256 MiB), one `<key>.opus` file per clip.
+  A hit bumps the file's mtime, so the cache survives restarts in LRU order.
+
+Disk reads and writes run in a worker thread (`asyncio.to_thread`), never on
+the event loop. Several workers may share the directory: none keeps an index
+of it, a clip another worker removed is just a miss, and the byte budget is
+enforced by rescanning the directory (every TTS_CACHE_SWEEP_SECONDS, default
+60, or sooner once this worker's estimate goes over budget) and deleting the
+least recently used files whoever wrote them.
+
+Disk hits are promoted to memory. Writes go to a temp file and are renamed
+into place, so a crash never leaves a truncated clip behind. `stats()` (hit
+ratio included) backs GET /metrics; its disk figures are those of the last
+rescan plus this worker's writes since.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+TTS_CACHE_MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", "200"))
+TTS_CACHE_SWEEP_SECONDS = float(os.getenv("TTS_CACHE_SWEEP_SECONDS", "60"))
+
+SUFFIX = ".opus"
+# Long texts synthesized once, remembered so a repeat can be cached.
+SEEN_KEYS = 4096
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFC, trimmed, with runs of whitespace collapsed: what the TTS hears."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def tts_key(text: str, voice: str, speed: float, audio_format: str, model: str = "") -> str:
+    material = "\x1f".join((normalize_text(text), voice, repr(float(speed)), audio_format, model))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(
+        self,
+        memory_bytes: Optional[int] = None,
+        directory: Optional[str] = None,
+        disk_bytes: Optional[int] = None,
+        max_chars: Optional[int] = None,
+    ) -> None:
+        self.memory_bytes = TTS_CACHE_MEMORY_BYTES if memory_bytes is None else memory_bytes
+        self.directory = TTS_CACHE_DIR if directory is None else directory
+        self.disk_bytes = TTS_CACHE_DISK_BYTES if disk_bytes is None else disk_bytes
+        self.max_chars = TTS_CACHE_MAX_CHARS if max_chars is None else max_chars
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_used = 0
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        # Directory usage as of the last sweep, plus this worker's writes since.
+        self._disk_entries = 0
+        self._disk_used = 0
+        self._swept_at: Optional[float] = None
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stored": 0,
+            "skipped": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0,
+        }
+
+    # -- lookup -------------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return audio
+        audio = await asyncio.to_thread(self._read_disk, key) if self._disk_enabled() else None
+        with self._lock:
+            if audio is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, audio)
+            return audio
+
+    async def put(self, key: str, audio: bytes, text: str) -> None:
+        """Store the clip synthesized for `text`, if it is short or a repeat."""
+        if not audio or not self._admit(key, text):
+            return
+        with self._lock:
+            self._stats["stored"] += 1
+            self._remember(key, audio)
+        if self._disk_enabled() and len(audio) <= self.disk_bytes:
+            await asyncio.to_thread(self._write_disk, key, audio)
+
+    def _admit(self, key: str, text: str) -> bool:
+        if len(normalize_text(text)) <= self.max_chars:
+            return True
+        with self._lock:
+            if key in self._seen:
+                del self._seen[key]
+                return True
+            self._seen[key] = None
+            if len(self._seen) > SEEN_KEYS:
+                self._seen.popitem(last=False)
+            self._stats["skipped"] += 1
+            return False
+
+    # -- memory tier --------------------------------------------------------
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous)
+        self._memory[key] = audio
+        self._memory_used += len(audio)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+            self._stats["memory_evictions"] += 1
+
+    # -- disk tier (worker thread) ------------------------------------------
+
+    def _disk_enabled(self) -> bool:
+        return bool(self.directory) and self.disk_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += n
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            self._count("disk_errors")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # evicted by another worker meanwhile; the clip read is still good
+        return audio or None
+
+    def _write_disk(self, key: str, audio: bytes) -> None:
+        tmp = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            self._count("disk_errors")
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self._disk_entries += 1
+            self._disk_used += len(audio)
+            due = (
+                self._swept_at is None
+                or self._disk_used > self.disk_bytes
+                or time.monotonic() - self._swept_at > TTS_CACHE_SWEEP_SECONDS
+            )
+        if due:
+            self._sweep()
+
+    def _sweep(self) -> None:
+        """Rescan the shared directory and delete its oldest clips beyond the budget."""
+        if not self._sweep_lock.acquire(blocking=False):
+            return  # another thread of this worker is already sweeping
+        try:
+            entries = []
+            try:
+                with os.scandir(self.directory) as scan:
+                    for entry in scan:
+                        if entry.name.endswith(SUFFIX) and entry.is_file():
+                            try:
+                                stat = entry.stat()
+                            except FileNotFoundError:
+                                continue
+                            entries.append((stat.st_mtime, entry.path, stat.st_size))
+            except OSError:
+                self._count("disk_errors")
+                return
+            used = sum(size for _, _, size in entries)
+            kept = len(entries)
+            evicted = errors = 0
+            for _, path, size in sorted(entries):
+                if used <= self.disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass  # another worker evicted it first
+                except OSError:
+                    errors += 1
+                    continue
+                used -= size
+                kept -= 1
+            with self._lock:
+                self._stats["disk_evictions"] += evicted
+                self._stats["disk_errors"] += errors
+                self._disk_entries = kept
+                self._disk_used = used
+                self._swept_at = time.monotonic()
+        finally:
+            self._sweep_lock.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hits = lookups - self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": round(hits / lookups, 3) if lookups else None,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_entries": self._disk_entries,
+                "disk_bytes": self._disk_used,
+            }
+
+
+tts_cache = TTSCache()
@@ -1,14 +1,29 @@
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+import asyncio
 import os
+import re
 from io import BytesIO
-from chatbot import chatbot_async
+from typing import AsyncIterator, List, Optional
+from chatbot import chatbot_async, chatbot_stream
+from llm_metrics import track_llm_call
+from tts_cache import tts_cache, tts_key
 
 load_dotenv()
 
 # Initialize async OpenAI client (non-blocking for FastAPI)
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Opus is smaller and starts playing sooner than MP3.
+TTS_MODEL = "tts-1"
+TTS_FORMAT = "opus"
+TTS_SPEED = 0.9
+
+# TTS calls in flight per pipelined voice answer (see speak_stream).
+VOICE_TTS_CONCURRENCY = int(os.getenv("VOICE_TTS_CONCURRENCY", "3"))
+# Shorter sentences are spoken together with the next one.
+VOICE_MIN_SENTENCE_CHARS = int(os.getenv("VOICE_MIN_SENTENCE_CHARS", "20"))
+
 
 async def transcribe_audio(audio_file: bytes) -> str:
     """
@@ -18,11 +33,12 @@ async def transcribe_audio(audio_file: bytes) -> str:
         audio_buffer = BytesIO(audio_file)
         audio_buffer.name = "audio.webm"
 
-        transcript = await client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_buffer,
-            language="es"
-        )
+        with track_llm_call("voice.stt", "whisper-1"):
+            transcript = await client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_buffer,
+                language="es"
+            )
 
         return transcript.text
     except Exception as e:
@@ -32,27 +48,67 @@ async def transcribe_audio(audio_file: bytes) -> str:
 async def text_to_speech(text: str, voice: str = "nova") -> bytes:
     """
     Convert text to speech using OpenAI TTS API (async).
-    Uses opus format for lower latency than MP3.
+    Uses opus format for lower latency than MP3. Short and repeated
+    utterances are served from tts_cache without calling the API.
     """
+    key = tts_key(text, voice, TTS_SPEED, TTS_FORMAT, TTS_MODEL)
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        response = await client.audio.speech.create(
-            model="tts-1",
-            voice=voice,
-            input=text,
-            response_format="opus",
-            speed=0.9
-        )
+        with track_llm_call("voice.tts", TTS_MODEL):
+            response = await client.audio.speech.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=TTS_FORMAT,
+                speed=TTS_SPEED
+            )
 
+        await tts_cache.put(key, response.content, text)
         return response.content
     except Exception as e:
         raise Exception(f"Error generating speech: {str(e)}")
 
 
+async def text_to_speech_stream(text: str, voice: str = "nova") -> AsyncIterator[bytes]:
+    """
+    Same speech as text_to_speech, yielded as opus chunks as they arrive from
+    the TTS API, so playback can start before the whole clip is generated.
+    Recorded as "voice.tts_stream"; its TTFT is the time to the first chunk.
+    Cached clips come back as a single chunk; a streamed clip is cached once
+    it has been received in full.
+    """
+    key = tts_key(text, voice, TTS_SPEED, TTS_FORMAT, TTS_MODEL)
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    chunks = []
+    try:
+        with track_llm_call("voice.tts_stream", TTS_MODEL) as call:
+            async with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=TTS_FORMAT,
+                speed=TTS_SPEED
+            ) as response:
+                async for chunk in response.iter_bytes():
+                    call.mark_first_token()
+                    chunks.append(chunk)
+                    yield chunk
+    except Exception as e:
+        raise Exception(f"Error generating speech: {str(e)}")
+    await tts_cache.put(key, b"".join(chunks), text)
+
+
 async def process_voice_message(
     audio_file: bytes,
     voice: str = "nova",
     history: list = None,
-    user_profile: dict = None
+    user_profile: dict = None,
+    conversation_id: str = None,
 ) -> tuple:
     """
     Process voice message through the complete pipeline (async):
@@ -67,10 +123,125 @@ async def process_voice_message(
     chatbot_response = await chatbot_async(
         transcribed_text,
         history=history,
-        user_profile=user_profile
+        user_profile=user_profile,
+        conversation_id=conversation_id,
     )
 
     # Step 3: Convert response to speech
     response_audio = await text_to_speech(chatbot_response, voice=voice)
 
     return response_audio, transcribed_text, chatbot_response
+
+
+# End of a sentence: . ! ? … (plus closing quotes/brackets) before whitespace,
+# or a line break.
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'»”)\]]*\s+|\n+")
+_ABBREVIATION = re.compile(
+    r"\b(sr|sra|srta|dr|dra|d|dña|ud|uds|etc|ej|núm|avda|pág|tel|aprox)\.$", re.IGNORECASE
+)
+
+
+class SentenceSplitter:
+    """Cuts streamed text into sentences as soon as each one is complete."""
+
+    def __init__(self, min_chars: Optional[int] = None) -> None:
+        self.min_chars = VOICE_MIN_SENTENCE_CHARS if min_chars is None else min_chars
+        self._buffer = ""
+        self._start = 0
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        for match in _SENTENCE_END.finditer(self._buffer, self._start):
+            candidate = self._buffer[self._start:match.start()].rstrip() + match.group().strip()
+            if len(candidate) < self.min_chars or _ABBREVIATION.search(
+                self._buffer[:match.start() + 1].rstrip()
+            ):
+                continue
+            sentences.append(candidate.strip())
+            self._start = match.end()
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        tail = self._buffer[self._start:].strip()
+        self._buffer, self._start = "", 0
+        return tail or None
+
+
+async def speak_stream(
+    text_stream: AsyncIterator[str], voice: str = "nova", concurrency: Optional[int] = None
+) -> AsyncIterator[tuple]:
+    """
+    Yield (sentence, audio) for a streamed answer, in order. Each sentence goes
+    to TTS as soon as it is complete, with at most `concurrency` TTS calls in
+    flight, so the first sentence plays while the rest is still generated.
+    """
+    limit = asyncio.Semaphore(concurrency or VOICE_TTS_CONCURRENCY)
+    ready: asyncio.Queue = asyncio.Queue()
+    started: List[asyncio.Task] = []
+
+    async def synthesize(sentence: str) -> tuple:
+        async with limit:
+            return sentence, await text_to_speech(sentence, voice=voice)
+
+    def start(sentence: str) -> None:
+        task = asyncio.create_task(synthesize(sentence))
+        started.append(task)
+        ready.put_nowait(task)
+
+    async def split() -> None:
+        splitter = SentenceSplitter()
+        try:
+            async for text in text_stream:
+                for sentence in splitter.feed(text):
+                    start(sentence)
+            tail = splitter.flush()
+            if tail:
+                start(tail)
+        finally:
+            ready.put_nowait(None)
+
+    splitting = asyncio.create_task(split())
+    try:
+        while (task := await ready.get()) is not None:
+            yield await task
+        await splitting  # re-raises a failed chat stream
+    finally:
+        for task in (splitting, *started):
+            task.cancel()
+        await asyncio.gather(splitting, *started, return_exceptions=True)
+
+
+async def process_voice_message_stream(
+    audio_file: bytes,
+    voice: str = "nova",
+    history: list = None,
+    user_profile: dict = None,
+    conversation_id: str = None,
+) -> AsyncIterator[dict]:
+    """
+    Pipelined variant of process_voice_message: transcribes, then streams the
+    chatbot answer through speak_stream. Yields {"type": "transcript"}, one
+    {"type": "audio"} per sentence in order, then {"type": "done"} with the
+    full answer.
+    """
+    transcribed_text = await transcribe_audio(audio_file)
+    yield {"type": "transcript", "text": transcribed_text}
+
+    answer: List[str] = []
+
+    async def tokens() -> AsyncIterator[str]:
+        async for token in chatbot_stream(
+            transcribed_text,
+            history=history,
+            user_profile=user_profile,
+            conversation_id=conversation_id,
+        ):
+            answer.append(token)
+            yield token
+
+    index = 0
+    async for sentence, audio in speak_stream(tokens(), voice=voice):
+        yield {"type": "audio", "index": index, "text": sentence, "audio": audio}
+        index += 1
+    yield {"type": "done", "response": "".join(answer)}